@@ -0,0 +1,424 @@
+"""
+價格警示規則引擎。
+
+規則存在 SQLite (伺服器重啟後仍在)，每次背景輪詢發布新快照時檢查一次，
+與開著幾個 session 無關。支援：
+- price      價格向上 / 向下穿越某個價位
+- cost_move  相對持股成本漲跌超過某個百分比 (建立時換算成價位)
+- drawdown   從觀察期間最高價回落超過某個百分比
+- pnl        投資組合未實現損益高於 / 低於某個金額
+
+每個觀察值 (標的價格、標的回撤、投資組合損益) 各有一本依門檻排序的規則簿，
+新數值進來用二分搜尋切出已越過門檻的那一段，檢查成本與「觸發的規則數」成正比，
+與規則總數無關。規則觸發後移到「已觸發」簿，數值回到門檻另一側 (含一點緩衝)
+才重新武裝，所以同一次穿越只會通知一次。通知者可插拔，預設寫入本地日誌檔。
+
+儀表板與 headless 服務是不同行程，各自的輪詢器都會檢查同一份規則：觸發時在資料庫交易內
+以 armed=1 為條件把旗標改成 0，只有真的改到那一列的行程記錄事件並通知。
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+
+import numpy as np
+
+import fx
+import ledger as ledger_mod
+import poller as poller_mod
+from bar_store import DATA_DIR
+
+KINDS = {"price": "價格", "cost_move": "相對成本", "drawdown": "高點回落", "pnl": "組合損益"}
+REARM_GAP = 0.01  # 價格 / 損益要退回門檻 1% 以內的另一側才重新武裝
+DRAWDOWN_REARM = 0.5  # 回撤規則在回撤縮小到門檻一半時重新武裝
+
+log = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rules (
+    id         INTEGER PRIMARY KEY,
+    pid        TEXT NOT NULL,
+    kind       TEXT NOT NULL,          -- price / cost_move / drawdown / pnl
+    ticker     TEXT,                   -- pnl 規則為 NULL
+    direction  TEXT NOT NULL,          -- above / below
+    level      REAL NOT NULL,          -- 觸發門檻：價位 / 回撤比例 / 損益金額
+    param      REAL,                   -- 使用者輸入的原始值 (百分比等)
+    note       TEXT,
+    armed      INTEGER NOT NULL DEFAULT 1,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rules_pid ON rules (pid);
+CREATE TABLE IF NOT EXISTS peaks (
+    ticker TEXT PRIMARY KEY,
+    peak   REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    id       INTEGER PRIMARY KEY,
+    rule_id  INTEGER NOT NULL,
+    pid      TEXT NOT NULL,
+    fired_at REAL NOT NULL,
+    value    REAL,
+    message  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_pid ON events (pid, id);
+"""
+
+_RULE_COLUMNS = ("id", "pid", "kind", "ticker", "direction", "level", "param", "note", "armed", "created_at")
+
+
+def watch_key(rule):
+    """規則觀察的數值：標的價格、標的回撤或投資組合損益。"""
+    if rule["kind"] == "pnl":
+        return f"@{rule['pid']}"
+    if rule["kind"] == "drawdown":
+        return f"{rule['ticker']}#dd"
+    return rule["ticker"]
+
+
+def rearm_level(rule):
+    level = rule["level"]
+    if rule["kind"] == "drawdown":
+        return level * DRAWDOWN_REARM
+    gap = abs(level) * REARM_GAP
+    return level - gap if rule["direction"] == "above" else level + gap
+
+
+def describe(rule, value=None):
+    name = rule["ticker"] or f"投資組合 {rule['pid']}"
+    if rule["kind"] == "drawdown":
+        text = f"{name} 從高點回落 {rule['param']:.4g}%"
+        return text if value is None else f"{text} (目前回落 {value * 100:.1f}%)"
+    if rule["kind"] == "cost_move":
+        text = f"{name} 相對成本{'上漲' if rule['param'] >= 0 else '下跌'} {abs(rule['param']):.4g}% (價位 {rule['level']:,.2f})"
+    else:
+        arrow = "高於" if rule["direction"] == "above" else "低於"
+        what = "未實現損益" if rule["kind"] == "pnl" else "價格"
+        text = f"{name} {what}{arrow} {rule['level']:,.2f}"
+    return text if value is None else f"{text}，目前 {value:,.2f}"
+
+
+class _Book:
+    """單一觀察值的規則簿：四個依門檻排序的 (門檻, 規則 id) 串列。"""
+
+    __slots__ = ("above", "below", "fired_above", "fired_below")
+
+    def __init__(self):
+        self.above, self.below = [], []  # 武裝中，依 level 排序
+        self.fired_above, self.fired_below = [], []  # 已觸發，依重新武裝門檻排序
+
+
+class LogSink:
+    """把觸發事件以 JSON 一行一筆附加到本地檔案 (測試與稽核用)。"""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(DATA_DIR, "alerts.log")
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+
+class AlertEngine:
+    def __init__(self, path=None, notifiers=None):
+        self.path = path or os.path.join(DATA_DIR, "alerts.sqlite")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.notifiers = list(notifiers) if notifiers is not None else [LogSink()]
+        self._lock = threading.RLock()
+        with self._connect() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript(_SCHEMA)
+            rows = con.execute(f"SELECT {', '.join(_RULE_COLUMNS)} FROM rules").fetchall()
+            self._peaks = dict(con.execute("SELECT ticker, peak FROM peaks").fetchall())
+        self._rules = {}
+        self._books = {}
+        for row in rows:
+            self._index(dict(zip(_RULE_COLUMNS, row)))
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    @contextmanager
+    def _transaction(self):
+        """取得資料庫寫入鎖 (BEGIN IMMEDIATE) 的連線；離開時提交，例外則回復，最後關閉連線。"""
+        con = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                yield con
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+            con.execute("COMMIT")
+        finally:
+            con.close()
+
+    # --- 索引 ---
+    def _index(self, rule):
+        self._rules[rule["id"]] = rule
+        book = self._books.setdefault(watch_key(rule), _Book())
+        side = rule["direction"]
+        if rule["armed"]:
+            lst, key = (book.above if side == "above" else book.below), rule["level"]
+        else:
+            lst, key = (book.fired_above if side == "above" else book.fired_below), rearm_level(rule)
+        lst.insert(bisect_left(lst, (key, rule["id"])), (key, rule["id"]))
+
+    def _unindex(self, rule):
+        book = self._books.get(watch_key(rule))
+        if book is None:
+            return
+        for lst in (book.above, book.below, book.fired_above, book.fired_below):
+            for i, (_, rid) in enumerate(lst):
+                if rid == rule["id"]:
+                    del lst[i]
+                    return
+
+    # --- 規則管理 ---
+    def add_rule(self, pid, kind, value, ticker=None, direction=None, note="", current=None, cost=None):
+        """新增規則並回傳 id。
+
+        price: value 為價位，direction 為 above / below；cost_move: value 為相對成本的 %
+        (正數向上、負數向下)，需提供 cost；drawdown: value 為回落 %；pnl: value 為損益金額。
+        current 為目前的觀察值：若已在門檻另一側，規則先以「已觸發」狀態建立，等下一次穿越才通知。
+        """
+        if kind not in KINDS:
+            raise ValueError(f"unknown alert kind {kind!r}")
+        if kind != "pnl" and not ticker:
+            raise ValueError(f"{kind} alerts need a ticker")
+        param = float(value)
+        if kind == "cost_move":
+            if not cost:
+                raise ValueError("cost_move alerts need the position cost")
+            level = cost * (1 + param / 100)
+            direction = "above" if param >= 0 else "below"
+        elif kind == "drawdown":
+            if param <= 0:
+                raise ValueError("drawdown must be a positive percentage")
+            level, direction = param / 100, "above"
+        else:
+            level = param
+            if direction not in ("above", "below"):
+                raise ValueError("direction must be 'above' or 'below'")
+        rule = {
+            "pid": pid, "kind": kind, "ticker": None if kind == "pnl" else ticker, "direction": direction,
+            "level": level, "param": param, "note": note, "armed": 1, "created_at": time.time(),
+        }
+        if current is not None:
+            crossed = current >= level if direction == "above" else current <= level
+            rule["armed"] = 0 if crossed else 1
+        with self._lock, self._connect() as con:
+            rule["id"] = con.execute(
+                "INSERT INTO rules (pid, kind, ticker, direction, level, param, note, armed, created_at) "
+                "VALUES (?,?,?,?,?,?,?,?,?)",
+                tuple(rule[c] for c in _RULE_COLUMNS[1:]),
+            ).lastrowid
+            self._index(rule)
+        return rule["id"]
+
+    def remove_rule(self, rule_id):
+        with self._lock, self._connect() as con:
+            rule = self._rules.pop(rule_id, None)
+            if rule is not None:
+                self._unindex(rule)
+            con.execute("DELETE FROM rules WHERE id=?", (rule_id,))
+
+    def rules(self, pid=None):
+        with self._lock:
+            return [dict(r) for r in self._rules.values() if pid is None or r["pid"] == pid]
+
+    def tickers(self):
+        """有規則的標的 (交給輪詢器固定刷新)。"""
+        with self._lock:
+            return list(dict.fromkeys(r["ticker"] for r in self._rules.values() if r["ticker"]))
+
+    def portfolios(self):
+        with self._lock:
+            return list(dict.fromkeys(r["pid"] for r in self._rules.values() if r["kind"] == "pnl"))
+
+    def has_drawdown(self, ticker):
+        return f"{ticker}#dd" in self._books
+
+    # --- 檢查 ---
+    def drawdowns(self, prices):
+        """更新有回撤規則的標的之最高價，回傳 {"<ticker>#dd": 目前回撤比例}。"""
+        out, changed = {}, {}
+        with self._lock:
+            for t, p in prices.items():
+                if not self.has_drawdown(t) or not p > 0:
+                    continue
+                peak = self._peaks.get(t)
+                if peak is None or p > peak:
+                    peak = self._peaks[t] = changed[t] = p
+                out[f"{t}#dd"] = 1.0 - p / peak
+            if changed:
+                with self._connect() as con:
+                    con.executemany("INSERT OR REPLACE INTO peaks (ticker, peak) VALUES (?,?)", changed.items())
+        return out
+
+    def evaluate(self, values):
+        """values: {觀察值 key: 最新數值}；回傳本次觸發的事件。"""
+        fired, rearmed, events = [], [], []
+        with self._lock:
+            for key, v in values.items():
+                book = self._books.get(key)
+                if book is None or v is None or v != v:
+                    continue
+                # 先重新武裝退回門檻另一側的規則
+                i = bisect_right(book.fired_above, (v, float("inf")))
+                back, book.fired_above[i:] = book.fired_above[i:], []
+                j = bisect_left(book.fired_below, (v, float("-inf")))
+                back2, book.fired_below[:j] = book.fired_below[:j], []
+                for _, rid in back + back2:
+                    rule = self._rules[rid]
+                    rule["armed"] = 1
+                    self._index(rule)
+                    rearmed.append(rid)
+                # 再切出越過門檻的規則
+                i = bisect_right(book.above, (v, float("inf")))
+                hit, book.above[:i] = book.above[:i], []
+                j = bisect_left(book.below, (v, float("-inf")))
+                hit2, book.below[j:] = book.below[j:], []
+                for _, rid in hit + hit2:
+                    rule = self._rules[rid]
+                    rule["armed"] = 0
+                    self._index(rule)
+                    fired.append(rid)
+                    events.append({
+                        "rule_id": rid, "pid": rule["pid"], "kind": rule["kind"], "ticker": rule["ticker"],
+                        "value": float(v), "fired_at": time.time(), "message": describe(rule, v),
+                    })
+            if fired or rearmed:
+                events, gone = self._claim(events, rearmed)
+                for rid in gone:
+                    # 其他行程已刪除的規則
+                    self._unindex(self._rules.pop(rid))
+        for ev in events:
+            for notify in self.notifiers:
+                try:
+                    notify(ev)
+                except Exception:
+                    log.exception("alert notifier failed")
+        return events
+
+    def _claim(self, events, rearmed):
+        """把觸發 / 重新武裝寫回資料庫；回傳 (本行程搶到、要通知的事件, 已不存在的規則 id)。
+
+        觸發以 armed=1 為條件更新：同一次穿越被多個行程看到時只有一個行程改得到那一列。
+        """
+        won, gone = [], []
+        with self._transaction() as con:
+            con.executemany("UPDATE rules SET armed=1 WHERE id=?", [(r,) for r in rearmed])
+            for ev in events:
+                if con.execute("UPDATE rules SET armed=0 WHERE id=? AND armed=1", (ev["rule_id"],)).rowcount:
+                    ev["id"] = con.execute(
+                        "INSERT INTO events (rule_id, pid, fired_at, value, message) VALUES (?,?,?,?,?)",
+                        (ev["rule_id"], ev["pid"], ev["fired_at"], ev["value"], ev["message"]),
+                    ).lastrowid
+                    won.append(ev)
+                elif con.execute("SELECT 1 FROM rules WHERE id=?", (ev["rule_id"],)).fetchone() is None:
+                    gone.append(ev["rule_id"])
+        return won, gone
+
+    def check_prices(self, prices):
+        """prices: {ticker: 最新價}；同時檢查價格與回撤規則。"""
+        values = dict(prices)
+        values.update(self.drawdowns(prices))
+        return self.evaluate(values)
+
+    def check_pnl(self, pnl):
+        """pnl: {portfolio id: 未實現損益}。"""
+        return self.evaluate({f"@{pid}": v for pid, v in pnl.items()})
+
+    def events(self, pid, after_id=0, limit=50):
+        with self._connect() as con:
+            rows = con.execute(
+                "SELECT id, rule_id, fired_at, value, message FROM events WHERE pid=? AND id>? "
+                "ORDER BY id DESC LIMIT ?", (pid, after_id, limit),
+            ).fetchall()
+        return [dict(zip(("id", "rule_id", "fired_at", "value", "message"), r)) for r in rows]
+
+
+# --- 接上背景輪詢 ---
+def last_prices(frames):
+    out = {}
+    for t, df in frames.items():
+        close = df["Close"].to_numpy(dtype=float) if "Close" in df else np.empty(0)
+        close = close[~np.isnan(close)]
+        if len(close):
+            out[t] = float(close[-1])
+    return out
+
+
+def _usd_per(snapshot, currency):
+    """1 單位 currency 值多少 USD；優先用快照裡的匯率，否則用參考值。"""
+    if currency == "USD":
+        return 1.0
+    sym = fx.usd_symbol(currency)
+    major, units = fx.SUBUNITS.get(currency, (currency, 1))
+    rate = last_prices({sym: snapshot.frames[sym]}).get(sym) if sym in snapshot.frames \
+        else fx.FALLBACK_PER_USD.get(major)
+    return 1.0 / (rate * units) if rate else 1.0
+
+
+def portfolio_pnl(snapshot, pids, ledger=None):
+    """以快照最新價算各投資組合的未實現損益 (USD)。"""
+    ledger = ledger or ledger_mod.get_ledger()
+    prices = last_prices(snapshot.frames)
+    out = {}
+    for pid in pids:
+        total, complete = 0.0, True
+        for p in ledger.positions(pid):
+            price = prices.get(p["ticker"])
+            if price is None:
+                complete = False
+                break
+            total += p["shares"] * (price - p["cost"]) * _usd_per(snapshot, fx.currency_of(p["ticker"]))
+        if complete:
+            out[pid] = total
+    return out
+
+
+def _sources(engine, ledger=None):
+    ledger = ledger or ledger_mod.get_ledger()
+    tickers = dict.fromkeys(engine.tickers())
+    for pid in engine.portfolios():
+        for t in ledger.positions_map(pid):
+            tickers[t] = None
+            cur = fx.currency_of(t)
+            if cur != "USD":
+                tickers[fx.usd_symbol(cur)] = None
+    return list(tickers)
+
+
+def _on_snapshot(snapshot, frames):
+    engine = get_engine()
+    engine.check_prices(last_prices(frames))
+    pids = engine.portfolios()
+    if pids:
+        engine.check_pnl(portfolio_pnl(snapshot, pids))
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AlertEngine()
+        return _engine
+
+
+def enable(period="5d", interval="15m"):
+    """讓背景輪詢器刷新有規則的標的，並在每次發布快照後檢查規則。"""
+    engine = get_engine()
+    p = poller_mod.get_poller(period, interval)
+    p.add_source("alerts", lambda: _sources(engine))
+    p.add_listener("alerts", _on_snapshot)
+    return engine
@@ -1,20 +1,35 @@
 import streamlit as st
-import yfinance as yf
 import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
+
+import eod
+import profiling
+import warm_start
+from downsample import downsample_series, window, zoom_slider
+from holdings_view import paged_table
+from ledger import DEFAULT_PORTFOLIO, get_ledger
+from portfolio_io import panel as bulk_panel
+from poller import latest_bars
+from resilience import stale_note
+from valuation import value_portfolio
 
 # --- 1. 網頁配置 ---
 st.set_page_config(page_title="專業級投資監測 App", layout="wide")
 st.title("📊 投資組合即時追蹤系統")
-
-# --- 2. 初始數據與 Session State ---
-if 'portfolio' not in st.session_state:
-    st.session_state.portfolio = [
-        {"ticker": "IONQ", "shares": 30.0, "cost": 45.498},
-        {"ticker": "EOSE", "shares": 100.0, "cost": 11.747},
-        {"ticker": "ONDS", "shares": 110.0, "cost": 10.043}
-    ]
+# 每次重跑的分段耗時寫入 .gupiao/metrics.jsonl；網址加 ?debug=1 顯示面板、?profile=1 剖析
+profiling.begin("app", profile=profiling.profile_requested())
+
+# --- 2. 初始數據與持股帳本 (SQLite，重新整理或重啟後仍保留) ---
+DEFAULT_HOLDINGS = [
+    {"ticker": "IONQ", "shares": 30.0, "cost": 45.498},
+    {"ticker": "EOSE", "shares": 100.0, "cost": 11.747},
+    {"ticker": "ONDS", "shares": 110.0, "cost": 10.043}
+]
+ledger = get_ledger()
+PORTFOLIO_ID = st.query_params.get("portfolio", DEFAULT_PORTFOLIO)
+ledger.ensure_portfolio(PORTFOLIO_ID, seed=DEFAULT_HOLDINGS)
+portfolio = ledger.positions(PORTFOLIO_ID)
+# 每天收盤後在背景記一筆持股與損益，長期走勢由這份紀錄讀出
+eod.enable()
 
 # --- 3. 側邊欄：管理功能 ---
 with st.sidebar:
@@ -26,92 +41,95 @@ with st.sidebar:
         submit_btn = st.form_submit_button("更新 / 新增持股")
         
         if submit_btn and new_ticker:
-            # 更新邏輯
-            found = False
-            for item in st.session_state.portfolio:
-                if item['ticker'] == new_ticker:
-                    item['shares'], item['cost'] = new_shares, new_cost
-                    found = True
-                    break
-            if not found:
-                st.session_state.portfolio.append({"ticker": new_ticker, "shares": new_shares, "cost": new_cost})
+            # 更新邏輯：寫入帳本後重新讀取部位
+            ledger.set_position(PORTFOLIO_ID, new_ticker, new_shares, new_cost)
+            portfolio = ledger.positions(PORTFOLIO_ID)
             st.success(f"已成功更新 {new_ticker}")
 
+    with st.expander("📥 批次匯入 / 匯出"):
+        bulk_panel(ledger, PORTFOLIO_ID)
+
     if st.button("🔴 重置所有數據"):
-        del st.session_state.portfolio
+        ledger.clear(PORTFOLIO_ID)
+        for item in DEFAULT_HOLDINGS:
+            ledger.set_position(PORTFOLIO_ID, item["ticker"], item["shares"], item["cost"])
         st.rerun()
 
 # --- 4. 數據抓取與核心計算 ---
-if st.session_state.portfolio:
-    tickers = [item['ticker'] for item in st.session_state.portfolio]
+if portfolio:
+    tickers = [item['ticker'] for item in portfolio]
+    # 冷啟動：新 session 先畫出上次存下的結果，最新行情算好後再換掉
+    warm_key = f"app-{PORTFOLIO_ID}"
+    warm_slot = st.empty()
+    warm = None if st.session_state.get("warm_shown") else warm_start.load(warm_key)
+    if warm:
+        warm_start.paint(warm_slot, warm)
     
     try:
         # 下載數據 (5天內 15分鐘 K線)
-        with st.spinner('正在獲取最新市場行情...'):
-            raw_data = yf.download(tickers, period="5d", interval="15m", group_by='ticker', progress=False)
+        with st.spinner('正在獲取最新市場行情...'), profiling.stage("fetch", rows=len(tickers)):
+            raw_data = latest_bars(tickers, period="5d", interval="15m")
         
         if raw_data.empty:
             st.error("無法取得數據，請確認網路連接或代碼是否正確。")
             st.stop()
 
-        results = []
-        total_cost = 0.0
-        total_market_value = 0.0
-        portfolio_trend = None
-
-        for item in st.session_state.portfolio:
-            t = item['ticker']
-            
-            # 處理單一與多個股票抓取時 DataFrame 結構不同的問題
-            ticker_df = raw_data[t] if len(tickers) > 1 else raw_data
-            
-            if ticker_df.empty or 'Close' not in ticker_df:
-                st.warning(f"找不到代碼 {t} 的數據，已跳過。")
-                continue
-
-            current_price = ticker_df['Close'].iloc[-1]
-            market_value = current_price * item['shares']
-            cost_basis = item['cost'] * item['shares']
-            profit = market_value - cost_basis
-            profit_pct = (profit / cost_basis * 100) if cost_basis != 0 else 0
-            
-            total_cost += cost_basis
-            total_market_value += market_value
-            
-            # 累積趨勢圖數據
-            stock_series = ticker_df['Close'] * item['shares']
-            if portfolio_trend is None:
-                portfolio_trend = stock_series
-            else:
-                portfolio_trend = portfolio_trend.add(stock_series, fill_value=0)
-
-            results.append({
-                "股票": t, "股數": item['shares'], "平均成本": item['cost'],
-                "目前市價": round(current_price, 2), "市值": round(market_value, 2),
-                "損益": round(profit, 2), "百分比": f"{profit_pct:.2f}%"
+        # 向量化估值：所有持股的市值、損益與總值走勢一次算完
+        with profiling.stage("valuation", rows=len(portfolio), points=raw_data.size):
+            val = value_portfolio(raw_data, portfolio)
+        for t in val.missing:
+            st.warning(f"找不到代碼 {t} 的數據，已跳過。")
+        stale = stale_note(tickers)
+        if stale:
+            st.caption(stale)
+
+        with profiling.stage("holdings_table", rows=len(val.tickers)):
+            h = val.holdings()
+            results = pd.DataFrame({
+                "股票": h["ticker"], "股數": h["shares"], "平均成本": h["cost"],
+                "目前市價": h["price"].round(2), "市值": h["market_value"].round(2),
+                "損益": h["profit"].round(2), "百分比": h["profit_pct"]
             })
+        total_cost = val.total_cost
+        total_market_value = val.total_market
+        portfolio_trend = val.trend if val.tickers else None
 
         # --- 5. 儀表板顯示 ---
-        total_profit = total_market_value - total_cost
-        total_profit_pct = (total_profit / total_cost * 100) if total_cost != 0 else 0
+        total_profit = val.total_profit
+        total_profit_pct = val.total_profit_pct
 
         # KPI 指標排版
         m1, m2, m3 = st.columns(3)
         m1.metric("總資產市值", f"${total_market_value:,.2f}")
         m2.metric("總損益額", f"${total_profit:,.2f}", f"{total_profit_pct:.2f}%")
         m3.metric("投入總成本", f"${total_cost:,.2f}")
+        warm_slot.empty()
+        st.session_state["warm_shown"] = True
+        warm_start.save(warm_key, [
+            ("總資產市值", f"${total_market_value:,.2f}", None),
+            ("總損益額", f"${total_profit:,.2f}", f"{total_profit_pct:.2f}%"),
+            ("投入總成本", f"${total_cost:,.2f}", None),
+        ], results.sort_values("市值", ascending=False), portfolio_trend)
 
         st.divider()
 
         # 分頁功能
         tab1, tab2, tab3 = st.tabs(["📈 趨勢分析", "🍰 資產配置", "📋 持股清單"])
 
-        with tab1:
+        # 各分頁的內容 (降採樣、建圖、序列化送出) 分別計時
+        with tab1, profiling.stage("trend_tab", rows=len(val.trend)) as trend_info:
             st.subheader("投資組合總價值走勢 (近5日)")
+            # plotly 到真的要畫圖時才載入，不擋住 KPI 的第一次顯示
+            import plotly.graph_objects as go
+
             if portfolio_trend is not None:
+                # 點數超過上限時以 LTTB 降採樣；縮小區間會重新取樣出細節
+                z_start, z_end = zoom_slider(portfolio_trend.index, key="trend_zoom")
+                trend_plot = downsample_series(window(portfolio_trend, z_start, z_end))
+                trend_info["points"] = len(trend_plot)
                 fig_trend = go.Figure(go.Scatter(
-                    x=portfolio_trend.index, 
-                    y=portfolio_trend.values, 
+                    x=trend_plot.index, 
+                    y=trend_plot.values, 
                     mode='lines', 
                     name='總市值',
                     line=dict(color='#00ffcc', width=2)
@@ -125,8 +143,18 @@ if st.session_state.portfolio:
                 )
                 st.plotly_chart(fig_trend, use_container_width=True)
 
-        with tab2:
+            st.subheader("長期市值與損益 (每日收盤快照)")
+            history = eod.history(PORTFOLIO_ID)
+            trend_info["eod_days"] = len(history)
+            if len(history) >= 2:
+                st.plotly_chart(eod.history_figure(history), use_container_width=True)
+            else:
+                st.caption("每日收盤後自動記錄一筆，累積兩個交易日以上即可顯示長期走勢。")
+
+        with tab2, profiling.stage("allocation_tab", rows=len(results)):
             st.subheader("各標的權重比例")
+            import plotly.express as px
+
             df_results = pd.DataFrame(results)
             fig_pie = px.pie(
                 df_results, 
@@ -138,18 +166,19 @@ if st.session_state.portfolio:
             fig_pie.update_layout(template="plotly_dark", height=450)
             st.plotly_chart(fig_pie, use_container_width=True)
 
-        with tab3:
+        with tab3, profiling.stage("holdings_tab", rows=len(results)):
             st.subheader("詳細持股明細")
-            # 格式化顯示
-            st.dataframe(
-                pd.DataFrame(results).style.applymap(
-                    lambda x: 'color: #ff4b4b' if '-' in str(x) else 'color: #00ff00', 
-                    subset=['損益', '百分比']
-                ), 
-                use_container_width=True
+            # 伺服器端篩選 / 排序後只送出目前這一頁；正負著色整欄一次計算
+            paged_table(
+                results, key="holdings", signed=['損益', '百分比'], search_column="股票",
+                sort_columns=["市值", "損益", "百分比", "股票"], formats={"百分比": "{:.2f}%"}, use_container_width=True
             )
 
     except Exception as e:
         st.error(f"系統發生非預期錯誤: {e}")
 else:
-    st.info("目前投資組合為空，請使用左側工具列新增股票。")
\ No newline at end of file
+    st.info("目前投資組合為空，請使用左側工具列新增股票。")
+
+rerun = profiling.finish()
+if profiling.debug_enabled():
+    profiling.debug_panel(rerun)
\ No newline at end of file
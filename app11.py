@@ -1,16 +1,21 @@
 import streamlit as st
-import yfinance as yf
 import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
+
+from downsample import downsample_series, window, zoom_slider
+from fx import spot, value_portfolio_in
+from ledger import DEFAULT_PORTFOLIO, get_ledger
+from poller import latest_bars
+from resilience import stale_note
 
 # --- 1. 網頁配置 ---
 st.set_page_config(page_title="專業級投資監測 App (美金/台幣)", layout="wide")
 st.title("📊 投資組合即時追蹤系統")
 
-# --- 2. 初始數據 ---
-if 'portfolio' not in st.session_state:
-    st.session_state.portfolio = []
+# --- 2. 初始數據 (持股帳本，所有 session 共用並寫入磁碟) ---
+ledger = get_ledger()
+PORTFOLIO_ID = st.query_params.get("portfolio", DEFAULT_PORTFOLIO)
+ledger.ensure_portfolio(PORTFOLIO_ID)
+portfolio = ledger.positions(PORTFOLIO_ID)
 
 # --- 3. 側邊欄：管理功能 ---
 with st.sidebar:
@@ -20,91 +25,71 @@ with st.sidebar:
         st.subheader("新增或更新持股")
         new_ticker = st.text_input("股票代碼 (如: NVDA, TSLA)").upper().strip()
         new_shares = st.number_input("持有股數", min_value=0.0, step=1.0)
-        new_cost = st.number_input("平均成本 (USD)", min_value=0.0, step=0.01)
+        new_cost = st.number_input("平均成本 (報價幣別，台股為台幣)", min_value=0.0, step=0.01)
         submit_btn = st.form_submit_button("執行更新")
         
         if submit_btn and new_ticker:
-            found = False
-            for item in st.session_state.portfolio:
-                if item['ticker'] == new_ticker:
-                    item['shares'], item['cost'] = new_shares, new_cost
-                    found = True
-                    break
-            if not found:
-                st.session_state.portfolio.append({"ticker": new_ticker, "shares": new_shares, "cost": new_cost})
+            ledger.set_position(PORTFOLIO_ID, new_ticker, new_shares, new_cost)
             st.success(f"已更新 {new_ticker}")
             st.rerun()
 
-    if st.session_state.portfolio:
+    if portfolio:
         st.subheader("移除持股")
-        current_tickers = [item['ticker'] for item in st.session_state.portfolio]
+        current_tickers = [item['ticker'] for item in portfolio]
         delete_ticker = st.selectbox("選擇要刪除的股票", current_tickers)
         if st.button("🗑 點我刪除選中股票"):
-            st.session_state.portfolio = [item for item in st.session_state.portfolio if item['ticker'] != delete_ticker]
+            ledger.remove(PORTFOLIO_ID, delete_ticker)
             st.warning(f"已刪除 {delete_ticker}")
             st.rerun()
 
     st.divider()
     if st.button("🔴 清空所有持股"):
-        st.session_state.portfolio = []
+        ledger.clear(PORTFOLIO_ID)
         st.rerun()
 
 # --- 4. 數據抓取與匯率換算 ---
-if st.session_state.portfolio:
-    tickers = [item['ticker'] for item in st.session_state.portfolio]
+if portfolio:
+    tickers = [item['ticker'] for item in portfolio]
     
     try:
         with st.spinner('正在獲取市場行情與匯率...'):
-            # 抓取股票數據 + 美金兌台幣匯率 (USDTWD=X)
-            all_data = yf.download(tickers + ["TWD=X"], period="5d", interval="15m", group_by='ticker', progress=False)
+            # 抓取股票數據；美金兌台幣匯率 (TWD=X) 由 fx 從共用快照取得
+            all_data = latest_bars(tickers, period="5d", interval="15m")
             
             # 取得最新匯率
-            usdtwd = all_data["TWD=X"]["Close"].iloc[-1]
+            usdtwd = spot("USD", "TWD")
             st.sidebar.info(f"💱 當前匯率: 1 USD = {usdtwd:.2f} TWD")
         
         if all_data.empty:
             st.error("無法取得數據。")
             st.stop()
 
-        results = []
-        total_cost_usd = 0.0
-        total_market_value_usd = 0.0
-        portfolio_trend = None
-
-        for item in st.session_state.portfolio:
-            t = item['ticker']
-            ticker_df = all_data[t] if len(tickers) + 1 > 1 else all_data
-            
-            if ticker_df.empty or 'Close' not in ticker_df:
-                continue
-
-            current_price_usd = ticker_df['Close'].iloc[-1]
-            market_value_usd = current_price_usd * item['shares']
-            cost_basis_usd = item['cost'] * item['shares']
-            profit_usd = market_value_usd - cost_basis_usd
-            profit_pct = (profit_usd / cost_basis_usd * 100) if cost_basis_usd != 0 else 0
-            
-            total_cost_usd += cost_basis_usd
-            total_market_value_usd += market_value_usd
-            
-            # 累積趨勢圖數據
-            stock_series = ticker_df['Close'] * item['shares']
-            portfolio_trend = stock_series if portfolio_trend is None else portfolio_trend.add(stock_series, fill_value=0)
-
-            results.append({
-                "股票": t, 
-                "股數": item['shares'], 
-                "成本(USD)": item['cost'],
-                "市值(USD)": round(market_value_usd, 2),
-                "市值(TWD)": round(market_value_usd * usdtwd, 0),
-                "損益(USD)": round(profit_usd, 2), 
-                "損益(TWD)": round(profit_usd * usdtwd, 0),
-                "百分比": f"{profit_pct:.2f}%"
-            })
+        # 向量化估值；台幣欄位由同一份結果乘上匯率
+        val = value_portfolio_in(all_data, portfolio, "USD")
+        for t in val.missing:
+            st.warning(f"找不到代碼 {t} 的數據，已跳過。")
+        stale = stale_note(tickers)
+        if stale:
+            st.caption(stale)
+        h_usd = val.holdings()
+        h_twd = val.holdings(rate=usdtwd)
+        results = pd.DataFrame({
+            "股票": h_usd["ticker"],
+            "股數": h_usd["shares"],
+            "成本(USD)": h_usd["cost"],
+            "市值(USD)": h_usd["market_value"].round(2),
+            "市值(TWD)": h_twd["market_value"].round(0),
+            "損益(USD)": h_usd["profit"].round(2),
+            "損益(TWD)": h_twd["profit"].round(0),
+            "百分比": h_usd["profit_pct"].map("{:.2f}%".format)
+        })
+        total_cost_usd = val.total_cost
+        total_market_value_usd = val.total_market
+        portfolio_trend = val.trend if val.tickers else None
 
         # --- 5. 儀表板顯示 ---
-        total_profit_usd = total_market_value_usd - total_cost_usd
-        total_profit_pct = (total_profit_usd / total_cost_usd * 100) if total_cost_usd != 0 else 0
+        total_profit_usd = val.total_profit
+        total_profit_pct = val.total_profit_pct
 
         # 美金顯示
         st.subheader("🇺🇸 美金資產概況")
@@ -126,12 +111,19 @@ if st.session_state.portfolio:
         tab1, tab2, tab3 = st.tabs(["📈 趨勢分析", "🍰 資產配置", "📋 持股清單"])
         
         with tab1:
+            # plotly 到真的要畫圖時才載入，不擋住 KPI 的第一次顯示
+            import plotly.graph_objects as go
+
             if portfolio_trend is not None:
-                fig_trend = go.Figure(go.Scatter(x=portfolio_trend.index, y=portfolio_trend.values, mode='lines', line=dict(color='#00ffcc')))
+                z_start, z_end = zoom_slider(portfolio_trend.index, key="trend_zoom")
+                trend_plot = downsample_series(window(portfolio_trend, z_start, z_end))
+                fig_trend = go.Figure(go.Scatter(x=trend_plot.index, y=trend_plot.values, mode='lines', line=dict(color='#00ffcc')))
                 fig_trend.update_layout(height=400, template="plotly_dark", title="資產價值走勢 (USD)")
                 st.plotly_chart(fig_trend, use_container_width=True)
         
         with tab2:
+            import plotly.express as px
+
             df_results = pd.DataFrame(results)
             fig_pie = px.pie(df_results, values='市值(USD)', names='股票', hole=0.4)
             fig_pie.update_layout(template="plotly_dark")
@@ -0,0 +1,82 @@
+import streamlit as st
+import pandas as pd
+
+import backtest as bt
+from downsample import downsample_series
+from ledger import DEFAULT_PORTFOLIO, get_ledger
+
+# --- 1. 網頁配置 ---
+st.set_page_config(page_title="回測與再平衡模擬", layout="wide")
+st.title("🧪 回測與再平衡模擬")
+
+# --- 2. 持股 (與儀表板共用帳本) ---
+ledger = get_ledger()
+PORTFOLIO_ID = st.query_params.get("portfolio", DEFAULT_PORTFOLIO)
+holdings = {p["ticker"]: p["shares"] for p in ledger.positions(PORTFOLIO_ID)}
+if not holdings:
+    st.info(f"投資組合 {PORTFOLIO_ID} 目前沒有持股。")
+    st.stop()
+
+# --- 3. 規則設定 ---
+with st.sidebar:
+    st.header("⚙️ 回測設定")
+    period = st.selectbox("歷史區間", ["1y", "2y", "5y", "10y"], index=2)
+    rule = st.radio("再平衡規則", ["買入持有", "定期", "偏離門檻"])
+    freq = band = None
+    if rule == "定期":
+        freq = st.selectbox("頻率", list(bt.FREQUENCIES), format_func=bt.FREQUENCIES.get, index=1)
+    elif rule == "偏離門檻":
+        band = st.slider("權重偏離門檻 (%)", 1, 20, 5) / 100
+    cost_bps = st.number_input("單邊交易成本 (bp)", min_value=0.0, value=5.0, step=1.0)
+    # 回測只讀本地 K 線庫；按這裡才會連網補歷史
+    if st.button("更新歷史資料"):
+        with st.spinner("下載歷史 K 線..."):
+            bt.sync_history(list(holdings), period=period)
+
+closes = bt.load_closes(list(holdings), period=period)
+if closes.empty:
+    st.info("本地沒有這些標的的日 K 線，請先按左側「更新歷史資料」。")
+    st.stop()
+st.caption(f"資料區間 {closes.index[0]:%Y-%m-%d} ~ {closes.index[-1]:%Y-%m-%d}，共 {len(closes)} 個交易日。")
+
+# --- 4. 單一規則 vs 買入持有 ---
+rebalance = {"買入持有": "none", "定期": "periodic", "偏離門檻": "threshold"}[rule]
+chosen = bt.Strategy(rebalance, freq=freq, band=band, cost_bps=cost_bps)
+results = [bt.run(closes, chosen, holdings)]
+if rebalance != "none":
+    results.append(bt.run(closes, bt.Strategy(cost_bps=cost_bps), holdings))
+
+s = results[0].summary()
+m1, m2, m3, m4 = st.columns(4)
+m1.metric("累計報酬", f"{s['total_return'] * 100:.1f}%")
+m2.metric("年化報酬", f"{s['cagr'] * 100:.1f}%")
+m3.metric("最大回撤", f"{s['max_drawdown'] * 100:.1f}%")
+m4.metric("年化換手率", f"{s['turnover'] * 100:.0f}%", f"{s['rebalances']} 次再平衡", delta_color="off")
+
+# plotly 到真的要畫圖時才載入，不擋住 KPI 的第一次顯示
+import plotly.graph_objects as go  # noqa: E402
+
+fig = go.Figure()
+for res in results:
+    eq = downsample_series(res.equity)
+    fig.add_trace(go.Scatter(x=eq.index, y=eq.values, mode='lines', name=res.name))
+fig.update_layout(template="plotly_dark", height=450, yaxis_title="淨值 (期初 = 1)", hovermode="x unified")
+st.plotly_chart(fig, use_container_width=True)
+
+if len(results[0].turnover):
+    with st.expander("再平衡紀錄"):
+        st.dataframe(pd.DataFrame({
+            "換手率%": results[0].turnover * 100, "成本%": results[0].costs * 100,
+        }).style.format(precision=3), use_container_width=True)
+
+# --- 5. 參數掃描 (process pool 平行執行) ---
+st.subheader("參數掃描")
+if st.button("執行參數掃描"):
+    strategies = bt.grid()
+    with st.spinner(f"回測 {len(strategies)} 組參數..."):
+        summary, _ = bt.run_many(closes, strategies, holdings)
+    st.dataframe(pd.DataFrame({
+        "規則": summary["strategy"], "年化報酬%": summary["cagr"] * 100, "波動%": summary["volatility"] * 100,
+        "夏普": summary["sharpe"], "最大回撤%": summary["max_drawdown"] * 100,
+        "再平衡次數": summary["rebalances"], "年化換手%": summary["turnover"] * 100, "成本%": summary["cost"] * 100,
+    }).sort_values("夏普", ascending=False).style.format(precision=2), use_container_width=True)
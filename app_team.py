@@ -0,0 +1,51 @@
+import streamlit as st
+import pandas as pd
+from streamlit_autorefresh import st_autorefresh
+
+from downsample import downsample_series
+from team import portfolio_views, team_summary
+
+# --- 1. 網頁配置 ---
+st.set_page_config(page_title="團隊投資組合總覽", layout="wide")
+st.title("👥 團隊投資組合總覽")
+
+# 行情由背景輪詢器統一刷新，這裡只是定時重繪
+st_autorefresh(interval=60000, key="team_refresh_counter")
+
+# --- 2. 所有投資組合 (共用同一份行情快照) ---
+views = portfolio_views()
+if not views:
+    st.info("帳本中還沒有任何投資組合。")
+    st.stop()
+
+summary = team_summary(views)
+m1, m2, m3 = st.columns(3)
+m1.metric("投資組合數", f"{len(views)}")
+m2.metric("合計市值 (USD)", f"${summary['市值(USD)'].sum():,.0f}")
+m3.metric("合計未實現損益", f"${summary['未實現損益'].sum():,.2f}")
+
+st.dataframe(summary.style.format(precision=2), use_container_width=True)
+
+# --- 3. 走勢比較與明細 ---
+tab1, tab2 = st.tabs(["📈 走勢比較", "📋 投資組合明細"])
+
+with tab1:
+    # plotly 到真的要畫圖時才載入，不擋住總覽表的第一次顯示
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+    for pid, v in views.items():
+        if v.tickers:
+            trend = downsample_series(v.trend)
+            fig.add_trace(go.Scatter(x=trend.index, y=trend.values, mode='lines', name=pid))
+    fig.update_layout(template="plotly_dark", height=450, yaxis_title="市值 (USD)", hovermode="x unified")
+    st.plotly_chart(fig, use_container_width=True)
+
+with tab2:
+    pid = st.selectbox("選擇投資組合", list(views))
+    st.caption(f"個人儀表板網址加上 ?portfolio={pid} 即可單獨檢視與編輯這個投資組合。")
+    h = views[pid].holdings()
+    st.dataframe(pd.DataFrame({
+        "股票": h["ticker"], "股數": h["shares"], "平均成本": h["cost"], "現價": h["price"],
+        "市值": h["market_value"], "損益": h["profit"], "百分比": h["profit_pct"], "權重": h["weight"] * 100,
+    }).style.format(precision=2), use_container_width=True)
@@ -0,0 +1,257 @@
+"""
+回測 / 假設性再平衡引擎。
+
+以本地 K 線庫的歷史收盤價 (時間 × 標的矩陣) 重播一組持股在不同再平衡規則下的表現：
+不調整 (買入持有)、定期 (週 / 月 / 季 / 年) 回到目標權重、權重偏離超過門檻才調整，
+並計入交易成本。兩次再平衡之間持股不變，組合價值是「相對價格矩陣 × 權重」的一次
+矩陣運算；各段的換手率、成本與起始淨值也都以陣列一次算出，只有門檻法需要逐次
+找下一個觸發點 (迴圈次數 = 再平衡次數，而不是 K 線根數)。
+大量參數組合用 process pool 平行跑，資料只在每個 worker 啟動時傳一次。
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import bar_store
+from risk import PERIODS_PER_YEAR, max_drawdown
+from valuation import close_frame
+
+FREQUENCIES = {"W": "每週", "M": "每月", "Q": "每季", "Y": "每年"}
+MIN_PARALLEL = 16  # 組合數太少時直接在本行程跑，省下開 worker 的成本
+SCAN_BLOCK = 64  # 門檻法每次往後檢查的 K 線根數
+
+
+class Strategy:
+    """再平衡規則。
+
+    rebalance: "none" (買入持有) / "periodic" (依 freq 定期) / "threshold" (任一權重偏離
+    目標超過 band 才調整；若同時給 freq，只在定期檢查日判斷)。
+    target: {ticker: 權重}，期初即按此配置；None 表示以期初持股市值權重為目標。
+    cost_bps: 單邊交易成本 (基點，以成交金額計)。
+    """
+
+    def __init__(self, rebalance="none", freq=None, band=None, target=None, cost_bps=0.0, name=None):
+        if rebalance not in ("none", "periodic", "threshold"):
+            raise ValueError(f"unknown rebalance rule {rebalance!r}")
+        if rebalance == "periodic" and freq not in FREQUENCIES:
+            raise ValueError(f"periodic rebalancing needs freq in {list(FREQUENCIES)}")
+        if rebalance == "threshold" and not band:
+            raise ValueError("threshold rebalancing needs a band")
+        self.rebalance = rebalance
+        self.freq = freq
+        self.band = band
+        self.target = target
+        self.cost_bps = float(cost_bps)
+        self.name = name or self.label()
+
+    def label(self):
+        if self.rebalance == "none":
+            rule = "買入持有"
+        elif self.rebalance == "periodic":
+            rule = f"{FREQUENCIES[self.freq]}再平衡"
+        else:
+            rule = f"偏離 {self.band * 100:g}% 再平衡" + (f" ({FREQUENCIES[self.freq]}檢查)" if self.freq else "")
+        return f"{rule} · 成本 {self.cost_bps:g}bp"
+
+    def __repr__(self):
+        return f"Strategy({self.name!r})"
+
+
+class BacktestResult:
+    def __init__(self, name, equity, rebalances, turnover, costs, periods=PERIODS_PER_YEAR):
+        self.name = name
+        self.equity = equity  # 淨值 (期初 = 1)
+        self.rebalances = rebalances  # 再平衡時間點
+        self.turnover = turnover  # 各次再平衡的單邊換手率 (Series)
+        self.costs = costs  # 各次再平衡的成本佔淨值比例 (Series)
+        self.periods = periods
+
+    def summary(self):
+        eq = self.equity.to_numpy()
+        rets = eq[1:] / eq[:-1] - 1.0 if len(eq) > 1 else np.zeros(0)
+        years = len(rets) / self.periods
+        total = float(eq[-1] / eq[0] - 1.0) if len(eq) else 0.0
+        vol = float(rets.std(ddof=1) * np.sqrt(self.periods)) if len(rets) > 1 else 0.0
+        cagr = float((1.0 + total) ** (1.0 / years) - 1.0) if years > 0 and total > -1 else np.nan
+        mdd, _ = max_drawdown(eq)
+        return {
+            "strategy": self.name,
+            "total_return": total,
+            "cagr": cagr,
+            "volatility": vol,
+            "sharpe": float(rets.mean() / rets.std(ddof=1) * np.sqrt(self.periods)) if vol else np.nan,
+            "max_drawdown": float(mdd) if len(eq) else 0.0,
+            "rebalances": len(self.rebalances),
+            "turnover": float(self.turnover.sum() / years) if years > 0 else 0.0,  # 年化單邊換手
+            "cost": float(self.costs.sum()),
+        }
+
+
+# --- 資料 ---
+def load_closes(tickers, period="5y", interval="1d", store=None):
+    """只讀本地 K 線庫 (不連網)；回傳從所有標的都有價格的那天起、向前填補的收盤價矩陣。"""
+    store = store or bar_store.get_store()
+    tickers = list(dict.fromkeys(tickers))
+    raw = bar_store.combine(store.frames(tickers, period=period, interval=interval), tickers)
+    closes = close_frame(raw, tickers)
+    return closes.dropna()
+
+
+def sync_history(tickers, period="5y", interval="1d", store=None):
+    """需要時先把歷史補進本地庫 (之後的回測都可離線執行)。"""
+    import resilience
+
+    store = store or bar_store.get_store()
+    return store.sync(list(tickers), period=period, interval=interval, backfill=True, fetch=resilience.get_fetcher())
+
+
+def initial_weights(closes, holdings):
+    """holdings: {ticker: shares}；以期初價格換成市值權重。"""
+    shares = np.array([holdings.get(t, 0.0) for t in closes.columns], dtype=float)
+    value = closes.iloc[0].to_numpy(dtype=float) * shares
+    return value / value.sum()
+
+
+# --- 核心 ---
+def _period_starts(index, freq):
+    """每個日曆週期 (週 / 月 / 季 / 年) 的第一根 K 線位置。"""
+    idx = index.tz_localize(None) if index.tz is not None else index
+    keys = idx.to_period(freq).asi8
+    return np.flatnonzero(np.r_[False, keys[1:] != keys[:-1]])
+
+
+def _threshold_rows(prices, w0, target, band, candidates):
+    """門檻法：從上一次再平衡往後，逐塊算出候選點的漂移權重，找第一個超出 band 的位置。"""
+    T = len(prices)
+    rows, last, w = [0], 0, w0
+    cand = np.zeros(T, dtype=bool)
+    cand[candidates] = True
+    lo = 1
+    while lo < T:
+        hi = min(lo + SCAN_BLOCK, T)
+        drifted = prices[lo:hi] / prices[last] * w
+        drifted /= drifted.sum(axis=1, keepdims=True)
+        hit = np.flatnonzero((np.abs(drifted - target).max(axis=1) > band) & cand[lo:hi])
+        if len(hit):
+            last = lo + hit[0]
+            rows.append(last)
+            w = target
+            lo = last + 1
+        else:
+            lo = hi
+    return np.array(rows)
+
+
+def simulate(prices, w0, target, rows, cost):
+    """給定再平衡位置 rows (第一個必為 0) 的淨值曲線、各次換手率與成本，全為陣列運算。
+
+    prices: (T × N) 無缺值；w0: 期初權重；target: 再平衡後的權重；cost: 單邊成本率。
+    """
+    T = len(prices)
+    weights = np.vstack([w0, np.repeat(target[None, :], len(rows) - 1, axis=0)])
+    seg = np.searchsorted(rows, np.arange(T), side="right") - 1
+    growth = (prices / prices[rows[seg]] * weights[seg]).sum(axis=1)
+
+    # 每段結束 (= 下一次再平衡前) 的成長倍數與漂移後權重
+    rel_end = prices[rows[1:]] / prices[rows[:-1]]
+    g_end = (rel_end * weights[:-1]).sum(axis=1)
+    drifted = rel_end * weights[:-1] / g_end[:, None]
+    turnover = np.abs(weights[1:] - drifted).sum(axis=1) / 2  # 單邊換手率
+    charge = cost * 2 * turnover  # 買賣兩邊都付成本
+    start = np.concatenate([[1.0], np.cumprod(g_end * (1.0 - charge))])
+    return start[seg] * growth, turnover, charge
+
+
+def run(closes, strategy, holdings, periods=PERIODS_PER_YEAR):
+    """以 closes (load_closes 的結果) 回測一個 strategy；holdings: {ticker: shares}。"""
+    return _run(closes.to_numpy(dtype=float), closes.index, list(closes.columns),
+                initial_weights(closes, holdings), strategy, periods)
+
+
+def _run(prices, index, columns, w0, strategy, periods):
+    if strategy.target is None:
+        target = w0
+    else:
+        # 指定目標權重時，假設期初就已按目標配置
+        target = np.array([strategy.target.get(t, 0.0) for t in columns], dtype=float)
+        target = w0 = target / target.sum()
+
+    if strategy.rebalance == "none":
+        rows = np.array([0])
+    elif strategy.rebalance == "periodic":
+        rows = np.r_[0, _period_starts(index, strategy.freq)]
+    else:
+        candidates = _period_starts(index, strategy.freq) if strategy.freq else np.arange(1, len(prices))
+        rows = _threshold_rows(prices, w0, target, strategy.band, candidates)
+
+    equity, turnover, charge = simulate(prices, w0, target, rows, strategy.cost_bps / 10000.0)
+    when = index[rows[1:]]
+    return BacktestResult(
+        strategy.name,
+        pd.Series(equity, index=index, name=strategy.name),
+        when,
+        pd.Series(turnover, index=when, name="turnover"),
+        pd.Series(charge, index=when, name="cost"),
+        periods,
+    )
+
+
+# --- 大量參數組合 ---
+_columns = None
+_prices = None
+_index = None
+_w0 = None
+
+
+def _init_worker(closes, w0):
+    global _columns, _prices, _index, _w0
+    _columns = list(closes.columns)
+    _prices = closes.to_numpy(dtype=float)
+    _index = closes.index
+    _w0 = w0
+
+
+def _run_one(args):
+    strategy, periods, keep_equity = args
+    res = _run(_prices, _index, _columns, _w0, strategy, periods)
+    return res.summary(), (res.equity if keep_equity else None)
+
+
+def _mp_context():
+    """worker 不以 fork 建立：Streamlit 伺服器有輪詢、metadata、收盤快照等背景執行緒，
+    fork 可能複製到正被持有的鎖而卡死。forkserver 預先載入本模組，worker 啟動時不必重新 import。"""
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload([__name__])
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+def run_many(closes, strategies, holdings, workers=None, periods=PERIODS_PER_YEAR, keep_equity=False):
+    """平行回測多個 strategy；回傳 (每個組合一列的摘要 DataFrame, {名稱: 淨值曲線} 或 {})。"""
+    w0 = initial_weights(closes, holdings)
+    tasks = [(s, periods, keep_equity) for s in strategies]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) < MIN_PARALLEL:
+        _init_worker(closes, w0)
+        out = [_run_one(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context(),
+                                 initializer=_init_worker, initargs=(closes, w0)) as ex:
+            out = list(ex.map(_run_one, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+    summary = pd.DataFrame([s for s, _ in out])
+    curves = {s["strategy"]: eq for s, eq in out if eq is not None}
+    return summary, curves
+
+
+def grid(freqs=("M", "Q", "Y"), bands=(0.02, 0.05, 0.1), costs=(0.0, 5.0, 20.0), target=None):
+    """常用的參數組合：買入持有、各種定期與門檻再平衡 × 交易成本。"""
+    out = []
+    for cost in costs:
+        out.append(Strategy("none", cost_bps=cost, target=target))
+        out += [Strategy("periodic", freq=f, cost_bps=cost, target=target) for f in freqs]
+        out += [Strategy("threshold", band=b, cost_bps=cost, target=target) for b in bands]
+    return out
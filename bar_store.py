@@ -0,0 +1,305 @@
+"""
+本地 K 線資料庫 (SQLite)。
+
+依 (ticker, interval) 保存歷史 K 線，每次重新執行只向 yfinance 索取
+最後一根已存 K 線之後的資料，再把合併後的結果以 `yf.download(..., group_by='ticker')`
+相同的欄位結構 (ticker -> Open/High/Low/Close/Volume) 回傳。
+"""
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+import profiling
+
+DATA_DIR = os.environ.get(
+    "GUPIAO_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".gupiao")
+)
+FIELDS = ["Open", "High", "Low", "Close", "Volume"]
+
+# period 字串換算為日曆天數 ("5d" 另以交易日計算)
+PERIOD_DAYS = {
+    "1mo": 31, "3mo": 92, "6mo": 183, "1y": 366, "2y": 731, "5y": 1827, "10y": 3653,
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bars (
+    ticker   TEXT    NOT NULL,
+    interval TEXT    NOT NULL,
+    ts       INTEGER NOT NULL,
+    open     REAL, high REAL, low REAL, close REAL, volume REAL,
+    PRIMARY KEY (ticker, interval, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS series (
+    ticker   TEXT NOT NULL,
+    interval TEXT NOT NULL,
+    tz       TEXT,
+    last_ts  INTEGER,
+    PRIMARY KEY (ticker, interval)
+);
+"""
+
+
+def _period_start(period, now):
+    """period 對應的最早需要時間 (UTC)；'Nd' 多抓幾天以涵蓋週末與假日。"""
+    if period.endswith("d"):
+        days = int(period[:-1])
+        return now - timedelta(days=days + 2 * (days // 5 + 1) + 3)
+    if period in PERIOD_DAYS:
+        return now - timedelta(days=PERIOD_DAYS[period])
+    return None  # "max" 等：不限
+
+
+def _backfill_start(period, now):
+    """補抓歷史時可接受的最晚起點：period 的日曆起點再寬限一週。"""
+    if period.endswith("d"):
+        days = int(period[:-1])
+    elif period in PERIOD_DAYS:
+        days = PERIOD_DAYS[period]
+    else:
+        return None
+    return now - timedelta(days=days) + timedelta(days=7)
+
+
+def split_download(df, tickers):
+    """把 yf.download 的結果拆成 {ticker: OHLCV DataFrame}，去掉整列空值。"""
+    out = {}
+    if df is None or df.empty:
+        return out
+    for t in tickers:
+        if isinstance(df.columns, pd.MultiIndex):
+            if t not in df.columns.get_level_values(0):
+                continue
+            sub = df[t]
+        else:
+            sub = df
+        sub = sub.reindex(columns=FIELDS).dropna(how="all", subset=["Open", "High", "Low", "Close"])
+        if not sub.empty:
+            out[t] = sub
+    return out
+
+
+def yf_fetch(tickers, interval, period=None, start=None):
+    """預設的上游來源：批次呼叫 yf.download。"""
+    # yfinance 載入要 0.2 秒以上，等真的需要連網時才匯入 (本地庫讀取不需要)
+    import yfinance as yf
+
+    profiling.count("upstream.yf_download")
+    profiling.count("upstream.tickers", len(tickers))
+    kwargs = dict(interval=interval, group_by="ticker", progress=False, threads=True)
+    if start is not None:
+        kwargs["start"] = start
+    else:
+        kwargs["period"] = period
+    return split_download(yf.download(list(tickers), **kwargs), tickers)
+
+
+class BarStore:
+    """SQLite K 線庫；寫入時加鎖，讀取每次開新連線 (可跨執行緒使用)。"""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(DATA_DIR, "bars.sqlite")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._backfilled = set()
+        with self._connect() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript(_SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    # --- 中繼資料 ---
+    def last_timestamp(self, ticker, interval):
+        with self._connect() as con:
+            row = con.execute(
+                "SELECT last_ts FROM series WHERE ticker=? AND interval=?", (ticker, interval)
+            ).fetchone()
+        return None if row is None or row[0] is None else datetime.fromtimestamp(row[0], timezone.utc)
+
+    def last_timestamps(self, tickers, interval):
+        return {t: self.last_timestamp(t, interval) for t in tickers}
+
+    def first_timestamps(self, tickers, interval):
+        """{ticker: 最早一根 K 線時間}；共用一條連線，每檔走主鍵索引取最小值，無資料者不在結果中。"""
+        out = {}
+        with self._connect() as con:
+            for t in tickers:
+                row = con.execute("SELECT MIN(ts) FROM bars WHERE ticker=? AND interval=?", (t, interval)).fetchone()
+                if row[0] is not None:
+                    out[t] = datetime.fromtimestamp(row[0], timezone.utc)
+        return out
+
+    def first_timestamp(self, ticker, interval):
+        with self._connect() as con:
+            row = con.execute(
+                "SELECT MIN(ts) FROM bars WHERE ticker=? AND interval=?", (ticker, interval)
+            ).fetchone()
+        return None if row is None or row[0] is None else datetime.fromtimestamp(row[0], timezone.utc)
+
+    def needs_backfill(self, tickers, interval, period, now=None):
+        """已存歷史的起點比 period 起點晚一週以上、且本行程尚未補過的標的。"""
+        want = _backfill_start(period, now or datetime.now(timezone.utc))
+        if want is None:
+            return []
+        out = []
+        for t in tickers:
+            if (t, interval, period) in self._backfilled:
+                continue
+            first = self.first_timestamp(t, interval)
+            if first is not None and first > want:
+                out.append(t)
+        return out
+
+    def delete(self, ticker, interval):
+        with self._lock, self._connect() as con:
+            con.execute("DELETE FROM bars WHERE ticker=? AND interval=?", (ticker, interval))
+            con.execute("DELETE FROM series WHERE ticker=? AND interval=?", (ticker, interval))
+
+    # --- 寫入 ---
+    def write(self, ticker, interval, df):
+        """以 INSERT OR REPLACE 合併 K 線 (最後一根未收盤的 K 線會被覆寫)。"""
+        if df is None or df.empty:
+            return 0
+        idx = pd.DatetimeIndex(df.index)
+        tz = str(idx.tz) if idx.tz is not None else None
+        if idx.tz is None:
+            idx = idx.tz_localize("UTC")
+        ts = idx.tz_convert("UTC").as_unit("s").asi8
+        vals = df.reindex(columns=FIELDS).astype(float).to_numpy()
+        rows = [
+            (ticker, interval, int(ts[i]), *(None if v != v else float(v) for v in vals[i]))
+            for i in range(len(ts))
+        ]
+        with self._lock, self._connect() as con:
+            con.executemany("INSERT OR REPLACE INTO bars VALUES (?,?,?,?,?,?,?,?)", rows)
+            con.execute(
+                "INSERT INTO series (ticker, interval, tz, last_ts) VALUES (?,?,?,?) "
+                "ON CONFLICT(ticker, interval) DO UPDATE SET "
+                "tz=COALESCE(excluded.tz, series.tz), last_ts=MAX(COALESCE(series.last_ts, 0), excluded.last_ts)",
+                (ticker, interval, tz, int(ts.max())),
+            )
+        return len(rows)
+
+    # --- 讀取 ---
+    def read(self, ticker, interval, start=None):
+        sql = "SELECT ts, open, high, low, close, volume FROM bars WHERE ticker=? AND interval=?"
+        params = [ticker, interval]
+        if start is not None:
+            sql += " AND ts>=?"
+            params.append(int(start.timestamp()))
+        with self._connect() as con:
+            rows = con.execute(sql + " ORDER BY ts", params).fetchall()
+            meta = con.execute(
+                "SELECT tz FROM series WHERE ticker=? AND interval=?", (ticker, interval)
+            ).fetchone()
+        if not rows:
+            return pd.DataFrame(columns=FIELDS, dtype=float)
+        df = pd.DataFrame(rows, columns=["ts"] + FIELDS)
+        idx = pd.to_datetime(df.pop("ts"), unit="s", utc=True)
+        if meta and meta[0]:
+            idx = idx.dt.tz_convert(meta[0])
+        df.index = pd.DatetimeIndex(idx, name="Datetime")
+        return df
+
+    def read_since(self, tickers, interval, since):
+        """增量計算用的輕量讀取：共用一條連線，不組 DataFrame。
+
+        since: {ticker: 起點 (含) 或 None}；回傳 {ticker: (UTC 奈秒時間戳, OHLCV ndarray, 時區)}。
+        """
+        out = {}
+        with self._connect() as con:
+            zones = dict(con.execute("SELECT ticker, tz FROM series WHERE interval=?", (interval,)).fetchall())
+            for t in tickers:
+                start = since.get(t)
+                rows = con.execute(
+                    "SELECT ts, open, high, low, close, volume FROM bars WHERE ticker=? AND interval=? AND ts>=? "
+                    "ORDER BY ts", (t, interval, 0 if start is None else int(start.timestamp())),
+                ).fetchall()
+                if rows:
+                    arr = np.array(rows, dtype=float)
+                    out[t] = (arr[:, 0].astype(np.int64) * 1_000_000_000, arr[:, 1:], zones.get(t))
+        return out
+
+    # --- 增量同步 ---
+    def sync(self, tickers, period="5d", interval="15m", fetch=yf_fetch, now=None, backfill=False):
+        """只下載缺少的 K 線；無歷史或歷史過舊的標的抓完整 period，其餘依最後日期分批補抓。
+
+        backfill=True 時，已存歷史比 period 起點晚一週以上的標的也會抓一次完整 period
+        (用在切換到較長的顯示區間)；每個行程對同一組 (ticker, interval, period) 只補一次。
+        """
+        now = now or datetime.now(timezone.utc)
+        floor = _period_start(period, now)
+        shallow = set(self.needs_backfill(tickers, interval, period, now)) if backfill else set()
+        full, delta = [], defaultdict(list)
+        for t, last in self.last_timestamps(tickers, interval).items():
+            if last is None or (floor is not None and last < floor):
+                full.append(t)
+            elif t in shallow:
+                self._backfilled.add((t, interval, period))
+                full.append(t)
+            else:
+                # 從最後一根 K 線所在日期重抓，覆寫尚未收盤的那根
+                delta[last.date()].append(t)
+
+        fetched = 0
+        if full:
+            for t, df in fetch(full, interval, period=period).items():
+                fetched += self.write(t, interval, df)
+        for day, group in delta.items():
+            for t, df in fetch(group, interval, start=day).items():
+                fetched += self.write(t, interval, df)
+        return fetched
+
+    def frames(self, tickers, period="5d", interval="15m", now=None):
+        """讀出各標的在 period 範圍內的 K 線：{ticker: OHLCV DataFrame}，無資料者略過。"""
+        now = now or datetime.now(timezone.utc)
+        start = _period_start(period, now)
+        parts = {}
+        for t in tickers:
+            df = self.read(t, interval, start)
+            if df.empty:
+                continue
+            if period.endswith("d"):
+                days = pd.Index(df.index.date).unique()[-int(period[:-1]):]
+                df = df[pd.Index(df.index.date).isin(days)]
+            parts[t] = df
+        return parts
+
+    def frame(self, tickers, period="5d", interval="15m", now=None):
+        """從本地庫組出與 yf.download(group_by='ticker') 相同結構的 DataFrame。"""
+        return combine(self.frames(tickers, period, interval, now), tickers)
+
+
+def combine(parts, tickers):
+    """{ticker: OHLCV} 合併為 ticker -> OHLCV 多層欄位；時區不一致時統一轉成 UTC。"""
+    parts = {t: parts[t] for t in tickers if t in parts}
+    if not parts:
+        return pd.DataFrame(columns=pd.MultiIndex.from_product([tickers, FIELDS]))
+    if len({str(df.index.tz) for df in parts.values()}) > 1:
+        parts = {t: df.tz_convert("UTC") for t, df in parts.items()}
+    return pd.concat(parts, axis=1).sort_index()
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_store():
+    """行程內共用的 BarStore。"""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = BarStore()
+        return _default_store
+
+
+def download_bars(tickers, period="5d", interval="15m"):
+    """取代 yf.download(tickers, period, interval, group_by='ticker')：先增量同步再讀本地庫。"""
+    store = get_store()
+    store.sync(tickers, period=period, interval=interval)
+    return store.frame(tickers, period=period, interval=interval)
@@ -0,0 +1,375 @@
+"""
+離線效能基準。
+
+以錄製好的 OHLCV 夾具 (3 / 50 / 500 / 2000 檔) 跑完整的儀表板資料流程，分段量測：
+  fetch       經本地替身抓取 → K 線庫增量寫入 → 共用快取 (冷啟動)
+  fetch_warm  同一份快取再讀一次 (命中)
+  valuation   向量化估值
+  trend       K 線金字塔聚合 (1 小時 / 日) 與組合走勢降採樣
+  figures     走勢、圓餅、K 線圖的建構與序列化 (送往瀏覽器的 JSON)
+  styling     持股明細表的篩選排序、分頁與 Styler 轉譯 (與 app.py 相同的路徑)
+每段回報多次執行的中位數時間、離散度 (MAD) 與單次執行的記憶體峰值 (tracemalloc)，可與存下的基準比較。
+時間的差距要同時超過「基準的 25%」、「絕對雜訊下限」與「兩次量測合併離散度的 4 倍」才列為退步，
+以結束碼 1 結束；比較至少需要 --repeat 5 次，次數太少時中位數本身就不可靠。全程不開瀏覽器、不連網。
+
+夾具預設是合成資料：亂數種子固定 (= 檔數)，任何機器產生的內容都相同，因此不納入版本控制，
+bench_fixtures/ 缺檔時會自動重新產生。record --yahoo 錄下的真實行情只留在本機。
+基準 (bench_baseline.json) 是本機的量測值，也不納入版本控制：同一台機器先存一次基準，之後的 run 才有比較對象。
+找不到基準、基準缺少某些項目、夾具與存基準時不同 (例如改錄了真實行情)、或量測次數不足時，run 以結束碼 2 結束。
+
+    python bench.py record                      # 產生合成夾具 (固定亂數種子)
+    python bench.py record --yahoo AAPL MSFT    # 錄製真實行情，複製到各規模
+    python bench.py run --save-baseline         # 量測並存成基準
+    python bench.py run                         # 量測並與基準比較
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# 所有資料庫與快取寫到暫存目錄，不碰使用者的 .gupiao
+_TMP = tempfile.mkdtemp(prefix="gupiao-bench-")
+os.environ["GUPIAO_DATA_DIR"] = _TMP
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import bar_store  # noqa: E402
+import holdings_view  # noqa: E402
+import market_cache  # noqa: E402
+import pyramid  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(HERE, "bench_fixtures")
+BASELINE = os.path.join(HERE, "bench_baseline.json")
+SIZES = [3, 50, 500, 2000]
+STAGES = ["fetch", "fetch_warm", "valuation", "trend", "figures", "styling"]
+PERIOD, INTERVAL = "5d", "15m"
+TOLERANCE = 0.25  # 比基準慢 / 多用 25% 以上視為退步
+NOISE_MS, NOISE_MB = 25.0, 1.0  # 低於這個絕對差距不算 (幾十 ms 以下的階段，前後兩次執行本來就會差這麼多)
+SPREAD_SIGMAS = 4.0  # 時間差距還要超過合併離散度的這個倍數
+MIN_REPEAT = 5  # 存基準或比較時每段至少量測的次數
+DEFAULT_REPEAT = 7
+
+
+# --- 夾具 ---
+def _fixture_path(size):
+    return os.path.join(FIXTURE_DIR, f"ohlcv_{size}.npz")
+
+
+def _save_fixture(size, tickers, ts, bars, tz):
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    np.savez_compressed(_fixture_path(size), tickers=np.array(tickers), ts=ts, bars=bars.astype(np.float32),
+                        tz=np.array(tz))
+
+
+def synthetic(size, days=7, seed=None):
+    """美股交易時段的 15 分 K (每天 26 根)，幾何隨機漫步，固定種子可重現。"""
+    rng = np.random.default_rng(size if seed is None else seed)
+    sessions = pd.bdate_range("2026-03-02", periods=days)
+    idx = pd.DatetimeIndex(np.concatenate([
+        pd.date_range(d + pd.Timedelta(hours=9, minutes=30), periods=26, freq="15min") for d in sessions
+    ])).tz_localize("America/New_York")
+    T = len(idx)
+    start = rng.uniform(5, 500, size)
+    close = start * np.exp(np.cumsum(rng.normal(0, 0.004, (T, size)), axis=0))
+    open_ = np.vstack([start, close[:-1]])
+    spread = np.abs(rng.normal(0, 0.002, (T, size))) * close
+    high = np.maximum(open_, close) + spread
+    low = np.minimum(open_, close) - spread
+    volume = rng.integers(1_000, 1_000_000, (T, size)).astype(float)
+    bars = np.stack([open_, high, low, close, volume], axis=-1).transpose(1, 0, 2)  # (N, T, 5)
+    tickers = [f"S{i:04d}" for i in range(size)]
+    return tickers, idx.tz_convert("UTC").as_unit("ns").asi8, bars, "America/New_York"
+
+
+def record(sizes, yahoo=None):
+    if yahoo:
+        frames = bar_store.yf_fetch(yahoo, INTERVAL, period="7d")
+        if not frames:
+            sys.exit("無法下載任何行情，請確認網路與代碼")
+        base = next(iter(frames.values())).index
+        tz = str(base.tz)
+        real = [t for t, df in frames.items() if len(df)]
+        aligned = np.stack([frames[t].reindex(base)[bar_store.FIELDS].to_numpy(dtype=float) for t in real])
+    for size in sizes:
+        if yahoo:
+            # 真實行情不夠多檔時循環複製，代碼加上編號以免重複
+            picks = [k % len(real) for k in range(size)]
+            tickers = [f"{real[k]}~{i}" for i, k in enumerate(picks)]
+            _save_fixture(size, tickers, base.tz_convert("UTC").as_unit("ns").asi8, aligned[picks], tz)
+        else:
+            _save_fixture(size, *synthetic(size))
+        print(f"fixture {size:>5} 檔 -> {_fixture_path(size)}")
+
+
+def fixture_digest(size):
+    """夾具內容的指紋；存進基準，比較時確認量測的是同一份資料。"""
+    if not os.path.exists(_fixture_path(size)):
+        _save_fixture(size, *synthetic(size))
+    with open(_fixture_path(size), "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:12]
+
+
+def load_fixture(size):
+    if not os.path.exists(_fixture_path(size)):
+        _save_fixture(size, *synthetic(size))
+    with np.load(_fixture_path(size)) as z:
+        tickers, ts, bars, tz = list(z["tickers"]), z["ts"], z["bars"].astype(float), str(z["tz"])
+    idx = pd.DatetimeIndex(pd.to_datetime(ts, utc=True)).tz_convert(tz)
+    idx.name = "Datetime"
+    return {t: pd.DataFrame(bars[i], index=idx, columns=bar_store.FIELDS) for i, t in enumerate(tickers)}
+
+
+class StandIn:
+    """取代 yf_fetch 的本地替身：同樣的簽名，依 start 從夾具切出 K 線。"""
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.now = max(df.index[-1] for df in frames.values()).tz_convert("UTC").to_pydatetime()
+
+    def __call__(self, tickers, interval, period=None, start=None):
+        out = {}
+        for t in tickers:
+            df = self.frames.get(t)
+            if df is not None:
+                out[t] = df if start is None else df[df.index.date >= pd.Timestamp(start).date()]
+        return out
+
+
+# --- 各段流程 ---
+class Pipeline:
+    def __init__(self, size):
+        self.frames = load_fixture(size)
+        self.tickers = list(self.frames)
+        rng = np.random.default_rng(size)
+        last = np.array([df["Close"].iloc[-1] for df in self.frames.values()])
+        self.portfolio = [
+            {"ticker": t, "shares": float(s), "cost": float(c)}
+            for t, s, c in zip(self.tickers, rng.integers(1, 500, size), last * rng.uniform(0.6, 1.4, size))
+        ]
+        self.fetch = StandIn(self.frames)
+        self.cache = None
+        self.raw = self.val = None
+
+    def _loader(self, store):
+        def load(tickers, period, interval):
+            store.sync(tickers, period=period, interval=interval, fetch=self.fetch, now=self.fetch.now)
+            if interval == pyramid.BASE:
+                pyramid.update_many(tickers, store)
+            frames = store.frames(tickers, period=period, interval=interval, now=self.fetch.now)
+            return {t: frames.get(t) for t in tickers}
+        return load
+
+    def setup_fetch(self):
+        path = tempfile.mkdtemp(dir=_TMP)
+        self.store = bar_store.BarStore(os.path.join(path, "bars.sqlite"))
+        self.cache = market_cache.MarketCache(loader=self._loader(self.store))
+
+    def fetch_cold(self):
+        frames = self.cache.get_many(self.tickers, PERIOD, INTERVAL)
+        self.raw = bar_store.combine({t: df for t, df in frames.items() if df is not None}, self.tickers)
+
+    def fetch_warm(self):
+        frames = self.cache.get_many(self.tickers, PERIOD, INTERVAL)
+        return bar_store.combine({t: df for t, df in frames.items() if df is not None}, self.tickers)
+
+    def valuation(self):
+        from valuation import value_portfolio
+
+        self.val = value_portfolio(self.raw, self.portfolio)
+
+    def trend(self):
+        from downsample import downsample_series
+
+        levels = {lv: [pyramid.aggregate(df, lv) for df in self.frames.values()] for lv in ("1h", "1d")}
+        return levels, downsample_series(self.val.trend)
+
+    def figures(self):
+        import plotly.express as px
+        import plotly.graph_objects as go
+
+        from downsample import downsample_ohlc, downsample_series
+
+        trend = downsample_series(self.val.trend)
+        fig_trend = go.Figure(go.Scatter(x=trend.index, y=trend.values, mode='lines'))
+        fig_trend.update_layout(template="plotly_dark", height=450)
+        h = self.val.holdings()
+        fig_pie = px.pie(pd.DataFrame({"市值": h["market_value"], "股票": h["ticker"]}), values='市值', names='股票', hole=0.4)
+        bars = downsample_ohlc(self.frames[self.tickers[0]])
+        fig_k = go.Figure(go.Candlestick(x=bars.index, open=bars['Open'], high=bars['High'],
+                                         low=bars['Low'], close=bars['Close']))
+        fig_k.update_layout(template="plotly_dark", height=500, xaxis_rangeslider_visible=False)
+        return [f.to_json() for f in (fig_trend, fig_pie, fig_k)]
+
+    def styling(self):
+        h = self.val.holdings()
+        results = pd.DataFrame({
+            "股票": h["ticker"], "股數": h["shares"], "平均成本": h["cost"],
+            "目前市價": h["price"].round(2), "市值": h["market_value"].round(2),
+            "損益": h["profit"].round(2), "百分比": h["profit_pct"]
+        })
+        page, _ = holdings_view.page_slice(holdings_view.query(results, sort_by="市值", descending=True), 1)
+        return holdings_view.style_table(page, ['損益', '百分比'], {"百分比": "{:.2f}%"}).to_html()
+
+
+def _stage_calls(p):
+    """stage -> (每次量測前的準備, 被量測的函式)。"""
+    return {
+        "fetch": (p.setup_fetch, p.fetch_cold),
+        "fetch_warm": (None, p.fetch_warm),
+        "valuation": (None, p.valuation),
+        "trend": (None, p.trend),
+        "figures": (None, p.figures),
+        "styling": (None, p.styling),
+    }
+
+
+def measure(size, stages, repeat):
+    p = Pipeline(size)
+    calls = _stage_calls(p)
+    # 後段依賴前段的結果，且第一次呼叫含模組載入：先把整條流程跑一次暖身
+    for name in STAGES:
+        setup, fn = calls[name]
+        if setup:
+            setup()
+        fn()
+    out = {}
+    for name in stages:
+        setup, fn = calls[name]
+        times = []
+        for _ in range(repeat):
+            if setup:
+                setup()
+            t0 = time.perf_counter()
+            fn()
+            times.append((time.perf_counter() - t0) * 1000)
+        if setup:
+            setup()
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        out[f"{size}/{name}"] = {"ms": statistics.median(times), "mad_ms": mad(times), "repeat": repeat,
+                                 "peak_mb": peak / 2**20}
+    return out
+
+
+def mad(times):
+    """中位數絕對離差，換算成常態分布的標準差尺度；不受偶發的慢一次影響。"""
+    m = statistics.median(times)
+    return 1.4826 * statistics.median(abs(t - m) for t in times)
+
+
+def time_margin(base, cur, tolerance=TOLERANCE):
+    """目前時間要比基準多出這麼多 ms 才算退步。"""
+    spread = (base.get("mad_ms", 0.0) ** 2 + cur.get("mad_ms", 0.0) ** 2) ** 0.5
+    return max(base["ms"] * tolerance, NOISE_MS, SPREAD_SIGMAS * spread)
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """回傳退步清單 [(key, 指標, 基準, 目前)]。"""
+    worse = []
+    for key, cur in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        if cur["ms"] - base["ms"] > time_margin(base, cur, tolerance):
+            worse.append((key, "ms", base["ms"], cur["ms"]))
+        if cur["peak_mb"] > base["peak_mb"] * (1 + tolerance) and cur["peak_mb"] - base["peak_mb"] > NOISE_MB:
+            worse.append((key, "peak_mb", base["peak_mb"], cur["peak_mb"]))
+    return worse
+
+
+def check_baseline(results, baseline, fixtures, path, repeat=MIN_REPEAT):
+    """無法比較的原因 (空清單表示可以比較)。"""
+    if not baseline:
+        return [f"找不到基準 {path}，請先執行 python bench.py run --save-baseline"]
+    problems = []
+    if repeat < MIN_REPEAT:
+        problems.append(f"--repeat {repeat} 太少，比較至少需要 {MIN_REPEAT} 次")
+    thin = [key for key, base in baseline.get("results", {}).items() if base.get("repeat", 0) < MIN_REPEAT]
+    if thin:
+        problems.append(f"基準的量測次數不足 ({', '.join(thin)})，請以 --repeat {MIN_REPEAT} 以上重新存基準")
+    missing = [key for key in results if key not in baseline.get("results", {})]
+    if missing:
+        problems.append(f"基準裡沒有 {', '.join(missing)}，請重新存基準")
+    for size, digest in fixtures.items():
+        saved = baseline.get("fixtures", {}).get(str(size))
+        if saved != digest:
+            problems.append(f"{size} 檔的夾具與存基準時不同 ({saved} -> {digest})，請重新存基準")
+    return problems
+
+
+def report(results, baseline):
+    print(f"{'規模/階段':<18}{'中位數 ms':>12}{'MAD':>8}{'峰值 MB':>10}{'基準 ms':>12}{'變化':>9}")
+    for key, cur in results.items():
+        base = baseline.get(key)
+        delta = f"{(cur['ms'] / base['ms'] - 1) * 100:+.0f}%" if base and base["ms"] else ""
+        base_ms = f"{base['ms']:.1f}" if base else "-"
+        print(f"{key:<18}{cur['ms']:>12.1f}{cur['mad_ms']:>8.1f}{cur['peak_mb']:>10.1f}{base_ms:>12}{delta:>9}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="離線效能基準")
+    sub = ap.add_subparsers(dest="cmd")
+    rec = sub.add_parser("record", help="產生 / 錄製 OHLCV 夾具")
+    rec.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    rec.add_argument("--yahoo", nargs="+", metavar="TICKER", help="改用真實行情 (需要網路)")
+    run = sub.add_parser("run", help="量測各階段")
+    run.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    run.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    run.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    run.add_argument("--baseline", default=BASELINE)
+    run.add_argument("--save-baseline", action="store_true")
+    run.add_argument("--tolerance", type=float, default=TOLERANCE)
+    run.add_argument("--json", help="另把結果寫成 JSON")
+    args = ap.parse_args(argv)
+
+    try:
+        if args.cmd == "record":
+            record(args.sizes, args.yahoo)
+            return 0
+        if args.cmd is None:
+            args = run.parse_args([])
+        if args.save_baseline and args.repeat < MIN_REPEAT:
+            print(f"存基準至少需要 --repeat {MIN_REPEAT}", file=sys.stderr)
+            return 2
+        results = {}
+        fixtures = {size: fixture_digest(size) for size in args.sizes}
+        for size in args.sizes:
+            results.update(measure(size, args.stages, args.repeat))
+        baseline = {}
+        if os.path.exists(args.baseline) and not args.save_baseline:
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+        report(results, baseline.get("results", {}))
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+        if args.save_baseline:
+            with open(args.baseline, "w", encoding="utf-8") as f:
+                json.dump({"fixtures": {str(k): v for k, v in fixtures.items()}, "results": results}, f, indent=2)
+            print(f"基準已寫入 {args.baseline}")
+            return 0
+        problems = check_baseline(results, baseline, fixtures, args.baseline, args.repeat)
+        if problems:
+            for msg in problems:
+                print(f"無法比較: {msg}", file=sys.stderr)
+            return 2
+        worse = compare(results, baseline["results"], args.tolerance)
+        for key, metric, base, cur in worse:
+            print(f"退步: {key} {metric} {base:.1f} -> {cur:.1f}")
+        return 1 if worse else 0
+    finally:
+        shutil.rmtree(_TMP, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
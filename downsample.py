@@ -0,0 +1,93 @@
+"""
+圖表資料降採樣。
+
+每條 trace 送到瀏覽器的點數上限為 MAX_POINTS：
+- 折線 / 面積圖用 LTTB (Largest-Triangle-Three-Buckets)，保留視覺上的高低點
+- K 線圖把連續 K 線分桶合併 (開盤取第一根、最高取最大、最低取最小、收盤取最後一根)
+使用者縮小顯示區間時，只對區間內的資料重新降採樣，細節會跟著回來。
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+MAX_POINTS = int(os.environ.get("GUPIAO_MAX_POINTS", 1500))
+
+
+def lttb_indices(x, y, n_out):
+    """LTTB 選點，回傳保留下來的索引 (含頭尾)。x, y 為等長的 float 陣列。"""
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    # 中間 n-2 個點平均切成 n_out-2 個桶
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    out = np.empty(n_out, dtype=int)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        # 下一個桶的平均點
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        # 與前一個選點、下一桶平均點構成的三角形面積最大者
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def _x_values(index):
+    if isinstance(index, pd.DatetimeIndex):
+        return index.as_unit("s").asi8.astype(float)
+    return np.arange(len(index), dtype=float)
+
+
+def downsample_series(s, max_points=MAX_POINTS):
+    """折線 / 面積圖用：以 LTTB 把 Series 壓到 max_points 點以內。"""
+    s = s.dropna()
+    if len(s) <= max_points:
+        return s
+    idx = lttb_indices(_x_values(s.index), s.to_numpy(dtype=float), max_points)
+    return s.iloc[idx]
+
+
+def downsample_ohlc(df, max_points=MAX_POINTS):
+    """K 線圖用：每 k 根連續 K 線合併成一根，保留真正的最高 / 最低點。"""
+    df = df.dropna(subset=["Open", "High", "Low", "Close"])
+    n = len(df)
+    if n <= max_points:
+        return df
+    k = -(-n // max_points)
+    starts = np.arange(0, n, k)
+    ends = np.minimum(starts + k, n) - 1
+    out = pd.DataFrame({
+        "Open": df["Open"].to_numpy()[starts],
+        "High": np.maximum.reduceat(df["High"].to_numpy(), starts),
+        "Low": np.minimum.reduceat(df["Low"].to_numpy(), starts),
+        "Close": df["Close"].to_numpy()[ends],
+    }, index=df.index[starts])
+    if "Volume" in df:
+        out["Volume"] = np.add.reduceat(np.nan_to_num(df["Volume"].to_numpy(dtype=float)), starts)
+    return out
+
+
+def window(obj, start=None, end=None):
+    """取出 [start, end] 區間，用於縮放後重新降採樣。"""
+    if start is None and end is None:
+        return obj
+    return obj.loc[start:end]
+
+
+def zoom_slider(index, key, label="顯示區間"):
+    """資料點超過上限時顯示時間區間滑桿，回傳 (start, end)；否則回傳 (None, None)。"""
+    if len(index) <= MAX_POINTS or not isinstance(index, pd.DatetimeIndex):
+        return None, None
+    import streamlit as st
+
+    tz = index.tz
+    lo, hi = (ts.tz_localize(None).to_pydatetime() for ts in (index[0], index[-1]))
+    start, end = st.slider(label, min_value=lo, max_value=hi, value=(lo, hi), format="MM/DD HH:mm", key=key)
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    if tz is not None:
+        start, end = start.tz_localize(tz), end.tz_localize(tz)
+    return start, end
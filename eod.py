@@ -0,0 +1,501 @@
+"""
+每日收盤快照與長期損益走勢。
+
+美股收盤後 (紐約時間 16:15，等最後一根 K 線定稿) 由背景執行緒對每個投資組合記一筆：
+每檔持股的股數、成本、收盤價、匯率、市值與損益，以及整個組合的合計。
+資料寫進 .gupiao/eod/ 下的欄式檔案，只附加、不改寫：
+
+    eod/totals/<欄位>.<dtype>     每個投資組合每天一列
+    eod/holdings/<欄位>.<dtype>   每檔持股每天一列
+    eod/symbols.json             投資組合 / 代碼字串 -> 整數編號
+
+每個欄位是一個 NumPy 原始陣列檔 (tofile 附加、fromfile 讀回)，讀取一個欄位就是一次連續讀檔，
+多年的日資料也只有幾萬列；長期走勢圖直接由這裡讀出，不必重新下載多年 K 線或重算過去的估值。
+同一天重複寫入 (重新執行、休市日) 時，讀取以最後寫入的那一筆為準。
+
+快照只用收盤時間以前的 K 線：伺服器在盤中重啟補記前一個交易日時，不會把即時價當成收盤價；
+抓不到行情或寫入失敗時以退避加抖動稍後重試，而不是等到下一次收盤。
+
+儀表板、headless 服務與 cron 都可能寫入同一份紀錄：每次寫入 (含字串編號) 都在
+eod/.lock 的跨行程檔案鎖內進行；排程執行緒另以 eod/scheduler.lock 選出一個行程負責記錄，
+其他行程的排程只在那個行程結束後接手。
+
+    python eod.py snapshot   # 立即記一筆 (可交給 cron / 工作排程器)
+    python eod.py show [--portfolio default]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from bar_store import DATA_DIR
+from fx import currency_of, rate_on, total_in, value_portfolio_in
+from ledger import DEFAULT_PORTFOLIO, get_ledger
+from poller import latest_bars
+from resilience import backoff
+
+EOD_DIR = os.path.join(DATA_DIR, "eod")
+ENABLED = os.environ.get("GUPIAO_EOD", "1") != "0"
+CLOSE_TZ = "America/New_York"
+CLOSE_AT = (16, 15)  # 收盤後 15 分鐘
+RETRY_BASE, RETRY_MAX = 30.0, 1800.0  # 快照失敗後的重試退避 (秒)
+EPOCH = pd.Timestamp("1970-01-01")
+
+TOTALS = {
+    "day": "i4", "pid": "i4", "market_value": "f8", "cost": "f8", "profit": "f8",
+    "realized": "f8", "usd_twd": "f8", "written_at": "f8",
+}
+HOLDINGS = {
+    "day": "i4", "pid": "i4", "ticker": "i4", "shares": "f8", "cost": "f8",
+    "price": "f8", "fx": "f8", "market_value": "f8", "profit": "f8", "written_at": "f8",
+}
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+log = logging.getLogger(__name__)
+
+
+def _try_lock(f, blocking=True):
+    """對已開啟的鎖檔取得獨占鎖；blocking=False 時拿不到就回傳 False。"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        if blocking:
+            raise
+        return False
+
+
+def _unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(path):
+    """跨行程的互斥鎖 (鎖檔)；同一行程內不同執行緒各自開檔，也會互相排隊。"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a+b") as f:
+        _try_lock(f)
+        try:
+            yield
+        finally:
+            _unlock(f)
+
+
+class ColumnTable:
+    """只附加的欄式資料表：每個欄位一個原始陣列檔。附加在 folder/.lock 的跨行程鎖內進行。"""
+
+    def __init__(self, folder, schema):
+        self.folder = folder
+        self.schema = {name: np.dtype(dt) for name, dt in schema.items()}
+        self._lock = threading.Lock()
+        self._memo = (None, None)  # (各檔大小, 讀出的欄位)
+
+    def _path(self, name):
+        return os.path.join(self.folder, f"{name}.{self.schema[name].str[1:]}")
+
+    def _sizes(self):
+        return tuple(os.path.getsize(self._path(n)) if os.path.exists(self._path(n)) else 0 for n in self.schema)
+
+    def rows(self):
+        """完整的列數：寫到一半中斷時各欄長度可能不同，以最短的為準。"""
+        return min(size // dt.itemsize for size, dt in zip(self._sizes(), self.schema.values()))
+
+    def append(self, columns):
+        """columns: {欄位: 等長的陣列}；回傳附加的列數。"""
+        arrays = {name: np.ascontiguousarray(columns[name], dtype=dt) for name, dt in self.schema.items()}
+        n = len(arrays["day"])
+        if any(len(a) != n for a in arrays.values()):
+            raise ValueError("columns must have the same length")
+        if not n:
+            return 0
+        with self._lock, file_lock(os.path.join(self.folder, ".lock")):
+            # 先把上次中斷留下的半列截掉，各欄才會對齊
+            complete = self.rows()
+            for name, dt in self.schema.items():
+                path = self._path(name)
+                if os.path.exists(path) and os.path.getsize(path) != complete * dt.itemsize:
+                    os.truncate(path, complete * dt.itemsize)
+            for name, arr in arrays.items():
+                with open(self._path(name), "ab") as f:
+                    arr.tofile(f)
+        return n
+
+    def read(self):
+        """{欄位: ndarray}；檔案沒有變動時直接回傳上次讀出的陣列。"""
+        sizes = self._sizes()
+        with self._lock:
+            if self._memo[0] == sizes:
+                return self._memo[1]
+        n = min(size // dt.itemsize for size, dt in zip(sizes, self.schema.values()))
+        cols = {
+            name: np.fromfile(self._path(name), dtype=dt, count=n) if n else np.empty(0, dtype=dt)
+            for name, dt in self.schema.items()
+        }
+        with self._lock:
+            self._memo = (sizes, cols)
+        return cols
+
+
+class EodStore:
+    def __init__(self, folder=EOD_DIR):
+        self.folder = folder
+        self.totals = ColumnTable(os.path.join(folder, "totals"), TOTALS)
+        self.holdings = ColumnTable(os.path.join(folder, "holdings"), HOLDINGS)
+        self._symbols_path = os.path.join(folder, "symbols.json")
+        self._lock_path = os.path.join(folder, ".lock")
+        self._write_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._symbols = None
+        self._frames = {}  # (表名, 檔案大小) -> 去重後的 DataFrame
+
+    # --- 字串編號 ---
+    def _load_symbols(self):
+        if self._symbols is None:
+            try:
+                with open(self._symbols_path, encoding="utf-8") as f:
+                    self._symbols = json.load(f)
+            except (OSError, ValueError):
+                self._symbols = []
+        return self._symbols
+
+    def codes(self, names):
+        """字串 -> 編號；新字串先寫進 symbols.json 再回傳，資料列永遠不會指向不存在的編號。"""
+        with self._write_lock, file_lock(self._lock_path):
+            return self._codes(names)
+
+    def _codes(self, names):
+        # 需持有 eod/.lock：先重新讀取 symbols.json，才不會蓋掉其他行程剛新增的字串
+        with self._lock:
+            self._symbols = None
+            symbols = self._load_symbols()
+            index = {s: i for i, s in enumerate(symbols)}
+            new = [s for s in dict.fromkeys(names) if s not in index]
+            if new:
+                symbols.extend(new)
+                index.update((s, i) for i, s in enumerate(symbols))
+                os.makedirs(self.folder, exist_ok=True)
+                tmp = f"{self._symbols_path}.{os.getpid()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(symbols, f, ensure_ascii=False)
+                os.replace(tmp, self._symbols_path)
+            return np.array([index[s] for s in names], dtype="i4")
+
+    def symbols(self):
+        with self._lock:
+            self._symbols = None  # 其他行程可能新增過
+            return np.array(self._load_symbols(), dtype=object)
+
+    # --- 寫入 ---
+    def write(self, day, pid, holdings, realized=0.0, usd_twd=np.nan):
+        """記一筆收盤快照。holdings 為 Valuation.holdings() 加上 fx 欄位 (報價幣別 -> USD)。"""
+        d = np.int32((pd.Timestamp(day).normalize() - EPOCH).days)
+        n = len(holdings)
+        market = float(np.nansum(holdings["market_value"]))
+        cost = float(np.nansum(holdings["cost_basis"]))
+        # 整筆快照 (編號、持股、合計) 在同一把跨行程鎖內寫完，不會和其他行程交錯
+        with self._write_lock, file_lock(self._lock_path):
+            p = self._codes([pid])[0]
+            now = time.time()
+            self.holdings.append({
+                "day": np.full(n, d), "pid": np.full(n, p), "ticker": self._codes(list(holdings["ticker"])),
+                "shares": holdings["shares"], "cost": holdings["cost"], "price": holdings["price"],
+                "fx": holdings["fx"], "market_value": holdings["market_value"], "profit": holdings["profit"],
+                "written_at": np.full(n, now),
+            })
+            self.totals.append({
+                "day": [d], "pid": [p], "market_value": [market], "cost": [cost], "profit": [market - cost],
+                "realized": [realized], "usd_twd": [usd_twd], "written_at": [now],
+            })
+
+    # --- 讀取 ---
+    def _frame(self, name, table, keys):
+        cols = table.read()
+        cache_key = (name, len(cols["day"]))
+        with self._lock:
+            df = self._frames.get(cache_key)
+        if df is not None:
+            return df
+        df = pd.DataFrame(cols)
+        # 只附加的檔案：同一投資組合同一天只取最後一次寫入的那一批
+        latest = df.groupby(["pid", "day"])["written_at"].transform("max")
+        df = df[df["written_at"] == latest].sort_values(keys, kind="stable").reset_index(drop=True)
+        df["date"] = EPOCH + pd.to_timedelta(df["day"], unit="D")
+        with self._lock:
+            self._frames = {k: v for k, v in self._frames.items() if k[0] != name}
+            self._frames[cache_key] = df
+        return df
+
+    def history(self, pid):
+        """某投資組合每個交易日的合計 (USD)：以日期為索引的 DataFrame。"""
+        df = self._frame("totals", self.totals, ["pid", "day"])
+        code = self._code(pid)
+        out = df[df["pid"] == code] if code is not None else df.iloc[:0]
+        return out.set_index("date")[["market_value", "cost", "profit", "realized", "usd_twd"]]
+
+    def holdings_history(self, pid, ticker=None):
+        """每檔持股每個交易日一列；ticker 給定時只回傳該檔。"""
+        df = self._frame("holdings", self.holdings, ["pid", "day", "ticker"])
+        code = self._code(pid)
+        out = df[df["pid"] == code] if code is not None else df.iloc[:0]
+        if ticker is not None:
+            t = self._code(ticker)
+            out = out[out["ticker"] == t] if t is not None else out.iloc[:0]
+        out = out.assign(ticker=self.symbols()[out["ticker"].to_numpy()])
+        return out.set_index("date").drop(columns=["day", "pid", "written_at"])
+
+    def last_day(self, pid=None):
+        df = self._frame("totals", self.totals, ["pid", "day"])
+        if pid is not None:
+            df = df[df["pid"] == self._code(pid)]
+        return df["date"].max() if len(df) else None
+
+    def _code(self, name):
+        with self._lock:
+            for reload in (False, True):
+                if reload:
+                    self._symbols = None  # 可能是其他行程 (排程、命令列) 新增的
+                try:
+                    return self._load_symbols().index(name)
+                except ValueError:
+                    continue
+            return None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = EodStore()
+        return _store
+
+
+def history(pid):
+    return get_store().history(pid)
+
+
+# --- 收盤快照 ---
+def _session_day(index):
+    """最後一根 K 線在交易所時區的日期 (休市日重複寫入時會落在前一個交易日)。"""
+    ts = pd.Timestamp(index[-1])
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert(CLOSE_TZ)
+    return ts.tz_localize(None).normalize()
+
+
+def snapshot(pid, ledger=None, store=None, period="5d", interval="15m", close=None):
+    """以 close (預設為最近一次已過的收盤) 以前的最後一根 K 線替 pid 記一筆；回傳寫入的持股列數。
+
+    close 之後的 K 線 (盤中的即時價) 一律不用；有持股卻沒有可用行情時丟 LookupError。
+    """
+    ledger = ledger or get_ledger()
+    store = store or get_store()
+    close = last_close() if close is None else close
+    portfolio = ledger.positions(pid)
+    if not portfolio:
+        return 0
+    tickers = list(dict.fromkeys(item['ticker'] for item in portfolio))
+    raw = latest_bars(tickers, period=period, interval=interval)
+    raw = raw[raw.index <= close]
+    if raw.empty:
+        raise LookupError(f"{pid}: {close} 以前沒有行情")
+    val = value_portfolio_in(raw, portfolio, "USD", period, interval)
+    if not val.tickers:
+        raise LookupError(f"{pid}: 持股都查無行情")
+    # 匯率也取收盤當時的值
+    at = pd.DatetimeIndex([val.index[-1]])
+    h = val.holdings()
+    rates = {c: float(rate_on(at, c, "USD", period, interval)[0]) for c in {currency_of(t) for t in val.tickers}}
+    h["fx"] = [rates[currency_of(t)] for t in h["ticker"]]
+    usd_twd = float(rate_on(at, "USD", "TWD", period, interval)[0])
+    realized = total_in(ledger.realized_by_ticker(pid), "USD", period, interval)
+    store.write(_session_day(val.index), pid, h, realized, usd_twd)
+    return len(h)
+
+
+def snapshot_all(ledger=None, store=None, pids=None, close=None):
+    """所有 (或指定的) 投資組合各記一筆；單一組合失敗不影響其他組合，失敗者對應 None。"""
+    ledger = ledger or get_ledger()
+    written = {}
+    for pid in ledger.portfolio_ids() if pids is None else pids:
+        try:
+            written[pid] = snapshot(pid, ledger, store, close=close)
+        except Exception:
+            log.exception("eod snapshot for %s failed", pid)
+            written[pid] = None
+    return written
+
+
+def last_close(now=None):
+    """最近一次已過的收盤快照時間 (紐約時間，週一至週五)。"""
+    now = pd.Timestamp.now(tz=CLOSE_TZ) if now is None else pd.Timestamp(now).tz_convert(CLOSE_TZ)
+    at = now.normalize() + pd.Timedelta(hours=CLOSE_AT[0], minutes=CLOSE_AT[1])
+    if at > now:
+        at -= pd.Timedelta(days=1)
+    while at.weekday() >= 5:
+        at -= pd.Timedelta(days=1)
+    return at
+
+
+def next_close(now=None):
+    now = pd.Timestamp.now(tz=CLOSE_TZ) if now is None else pd.Timestamp(now).tz_convert(CLOSE_TZ)
+    at = last_close(now) + pd.Timedelta(days=1)
+    while at.weekday() >= 5:
+        at += pd.Timedelta(days=1)
+    return at
+
+
+class Scheduler:
+    """每個行程一條背景執行緒：睡到下一次收盤時間，醒來替所有投資組合記一筆。
+
+    同一份紀錄只由一個行程負責：拿到 scheduler.lock 的排程才會寫入，並一直持有到行程結束；
+    其他行程每次醒來再試一次，負責的行程結束後就由它們接手。
+    有投資組合記錄失敗時，只重試那些組合，間隔以退避加抖動遞增 (上限 RETRY_MAX)。
+    """
+
+    def __init__(self, store=None, ledger=None):
+        self.store = store or get_store()
+        self.ledger = ledger
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._lease = None  # 持有 scheduler.lock 的檔案
+        self.last_run = None
+
+    def leader(self):
+        """本行程是否負責寫入 (第一次拿到鎖後就一直持有)。"""
+        with self._lock:
+            if self._lease is None:
+                os.makedirs(self.store.folder, exist_ok=True)
+                f = open(os.path.join(self.store.folder, "scheduler.lock"), "a+b")
+                if _try_lock(f, blocking=False):
+                    self._lease = f
+                else:
+                    f.close()
+            return self._lease is not None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="eod-scheduler", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def due(self, now=None):
+        """伺服器在收盤後才啟動、或錯過上一次排程時，補記最近一個交易日。"""
+        last = self.store.last_day()
+        return last is None or last < last_close(now).tz_localize(None).normalize()
+
+    def run_once(self, pids=None, now=None):
+        """記最近一次已過的收盤；回傳失敗 (要重試) 的投資組合。"""
+        written = snapshot_all(self.ledger, self.store, pids=pids, close=last_close(now))
+        return [pid for pid, n in written.items() if n is None]
+
+    def _run(self):
+        attempt, retry = 0, None  # retry: 下一輪只重試這些投資組合 (None 為全部)
+        while not self._stop.is_set():
+            wait = None
+            if self.leader() and (attempt or self.due()):
+                try:
+                    failed = self.run_once(retry)
+                    retry = failed or None
+                except Exception:
+                    log.exception("eod snapshot failed")
+                    failed = True
+                if failed:
+                    attempt += 1
+                    wait = backoff(attempt, RETRY_BASE, RETRY_MAX)
+                    log.warning("eod snapshot incomplete, retry %d in %.0fs", attempt, wait)
+                else:
+                    attempt = 0
+                    self.last_run = time.time()
+            if wait is None:
+                wait = max((next_close() - pd.Timestamp.now(tz=CLOSE_TZ)).total_seconds(), 60)
+            self._stop.wait(wait)
+        # 停止後交出負責權，讓其他行程的排程接手
+        with self._lock:
+            if self._lease is not None:
+                self._lease.close()
+                self._lease = None
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def enable():
+    """啟動收盤快照排程 (行程內只有一個)；GUPIAO_EOD=0 時不啟動。"""
+    global _scheduler
+    if not ENABLED:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+        return _scheduler.start()
+
+
+# --- 圖表 ---
+def history_figure(hist, currency="USD", rate=1.0):
+    """長期市值 / 成本 (上) 與未實現、已實現損益 (下)；rate 可為純量或逐日匯率 Series。"""
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    from downsample import downsample_series
+
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.65, 0.35], vertical_spacing=0.04)
+    for col, name, color in [("market_value", "市值", "#00ffcc"), ("cost", "成本", "#888888")]:
+        s = downsample_series(hist[col] * rate)
+        fig.add_trace(go.Scatter(x=s.index, y=s.values, mode="lines", name=name, line=dict(color=color)), 1, 1)
+    for col, name, color in [("profit", "未實現損益", "#ffaa00"), ("realized", "已實現損益", "#6699ff")]:
+        s = downsample_series(hist[col] * rate)
+        fig.add_trace(go.Scatter(x=s.index, y=s.values, mode="lines", name=name, line=dict(color=color)), 2, 1)
+    fig.update_layout(template="plotly_dark", height=450, hovermode="x unified",
+                      yaxis_title=f"市值 ({currency})", yaxis2_title=f"損益 ({currency})")
+    return fig
+
+
+# --- CLI ---
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="每日收盤快照")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("snapshot", help="立即替所有投資組合記一筆")
+    show = sub.add_parser("show", help="列出一個投資組合的每日合計")
+    show.add_argument("--portfolio", default=DEFAULT_PORTFOLIO)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "snapshot":
+        print(json.dumps(snapshot_all(), ensure_ascii=False))
+    else:
+        print(history(args.portfolio).to_string(float_format=lambda x: f"{x:,.2f}"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""
+多幣別匯率引擎。
+
+- 每種貨幣只抓一條「1 美元可換多少該貨幣」的序列 (Yahoo 的 "TWD=X"、"JPY=X" ...)，
+  任兩種貨幣之間的匯率都經由美元交叉換算
+- 匯率序列走共用的背景輪詢快照與本地 K 線庫，整個伺服器行程只抓一次並增量更新
+- 走勢曲線以 as-of 對齊 (每個時間點取當時或之前最近的匯率) 逐點換算，而不是整段乘上今天的匯率
+- 台股 (.TW) 等非美元報價的持股先換成報告幣別再估值；某種貨幣抓不到匯率時，
+  只有該幣別的持股列為缺漏，其餘照常估值
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+import metadata
+from poller import latest_bars
+from valuation import close_frame, value_from_closes
+
+# 抓不到匯率時的參考值 (1 USD = ?)
+FALLBACK_PER_USD = {"TWD": 32.5}
+
+# 以輔幣報價的幣別 (Yahoo 的 currency 欄位如倫敦的 "GBp")：(主幣, 1 主幣 = ? 輔幣)
+SUBUNITS = {"GBp": ("GBP", 100), "GBX": ("GBP", 100), "ZAc": ("ZAR", 100), "ILA": ("ILS", 100)}
+
+# 交易所代碼後綴 -> 報價幣別 (公司資料尚未解析完成時使用)
+SUFFIX_CURRENCY = {
+    ".TW": "TWD", ".TWO": "TWD", ".HK": "HKD", ".T": "JPY", ".KS": "KRW", ".KQ": "KRW",
+    ".SS": "CNY", ".SZ": "CNY", ".DE": "EUR", ".PA": "EUR", ".AS": "EUR",
+    ".TO": "CAD", ".AX": "AUD", ".SI": "SGD",
+}
+
+
+log = logging.getLogger(__name__)
+
+
+def usd_symbol(currency):
+    return f"{SUBUNITS.get(currency, (currency,))[0]}=X"
+
+
+def currency_of(ticker):
+    """標的的報價幣別：優先用已快取的公司資料，否則依代碼後綴判斷，預設 USD。"""
+    cur = metadata.get_service().get_many([ticker])[ticker].get("currency")
+    if cur:
+        return cur
+    if "." in ticker:
+        return SUFFIX_CURRENCY.get(ticker[ticker.rindex("."):].upper(), "USD")
+    return "USD"
+
+
+def rate_symbols(tickers, currency="USD"):
+    """把 tickers 的金額換成 currency 需要的匯率代碼 (美元不需要)。"""
+    currencies = dict.fromkeys([currency_of(t) for t in tickers] + [currency])
+    return list(dict.fromkeys(usd_symbol(c) for c in currencies if c != "USD"))
+
+
+def usd_rates(currencies, period="5d", interval="15m"):
+    """{貨幣: 1 USD 可換多少該貨幣的 Series}；從共用快照取得。
+
+    抓不到 (也沒有參考值) 的貨幣不列入結果，由呼叫端決定要略過或報錯。
+    """
+    currencies = [c for c in dict.fromkeys(currencies) if c != "USD"]
+    if not currencies:
+        return {}
+    raw = latest_bars(list(dict.fromkeys(usd_symbol(c) for c in currencies)), period=period, interval=interval)
+    out = {}
+    for c in currencies:
+        sym = usd_symbol(c)
+        major, units = SUBUNITS.get(c, (c, 1))
+        s = raw[sym]["Close"].dropna() if sym in raw else pd.Series(dtype=float)
+        if s.empty and major in FALLBACK_PER_USD:
+            s = pd.Series([FALLBACK_PER_USD[major]], index=pd.DatetimeIndex([pd.Timestamp(0, tz="UTC")]))
+        if s.empty:
+            log.warning("no %s rate available", sym)
+            continue
+        out[c] = s * units
+    return out
+
+
+def _require(rates, *currencies):
+    for c in currencies:
+        if c != "USD" and c not in rates:
+            raise LookupError(f"無法取得 {c} 匯率")
+
+
+def _utc_ns(index):
+    idx = pd.DatetimeIndex(index)
+    return (idx.tz_convert("UTC") if idx.tz is not None else idx).as_unit("ns").asi8
+
+
+def asof(rates, index):
+    """as-of 對齊：index 每個時間點取當時或之前最近的匯率 (最早之前用第一筆)，向量化。"""
+    rate_ts = _utc_ns(rates.index)
+    pos = np.clip(np.searchsorted(rate_ts, _utc_ns(index), side="right") - 1, 0, len(rate_ts) - 1)
+    return rates.to_numpy(dtype=float)[pos]
+
+
+def rate_on(index, base, quote, period="5d", interval="15m"):
+    """1 單位 base 在 index 各時間點可換多少 quote。"""
+    if base == quote:
+        return np.ones(len(index))
+    rates = usd_rates([base, quote], period, interval)
+    _require(rates, base, quote)
+    r = np.ones(len(index))
+    if quote != "USD":
+        r = r * asof(rates[quote], index)
+    if base != "USD":
+        r = r / asof(rates[base], index)
+    return r
+
+
+def spot(base, quote, period="5d", interval="15m"):
+    """最新匯率 (1 單位 base = ? quote)。"""
+    if base == quote:
+        return 1.0
+    rates = usd_rates([base, quote], period, interval)
+    _require(rates, base, quote)
+    q = rates[quote].iloc[-1] if quote != "USD" else 1.0
+    b = rates[base].iloc[-1] if base != "USD" else 1.0
+    return float(q / b)
+
+
+def convert(series, base, quote, period="5d", interval="15m"):
+    """把走勢逐點換成另一種貨幣 (用各時間點當時的匯率)。"""
+    if base == quote or len(series) == 0:
+        return series
+    return series * rate_on(series.index, base, quote, period, interval)
+
+
+def closes_in(closes, currency="USD", period="5d", interval="15m"):
+    """把收盤價矩陣各欄逐點換成 currency；回傳 (換算後的矩陣, {ticker: 成本換算用的現匯})。
+
+    多個投資組合共用同一份全標的矩陣時，整份只換一次。抓不到匯率的幣別整欄設為 NaN，
+    估值時與查無行情的標的一樣列入 missing；報告幣別本身抓不到匯率則丟 LookupError。
+    """
+    ccy = {t: currency_of(t) for t in closes.columns}
+    spots = dict.fromkeys(closes.columns, 1.0)
+    foreign = [t for t, c in ccy.items() if c != currency]
+    if not foreign:
+        return closes, spots
+    rates = usd_rates([currency, *(ccy[t] for t in foreign)], period, interval)
+    _require(rates, currency)
+    closes = closes.copy()
+    for c in dict.fromkeys(ccy[t] for t in foreign):
+        cols = [t for t in foreign if ccy[t] == c]
+        if c != "USD" and c not in rates:
+            log.warning("no %s rate, valuing without %s", c, cols)
+            closes[cols] = np.nan
+            continue
+        closes[cols] = closes[cols].to_numpy() * rate_on(closes.index, c, currency, period, interval)[:, None]
+        spots.update(dict.fromkeys(cols, spot(c, currency, period, interval)))
+    return closes, spots
+
+
+def total_in(amounts, currency="USD", period="5d", interval="15m"):
+    """{ticker: 以報價幣別計的金額} (如各標的已實現損益) 以現匯換成 currency 後加總；缺匯率時為 NaN。"""
+    rates = {}
+    total = 0.0
+    for t, v in amounts.items():
+        c = currency_of(t)
+        if c not in rates:
+            try:
+                rates[c] = spot(c, currency, period, interval)
+            except LookupError:
+                rates[c] = np.nan
+        total += v * rates[c]
+    return total
+
+
+def costs_in(portfolio, spots):
+    """持股成本乘上 closes_in 回傳的現匯。"""
+    return [dict(item, cost=item['cost'] * spots.get(item['ticker'], 1.0)) for item in portfolio]
+
+
+def value_portfolio_in(raw_data, portfolio, currency="USD", period="5d", interval="15m"):
+    """以 currency 為報告幣別估值：各標的收盤價逐點換匯，成本以現匯換算。
+
+    portfolio 的 cost 視為該標的報價幣別 (台股即新台幣)。
+    """
+    closes, spots = closes_in(close_frame(raw_data, [item['ticker'] for item in portfolio]),
+                              currency, period, interval)
+    return value_from_closes(closes, costs_in(portfolio, spots))
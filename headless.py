@@ -0,0 +1,217 @@
+"""
+不經 Streamlit 的估值入口：命令列與本地 HTTP/JSON。
+
+與儀表板走同一條路徑 (帳本 → 共用行情快照 / 快取 / 本地 K 線庫 → 向量化估值與換匯)，
+結果依快照版本快取：同一版行情、同一組持股只算一次，排程或其他服務可以頻繁查詢。
+
+    python headless.py value [--portfolio default] [--currency USD] [--table]
+    python headless.py portfolios
+    python headless.py serve [--host 127.0.0.1] [--port 8765]
+
+HTTP (serve)：
+    GET /valuation?portfolio=default&currency=USD&points=500
+    GET /history?portfolio=default      (每日收盤快照，見 eod.py)
+    GET /portfolios
+    GET /health
+"""
+import argparse
+import json
+import math
+import sys
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import eod
+import poller as poller_mod
+from downsample import MAX_POINTS, downsample_series
+from fx import rate_symbols, total_in, value_portfolio_in
+from ledger import DEFAULT_PORTFOLIO, get_ledger
+from resilience import stale_tickers
+
+DEFAULT_PORT = 8765
+
+_memo = {}
+_memo_lock = threading.Lock()
+
+
+def _num(x):
+    """JSON 不接受 NaN / inf，轉成 null。"""
+    x = float(x)
+    return x if math.isfinite(x) else None
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts else None
+
+
+def valuation_report(pid=DEFAULT_PORTFOLIO, currency="USD", period="5d", interval="15m", max_points=MAX_POINTS):
+    """KPI、每檔持股一列與總值走勢 (降採樣到 max_points 點)，可直接 json.dumps。"""
+    ledger = get_ledger()
+    portfolio = ledger.positions(pid)
+    tickers = list(dict.fromkeys(item['ticker'] for item in portfolio))
+    realized = ledger.realized_by_ticker(pid)
+    raw = poller_mod.latest_bars(tickers, period=period, interval=interval) if tickers else None
+    # 匯率也先補進快照：估值途中才不會因補抓匯率又發布新版，備忘錄的版本鍵才對得上
+    symbols = rate_symbols(list(dict.fromkeys(tickers + list(realized))), currency)
+    if symbols:
+        poller_mod.latest_bars(symbols, period=period, interval=interval)
+    snap = poller_mod.get_poller(period, interval).latest()
+    key = (snap.version, pid, currency, period, interval, max_points,
+           tuple((item['ticker'], float(item['shares']), float(item['cost'])) for item in portfolio))
+    with _memo_lock:
+        report = _memo.get(key)
+    if report is not None:
+        return report
+
+    report = {
+        "portfolio": pid,
+        "currency": currency,
+        "as_of": _iso(snap.taken_at),
+        "snapshot_version": snap.version,
+        "kpis": {"market_value": 0.0, "cost": 0.0, "profit": 0.0, "profit_pct": 0.0,
+                 "realized": _num(total_in(realized, currency, period, interval))},
+        "holdings": [],
+        "trend": [],
+        "missing": [],
+        "stale": sorted(stale_tickers(tickers)),
+    }
+    if tickers and not raw.empty:
+        val = value_portfolio_in(raw, portfolio, currency, period, interval)
+        report["kpis"].update(market_value=_num(val.total_market), cost=_num(val.total_cost),
+                              profit=_num(val.total_profit), profit_pct=_num(val.total_profit_pct))
+        h = val.holdings()
+        report["holdings"] = [
+            {k: (v if k == "ticker" else _num(v)) for k, v in row.items()} for row in h.to_dict("records")
+        ]
+        trend = downsample_series(val.trend.dropna(), max_points)
+        report["trend"] = [{"t": t.isoformat(), "v": _num(v)} for t, v in zip(trend.index, trend.to_numpy())]
+        report["missing"] = list(val.missing)
+    else:
+        report["missing"] = tickers
+
+    with _memo_lock:
+        # 只保留目前這版快照的結果 (不同投資組合 / 幣別各一份)
+        for k in [k for k in _memo if k[0] != snap.version]:
+            del _memo[k]
+        _memo[key] = report
+    return report
+
+
+def history_report(pid=DEFAULT_PORTFOLIO):
+    """每日收盤快照的合計 (USD)；直接讀收盤快照紀錄，不碰行情。"""
+    hist = eod.history(pid)
+    return {
+        "portfolio": pid,
+        "currency": "USD",
+        "days": [
+            {"date": d.date().isoformat(), **{k: _num(v) for k, v in row.items()}}
+            for d, row in zip(hist.index, hist.to_dict("records"))
+        ],
+    }
+
+
+# --- HTTP ---
+class Handler(BaseHTTPRequestHandler):
+    server_version = "gupiao-headless/1.0"
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            if url.path == "/valuation":
+                points = int(q.get("points", MAX_POINTS))
+                self._send(200, valuation_report(q.get("portfolio", DEFAULT_PORTFOLIO),
+                                                 q.get("currency", "USD").upper(), max_points=max(points, 3)))
+            elif url.path == "/history":
+                self._send(200, history_report(q.get("portfolio", DEFAULT_PORTFOLIO)))
+            elif url.path == "/portfolios":
+                self._send(200, {"portfolios": get_ledger().portfolio_ids()})
+            elif url.path == "/health":
+                snap = poller_mod.get_poller().latest()
+                self._send(200, {"ok": True, "snapshot_version": snap.version, "as_of": _iso(snap.taken_at)})
+            else:
+                self._send(404, {"error": f"unknown path {url.path}"})
+        except (ValueError, LookupError) as e:
+            self._send(400, {"error": str(e)})
+        except Exception as e:
+            self.log_error("valuation failed: %r", e)
+            self._send(500, {"error": str(e)})
+
+    def log_message(self, fmt, *args):
+        sys.stderr.write(f"{self.address_string()} - {fmt % args}\n")
+
+
+def _ledger_tickers():
+    ledger = get_ledger()
+    return {t for pid in ledger.portfolio_ids() for t in ledger.positions_map(pid)}
+
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT):
+    # 所有帳本的持股交給背景輪詢定時刷新，請求進來時只讀快照
+    poller_mod.get_poller().add_source("headless", _ledger_tickers)
+    eod.enable()
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    print(f"serving on http://{host}:{port}/valuation", file=sys.stderr)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+# --- CLI ---
+def _print_table(report):
+    import pandas as pd
+
+    k = report["kpis"]
+    print(f"{report['portfolio']} ({report['currency']}) as of {report['as_of']}")
+    print(f"  市值 {k['market_value']:,.2f}  成本 {k['cost']:,.2f}  損益 {k['profit']:,.2f} ({k['profit_pct']:.2f}%)")
+    if report["holdings"]:
+        print(pd.DataFrame(report["holdings"]).to_string(index=False, float_format=lambda x: f"{x:,.2f}"))
+    if report["missing"]:
+        print(f"  查無行情: {', '.join(report['missing'])}")
+    if report["stale"]:
+        print(f"  行情過時: {', '.join(report['stale'])}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="投資組合估值 (不需瀏覽器)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    val = sub.add_parser("value", help="輸出一個投資組合的估值")
+    val.add_argument("--portfolio", default=DEFAULT_PORTFOLIO)
+    val.add_argument("--currency", default="USD")
+    val.add_argument("--points", type=int, default=MAX_POINTS, help="走勢最多點數")
+    val.add_argument("--table", action="store_true", help="以表格輸出 (預設 JSON)")
+    sub.add_parser("portfolios", help="列出所有投資組合")
+    srv = sub.add_parser("serve", help="啟動本地 HTTP/JSON 服務")
+    srv.add_argument("--host", default="127.0.0.1")
+    srv.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "serve":
+        serve(args.host, args.port)
+    elif args.cmd == "portfolios":
+        print(json.dumps(get_ledger().portfolio_ids(), ensure_ascii=False))
+    else:
+        report = valuation_report(args.portfolio, args.currency.upper(), max_points=args.points)
+        if args.table:
+            _print_table(report)
+        else:
+            json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+            print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
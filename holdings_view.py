@@ -0,0 +1,89 @@
+"""
+大型投資組合的持股明細 / 個股卡片。
+
+整份結果表 (每檔持股一列) 在伺服器端篩選與排序，頁面只送出目前這一頁：
+不論持股幾檔，送到瀏覽器的表格列數與卡片數都固定在 page_size 以內。
+正負著色以整欄比較一次產生 CSS (Styler.apply, axis=None)，不再逐格呼叫 lambda；
+卡片整頁合成一段 HTML 一次送出，Logo 圖片延遲載入。
+"""
+import html
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+PAGE_SIZE = 50
+UP, DOWN = "#00ff00", "#ff4b4b"
+
+
+def query(df, text=None, column=None, sort_by=None, descending=False):
+    """依 column 欄位的子字串篩選 (不分大小寫) 後排序；回傳新的 DataFrame。"""
+    if text and column:
+        df = df[df[column].astype(str).str.contains(text.strip(), case=False, regex=False, na=False)]
+    if sort_by:
+        df = df.sort_values(sort_by, ascending=not descending, kind="stable", na_position="last")
+    return df
+
+
+def page_slice(df, page, page_size=PAGE_SIZE):
+    """第 page 頁 (從 1 起算) 與總頁數；page 超出範圍時夾到最後一頁。"""
+    pages = max(1, -(-len(df) // page_size))
+    page = min(max(int(page), 1), pages)
+    return df.iloc[(page - 1) * page_size: page * page_size], pages
+
+
+def sign_styles(frame, up=UP, down=DOWN):
+    """整塊數值依正負一次轉成 CSS 字串。"""
+    values = frame.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    css = np.where(values < 0, f"color: {down}", f"color: {up}")
+    return pd.DataFrame(css, index=frame.index, columns=frame.columns)
+
+
+def style_table(df, signed, formats=None):
+    """signed 欄位正綠負紅；formats: {欄位: 格式字串} 只影響顯示，排序仍以數值進行。"""
+    styler = df.style.apply(sign_styles, axis=None, subset=list(signed))
+    return styler.format(formats) if formats else styler
+
+
+def controls(df, key, search_column, sort_columns, page_size=PAGE_SIZE):
+    """搜尋 / 排序 / 分頁控制列；回傳 (目前這頁, 篩選後的總列數)。"""
+    c_search, c_sort, c_desc, c_page = st.columns([3, 2, 1, 1])
+    text = c_search.text_input("搜尋", key=f"{key}_search", placeholder=search_column)
+    sort_by = c_sort.selectbox("排序", list(sort_columns), key=f"{key}_sort")
+    descending = c_desc.toggle("遞減", value=True, key=f"{key}_desc")
+    view = query(df, text, search_column, sort_by, descending)
+    pages = max(1, -(-len(view) // page_size))
+    page_key = f"{key}_page"
+    # 篩選後頁數變少時，先把已選的頁碼夾回範圍內再建立元件
+    if st.session_state.get(page_key, 1) > pages:
+        st.session_state[page_key] = pages
+    page = c_page.number_input(f"頁 / {pages}", min_value=1, max_value=pages, step=1, key=page_key)
+    return page_slice(view, page, page_size)[0], len(view)
+
+
+def paged_table(df, key, signed, search_column, sort_columns=None, formats=None, page_size=PAGE_SIZE, **kwargs):
+    """分頁的持股明細表；只有目前這頁會被轉成 Styler 送出。"""
+    page, total = controls(df, key, search_column, sort_columns or df.columns, page_size)
+    st.dataframe(style_table(page, signed, formats), **kwargs)
+    st.caption(f"共 {total} 檔 (全部 {len(df)} 檔)")
+    return page
+
+
+def cards_html(page, logo="Logo", ticker="Ticker", price="Price", value="Value(USD)", profit="Profit", pct="P%"):
+    """整頁卡片合成一段 HTML。"""
+    colors = np.where(page[profit].to_numpy(dtype=float) >= 0, "#00ffcc", DOWN)
+    parts = []
+    for lg, t, p, v, pc, color in zip(page[logo], page[ticker], page[price], page[value], page[pct], colors):
+        parts.append(f"""
+        <div class="stock-card">
+            <img src="{html.escape(str(lg))}" width="40" class="logo-img" loading="lazy">
+            <div style="flex-grow:1;">
+                <span style="font-size:18px; font-weight:bold; color:white;">{html.escape(str(t))}</span><br>
+                <span style="color:#888; font-size:14px;">市價: ${p:.2f}</span>
+            </div>
+            <div style="text-align:right;">
+                <span style="color:white; font-weight:bold;">${v:,.0f}</span><br>
+                <span style="color:{color}; font-size:14px;">{pc:.2f}%</span>
+            </div>
+        </div>""")
+    return "".join(parts)
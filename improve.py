@@ -1,13 +1,29 @@
 import streamlit as st
-import yfinance as yf
 import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
 from datetime import datetime
 from streamlit_autorefresh import st_autorefresh
 
+import alerts
+import eod
+import profiling
+import warm_start
+from downsample import downsample_ohlc, downsample_series, window, zoom_slider
+from fx import spot, value_portfolio_in
+from holdings_view import cards_html, controls
+from indicators import horizon_indicators
+from ledger import DEFAULT_PORTFOLIO, get_ledger
+from portfolio_io import panel as bulk_panel
+from metadata import logo_urls
+from poller import get_poller, latest_bars
+from pyramid import HORIZONS, ensure_history, horizon_bars
+from resilience import stale_note
+from risk import BENCHMARK, portfolio_risk
+from streaming import get_hub
+
 # --- 1. 網頁配置與科技感 CSS ---
 st.set_page_config(page_title="NEON Real-time Terminal", layout="wide")
+# 每次重跑的分段耗時寫入 .gupiao/metrics.jsonl；網址加 ?debug=1 顯示面板、?profile=1 剖析
+profiling.begin("improve", profile=profiling.profile_requested())
 
 st.markdown("""
     <style>
@@ -30,127 +46,265 @@ st.markdown("""
 # --- 2. 自動刷新設置 (每 60 秒刷新一次) ---
 st_autorefresh(interval=60000, key="data_refresh_counter")
 
-# --- 3. 數據管理 (Session State) ---
-if 'portfolio' not in st.session_state:
-    st.session_state.portfolio = [
-        {"ticker": "IONQ", "shares": 30.0, "cost": 45.498},
-        {"ticker": "EOSE", "shares": 100.0, "cost": 11.747},
-        {"ticker": "ONDS", "shares": 110.0, "cost": 10.043}
-    ]
+# --- 3. 即時區塊 (KPI / 個股卡片) ---
+LIVE_REFRESH_SECONDS = 1.0
+CARDS_PER_PAGE = 20
+
+
+def live_valuation(val):
+    """串流模式下以最新 tick 覆蓋收盤價重算估值，並回傳最新 tick 時間。"""
+    if not st.session_state.get("live_mode"):
+        return val, None
+    hub = get_hub()
+    hub.subscribe(val.tickers)
+    return val.reprice(hub.last_prices(val.tickers)), hub.last_update(val.tickers)
+
+
+def holding_rows(val, logo_dict):
+    h = val.holdings()
+    return pd.DataFrame({
+        "Logo": h["ticker"].map(logo_dict),
+        "Ticker": h["ticker"], "Price": h["price"], "Value(USD)": h["market_value"],
+        "Profit": h["profit"], "P%": h["profit_pct"]
+    })
+
+
+def render_kpis(val, usdtwd):
+    val, tick_ts = live_valuation(val)
+    c_head, c_refresh = st.columns([3, 1])
+    with c_head:
+        st.title("⚡ 核心投資監控終端")
+    with c_refresh:
+        stamp = datetime.fromtimestamp(tick_ts) if tick_ts else datetime.now()
+        badge = "STREAM" if tick_ts else "LIVE"
+        st.markdown(f"<p class='refresh-text'>{badge} • {stamp.strftime('%H:%M:%S')}</p>", unsafe_allow_html=True)
+    if st.session_state.get("live_mode"):
+        # 串流斷線時退回輪詢行情，並說明原因
+        feed = get_hub().status()
+        if not feed["ok"]:
+            reason = f"串流報價中斷 ({feed['error']})，重新連線中" if feed["error"] else "串流報價連線中"
+            st.caption(f"⚠️ {reason}；暫以輪詢行情顯示。")
+
+    # KPI 指標區
+    m1, m2, m3 = st.columns(3)
+    m1.metric("總市值 (USD)", f"${val.total_market:,.0f}")
+    m2.metric("總市值 (TWD)", f"NT$ {val.total_market * usdtwd:,.0f}")
+    m3.metric("淨損益", f"${val.total_profit:,.2f}", f"{val.total_profit_pct:.2f}%")
+
+
+def render_cards(val, logo_dict):
+    val, _ = live_valuation(val)
+    # 伺服器端篩選 / 排序，只把目前這頁的卡片合成一段 HTML 送出
+    rows = holding_rows(val, logo_dict)
+    page, total = controls(rows, "cards", "Ticker", ["Value(USD)", "Profit", "P%", "Ticker"], page_size=CARDS_PER_PAGE)
+    st.markdown(cards_html(page), unsafe_allow_html=True)
+    if total > CARDS_PER_PAGE:
+        st.caption(f"共 {total} 檔，每頁 {CARDS_PER_PAGE} 檔")
+
+
+# 疊在 K 線上的指標 / 另開副圖的指標 -> 指標引擎的欄位
+OVERLAYS = {
+    "SMA 20": ["SMA20"], "SMA 50": ["SMA50"], "EMA 20": ["EMA20"],
+    "布林通道": ["BB_UPPER", "BB_MID", "BB_LOWER"], "VWAP": ["VWAP"],
+}
+PANELS = {"RSI": ["RSI"], "MACD": ["MACD", "MACD_SIGNAL", "MACD_HIST"], "ATR": ["ATR"]}
+
+
+def detail_figure(bars, ind, chosen):
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    panels = [p for p in PANELS if p in chosen]
+    heights = [0.6] + [0.4 / len(panels)] * len(panels) if panels else [1.0]
+    fig = make_subplots(rows=1 + len(panels), cols=1, shared_xaxes=True, vertical_spacing=0.03, row_heights=heights)
+    fig.add_trace(go.Candlestick(
+        x=bars.index, open=bars['Open'], high=bars['High'],
+        low=bars['Low'], close=bars['Close'], name="K 線"
+    ), row=1, col=1)
+    for name, cols in OVERLAYS.items():
+        if name in chosen:
+            for col in cols:
+                fig.add_trace(go.Scatter(x=ind.index, y=ind[col], mode='lines', name=col, line=dict(width=1)), row=1, col=1)
+    for row, name in enumerate(panels, start=2):
+        for col in PANELS[name]:
+            if col == "MACD_HIST":
+                fig.add_trace(go.Bar(x=ind.index, y=ind[col], name=col), row=row, col=1)
+            else:
+                fig.add_trace(go.Scatter(x=ind.index, y=ind[col], mode='lines', name=col, line=dict(width=1)), row=row, col=1)
+        fig.update_yaxes(title_text=name, row=row, col=1)
+    fig.update_layout(template="plotly_dark", height=500 + 150 * len(panels), xaxis_rangeslider_visible=False)
+    return fig
+
+
+ALERT_VALUE_LABELS = {
+    "price": "價位", "cost_move": "相對成本 % (負數為下跌)", "drawdown": "回落 %", "pnl": "未實現損益 (USD)",
+}
+
+
+def alert_panel(engine, pid, portfolio):
+    kind = st.selectbox("警示類型", list(alerts.KINDS), format_func=alerts.KINDS.get, key="alert_kind")
+    with st.form("alert_form"):
+        ticker = None if kind == "pnl" else st.selectbox("標的", [i['ticker'] for i in portfolio])
+        direction = None
+        if kind in ("price", "pnl"):
+            direction = st.radio("方向", ["above", "below"], format_func={"above": "高於", "below": "低於"}.get, horizontal=True)
+        value = st.number_input(ALERT_VALUE_LABELS[kind], value=10.0 if kind == "drawdown" else 0.0)
+        if st.form_submit_button("新增警示"):
+            # 目前已在門檻另一側的規則先不通知，等下一次穿越
+            current = alerts.last_prices(get_poller().latest().frames).get(ticker) if ticker else None
+            cost = next((i['cost'] for i in portfolio if i['ticker'] == ticker), None)
+            try:
+                engine.add_rule(pid, kind, value, ticker=ticker, direction=direction,
+                                current=current if kind in ("price", "cost_move") else None, cost=cost)
+            except ValueError as e:
+                st.error(f"無法新增警示: {e}")
+            else:
+                st.rerun()
+    for rule in engine.rules(pid):
+        r_text, r_del = st.columns([5, 1])
+        r_text.caption(("🟢 " if rule["armed"] else "🔕 ") + alerts.describe(rule))
+        if r_del.button("✖", key=f"alert_del_{rule['id']}"):
+            engine.remove_rule(rule["id"])
+            st.rerun()
+
+
+def alert_toasts(engine, pid):
+    """本 session 上次看過之後新觸發的警示以 toast 顯示；第一次載入不補發舊的。"""
+    seen = st.session_state.get("alert_seen")
+    events = engine.events(pid, after_id=seen or 0, limit=20 if seen is not None else 1)
+    if seen is not None:
+        for ev in reversed(events):
+            st.toast(f"🔔 {ev['message']}")
+    st.session_state["alert_seen"] = events[0]["id"] if events else (seen or 0)
+
 
-# --- 4. 側邊欄：管理面板 ---
+# --- 4. 數據管理 (持股帳本，所有 session 共用並寫入磁碟) ---
+DEFAULT_HOLDINGS = [
+    {"ticker": "IONQ", "shares": 30.0, "cost": 45.498},
+    {"ticker": "EOSE", "shares": 100.0, "cost": 11.747},
+    {"ticker": "ONDS", "shares": 110.0, "cost": 10.043}
+]
+ledger = get_ledger()
+PORTFOLIO_ID = st.query_params.get("portfolio", DEFAULT_PORTFOLIO)
+ledger.ensure_portfolio(PORTFOLIO_ID, seed=DEFAULT_HOLDINGS)
+portfolio = ledger.positions(PORTFOLIO_ID)
+# 警示規則在背景輪詢每次發布新快照時檢查，與開著幾個頁面無關
+alert_engine = alerts.enable()
+# 每天收盤後在背景記一筆持股與損益，長期走勢由這份紀錄讀出
+eod.enable()
+alert_toasts(alert_engine, PORTFOLIO_ID)
+
+# --- 5. 側邊欄：管理面板 ---
 with st.sidebar:
     st.header("🛰️ 控制中心")
     with st.expander("➕ 新增/更新資產", expanded=False):
         with st.form("add_form"):
             t = st.text_input("股票代碼 (如: TSLA)").upper().strip()
             s = st.number_input("持有股數", min_value=0.0)
-            c = st.number_input("平均成本 (USD)", min_value=0.0)
+            c = st.number_input("平均成本 (報價幣別，台股為台幣)", min_value=0.0)
             if st.form_submit_button("寫入終端") and t:
-                st.session_state.portfolio = [i for i in st.session_state.portfolio if i['ticker'] != t]
-                st.session_state.portfolio.append({"ticker": t, "shares": s, "cost": c})
+                ledger.set_position(PORTFOLIO_ID, t, s, c)
                 st.rerun()
 
-    if st.session_state.portfolio:
+    with st.expander("📥 批次匯入 / 匯出"):
+        bulk_panel(ledger, PORTFOLIO_ID)
+
+    if portfolio:
         with st.expander("🗑️ 移除資產項目"):
-            dt = st.selectbox("選擇標的", [i['ticker'] for i in st.session_state.portfolio])
+            dt = st.selectbox("選擇標的", [i['ticker'] for i in portfolio])
             if st.button("確認銷毀記錄"):
-                st.session_state.portfolio = [i for i in st.session_state.portfolio if i['ticker'] != dt]
+                ledger.remove(PORTFOLIO_ID, dt)
                 st.rerun()
+
+        with st.expander("🔔 價格警示"):
+            alert_panel(alert_engine, PORTFOLIO_ID, portfolio)
     
     st.divider()
+    live_mode = st.toggle("⚡ 串流報價模式", key="live_mode", help="以推播 tick 每秒更新市值，不必等整頁刷新")
     if st.button("🔴 重置系統"):
-        st.session_state.portfolio = []
+        ledger.clear(PORTFOLIO_ID)
         st.rerun()
 
-# --- 5. 數據核心運算 ---
-if st.session_state.portfolio:
-    tickers_list = [item['ticker'] for item in st.session_state.portfolio]
+# --- 6. 數據核心運算 ---
+if portfolio:
+    tickers_list = [item['ticker'] for item in portfolio]
+    # 冷啟動：新 session 先畫出上次存下的結果，最新行情算好後再換掉
+    warm_key = f"improve-{PORTFOLIO_ID}"
+    warm_slot = st.empty()
+    warm = None if st.session_state.get("warm_shown") else warm_start.load(warm_key)
+    if warm:
+        warm_start.paint(warm_slot, warm)
     
     try:
-        with st.spinner('📡 數據同步中...'):
-            # 同時獲取股價與匯率
-            raw_data = yf.download(tickers_list + ["TWD=X"], period="5d", interval="15m", group_by='ticker', progress=False)
-            usdtwd = raw_data["TWD=X"]["Close"].iloc[-1]
-            
-            # 自動 Logo 搜尋邏輯
-            logo_dict = {}
-            for t in tickers_list:
-                try:
-                    # 使用 cache 機制避免重複請求
-                    ticker_info = yf.Ticker(t).info
-                    website = ticker_info.get('website', '').replace('https://', '').replace('http://', '').split('/')[0]
-                    if website:
-                        logo_dict[t] = f"https://logo.clearbit.com/{website}"
-                    else:
-                        logo_dict[t] = f"https://ui-avatars.com/api/?name={t}&background=00ffcc&color=000"
-                except:
-                    logo_dict[t] = f"https://ui-avatars.com/api/?name={t}&background=00ffcc&color=000"
-
-        results = []
-        total_market_usd = 0.0
-        total_cost_usd = 0.0
-        portfolio_trend = None
-
-        for item in st.session_state.portfolio:
-            t = item['ticker']
-            ticker_df = raw_data[t] if len(tickers_list) + 1 > 1 else raw_data
-            if ticker_df.empty: continue
-
-            curr_price = ticker_df['Close'].iloc[-1]
-            mkt_val = curr_price * item['shares']
-            cost_val = item['cost'] * item['shares']
-            profit = mkt_val - cost_val
+        with st.spinner('📡 數據同步中...'), profiling.stage("fetch", rows=len(tickers_list)):
+            # 股價走共用快照；匯率序列由 fx 取得 (整個伺服器行程共用)
+            with profiling.stage("bars"):
+                raw_data = latest_bars(tickers_list, period="5d", interval="15m")
+            with profiling.stage("fx"):
+                usdtwd = spot("USD", "TWD")
             
-            total_market_usd += mkt_val
-            total_cost_usd += cost_val
-
-            # 累積趨勢
-            stock_series = ticker_df['Close'] * item['shares']
-            portfolio_trend = stock_series if portfolio_trend is None else portfolio_trend.add(stock_series, fill_value=0)
-
-            results.append({
-                "Logo": logo_dict.get(t),
-                "Ticker": t, "Price": curr_price, "Value(USD)": mkt_val,
-                "Profit": profit, "P%": (profit/cost_val*100) if cost_val != 0 else 0
-            })
-
-        # --- 6. UI 佈局 ---
-        c_head, c_refresh = st.columns([3, 1])
-        with c_head:
-            st.title("⚡ 核心投資監控終端")
-        with c_refresh:
-            st.markdown(f"<p class='refresh-text'>LIVE • {datetime.now().strftime('%H:%M:%S')}</p>", unsafe_allow_html=True)
-        
-        # KPI 指標區
-        m1, m2, m3 = st.columns(3)
-        total_profit = total_market_usd - total_cost_usd
-        profit_pct = (total_profit / total_cost_usd * 100) if total_cost_usd != 0 else 0
-        
-        m1.metric("總市值 (USD)", f"${total_market_usd:,.0f}")
-        m2.metric("總市值 (TWD)", f"NT$ {total_market_usd * usdtwd:,.0f}")
-        m3.metric("淨損益", f"${total_profit:,.2f}", f"{profit_pct:.2f}%")
+            # 自動 Logo：背景執行緒解析並寫入磁碟快取，未完成前先用預設頭像
+            with profiling.stage("logos"):
+                logo_dict = logo_urls(tickers_list)
+
+        # 向量化估值：一次矩陣運算算出所有持股的市值與損益
+        with profiling.stage("valuation", rows=len(portfolio), points=raw_data.size):
+            val = value_portfolio_in(raw_data, portfolio, "USD")
+        for t in val.missing:
+            st.warning(f"找不到代碼 {t} 的數據，已跳過。")
+        stale = stale_note(tickers_list)
+        if stale:
+            st.caption(stale)
+        results = holding_rows(val, logo_dict)
 
-        tab1, tab2 = st.tabs(["📊 組合分析", "🔍 個股診斷"])
+        # --- 7. UI 佈局 ---
+        # 串流模式下 KPI 與個股卡片每秒以最新 tick 局部重繪，不重跑整個腳本
+        live_fragment = st.fragment(run_every=LIVE_REFRESH_SECONDS if live_mode else None)
+        live_fragment(render_kpis)(val, usdtwd)
+        warm_slot.empty()
+        st.session_state["warm_shown"] = True
+        warm_start.save(warm_key, [
+            ("總市值 (USD)", f"${val.total_market:,.0f}", None),
+            ("總市值 (TWD)", f"NT$ {val.total_market * usdtwd:,.0f}", None),
+            ("淨損益", f"${val.total_profit:,.2f}", f"{val.total_profit_pct:.2f}%"),
+        ], results.drop(columns="Logo").sort_values("Value(USD)", ascending=False), val.trend)
+
+        # plotly 到真的要畫圖時才載入，不擋住 KPI 的第一次顯示
+        import plotly.express as px
+        import plotly.graph_objects as go
+
+        tab1, tab2, tab3 = st.tabs(["📊 組合分析", "🔍 個股診斷", "🛡️ 風險分析"])
         
-        with tab1:
+        # 各分頁的內容 (讀取區間 K 線、指標、建圖、序列化送出) 分別計時
+        with tab1, profiling.stage("portfolio_tab", rows=len(results)) as portfolio_info:
             st.subheader("📋 實時持股監控")
-            for res in results:
-                color = "#00ffcc" if res['Profit'] >= 0 else "#ff4b4b"
-                st.markdown(f"""
-                <div class="stock-card">
-                    <img src="{res['Logo']}" width="40" class="logo-img">
-                    <div style="flex-grow:1;">
-                        <span style="font-size:18px; font-weight:bold; color:white;">{res['Ticker']}</span><br>
-                        <span style="color:#888; font-size:14px;">市價: ${res['Price']:.2f}</span>
-                    </div>
-                    <div style="text-align:right;">
-                        <span style="color:white; font-weight:bold;">${res['Value(USD)']:,.0f}</span><br>
-                        <span style="color:{color}; font-size:14px;">{res['P%']:.2f}%</span>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
+            live_fragment(render_cards)(val, logo_dict)
             
+            st.divider()
+            # 區間走勢：由 K 線金字塔中對應的層級直接讀取，不重新下載
+            st.subheader("資產價值走勢")
+            trend_h = st.radio("區間", list(HORIZONS), horizontal=True, key="trend_horizon")
+            if HORIZONS[trend_h][0] != "5d":
+                ensure_history(tickers_list)
+            trend = value_portfolio_in(horizon_bars(tickers_list, trend_h), portfolio, "USD").trend
+            z_start, z_end = zoom_slider(trend.index, key="trend_zoom")
+            trend = downsample_series(window(trend, z_start, z_end))
+            portfolio_info["points"] = len(trend)
+            fig_trend = go.Figure(go.Scatter(x=trend.index, y=trend.values, mode='lines', line=dict(color='#00ffcc')))
+            fig_trend.update_layout(template="plotly_dark", height=350, yaxis_title="市值 (USD)")
+            st.plotly_chart(fig_trend, use_container_width=True)
+
+            # 長期走勢：每日收盤快照直接讀出，不下載多年 K 線、不重算過去的估值
+            st.subheader("長期市值與損益 (每日收盤快照)")
+            history = eod.history(PORTFOLIO_ID)
+            portfolio_info["eod_days"] = len(history)
+            if len(history) >= 2:
+                in_twd = st.toggle("以新台幣顯示", key="eod_twd", help="各日以當天記錄的匯率換算")
+                rate = history["usd_twd"].fillna(usdtwd) if in_twd else 1.0
+                st.plotly_chart(eod.history_figure(history, "TWD" if in_twd else "USD", rate), use_container_width=True)
+            else:
+                st.caption("每日收盤後自動記錄一筆，累積兩個交易日以上即可顯示長期走勢。")
+
             st.divider()
             # 修正後的圓餅圖
             st.subheader("資產權重比例")
@@ -164,7 +318,7 @@ if st.session_state.portfolio:
             fig_pie.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color="white"))
             st.plotly_chart(fig_pie, use_container_width=True)
 
-        with tab2:
+        with tab2, profiling.stage("detail_tab") as detail_info:
             selected_t = st.selectbox("選擇要分析的標的", tickers_list)
             l_col, t_col = st.columns([1, 15])
             with l_col:
@@ -172,15 +326,58 @@ if st.session_state.portfolio:
             with t_col:
                 st.markdown(f"## {selected_t} 深度診斷")
 
-            detail_df = raw_data[selected_t] if len(tickers_list) + 1 > 1 else raw_data
-            fig_detail = go.Figure(go.Candlestick(
-                x=detail_df.index, open=detail_df['Open'], high=detail_df['High'],
-                low=detail_df['Low'], close=detail_df['Close']
-            ))
-            fig_detail.update_layout(template="plotly_dark", height=500, xaxis_rangeslider_visible=False)
-            st.plotly_chart(fig_detail, use_container_width=True)
+            detail_h = st.radio("K 線區間", list(HORIZONS), horizontal=True, key="detail_horizon")
+            if HORIZONS[detail_h][0] != "5d":
+                ensure_history([selected_t])
+            detail_df = horizon_bars([selected_t], detail_h)[selected_t]
+            # K 線分桶合併到點數上限內；縮小區間會重新取樣出細節
+            detail_df = detail_df.dropna(how="all")
+            z_start, z_end = zoom_slider(detail_df.index, key="detail_zoom")
+            detail_df = downsample_ohlc(window(detail_df, z_start, z_end))
+            detail_info["points"] = len(detail_df)
+            # 指標引擎每次只併入新 K 線；全部持股一起更新，切換標的不必重算
+            chosen = st.multiselect("技術指標", list(OVERLAYS) + list(PANELS), default=["SMA 20", "布林通道"], key="detail_indicators")
+            ind = horizon_indicators(tickers_list, detail_h).frame(selected_t).reindex(detail_df.index)
+            st.plotly_chart(detail_figure(detail_df, ind, chosen), use_container_width=True)
+
+        with tab3, profiling.stage("risk_tab", rows=len(portfolio)):
+            # 日 K 線走共用快照；同一版快照只算一次
+            risk_period = st.radio("歷史區間", ["1y", "2y", "5y"], horizontal=True, key="risk_period")
+            rep = portfolio_risk(portfolio, period=risk_period)
+            r1, r2, r3, r4 = st.columns(4)
+            r1.metric("年化波動", f"{rep.portfolio_volatility * 100:.1f}%")
+            r2.metric("最大回撤", f"{rep.portfolio_max_drawdown * 100:.1f}%")
+            r3.metric(f"Beta (vs {BENCHMARK})", f"{rep.portfolio_beta:.2f}")
+            r4.metric("一日 95% VaR", f"${rep.var[0.95]['historical']:,.0f}",
+                      f"參數法 ${rep.var[0.95]['parametric']:,.0f}", delta_color="off")
+
+            d_col, s_col = st.columns(2)
+            with d_col:
+                dd = downsample_series(rep.drawdown * 100)
+                fig_dd = go.Figure(go.Scatter(x=dd.index, y=dd.values, fill='tozeroy', line=dict(color='#ff4b4b')))
+                fig_dd.update_layout(template="plotly_dark", height=300, yaxis_title="回撤 %")
+                st.plotly_chart(fig_dd, use_container_width=True)
+            with s_col:
+                sharpe = downsample_series(rep.sharpe.dropna())
+                fig_sr = go.Figure(go.Scatter(x=sharpe.index, y=sharpe.values, line=dict(color='#00ffcc')))
+                fig_sr.update_layout(template="plotly_dark", height=300, yaxis_title="滾動夏普 (一季)")
+                st.plotly_chart(fig_sr, use_container_width=True)
+
+            fig_corr = px.imshow(rep.corr, zmin=-1, zmax=1, color_continuous_scale="RdBu_r")
+            fig_corr.update_layout(template="plotly_dark", height=450, title="相關係數矩陣")
+            st.plotly_chart(fig_corr, use_container_width=True)
+
+            h = rep.holdings()
+            st.dataframe(pd.DataFrame({
+                "股票": h["ticker"], "權重%": h["weight"] * 100, "年化波動%": h["volatility"] * 100,
+                "最大回撤%": h["max_drawdown"] * 100, "Beta": h["beta"],
+            }).style.format(precision=2), use_container_width=True)
 
     except Exception as e:
         st.error(f"系統故障: {e}")
 else:
-    st.info("🛰️ 等待指令中... 請在左側面板新增您的資產佈局。")
\ No newline at end of file
+    st.info("🛰️ 等待指令中... 請在左側面板新增您的資產佈局。")
+
+rerun = profiling.finish()
+if profiling.debug_enabled():
+    profiling.debug_panel(rerun)
\ No newline at end of file
@@ -0,0 +1,323 @@
+"""
+技術指標引擎 (SMA / EMA / 布林通道 / VWAP / RSI / MACD / ATR)。
+
+所有標的的狀態存成以標的為欄的 NumPy 向量 (移動窗口用環狀緩衝區加累計和，
+EMA / RSI / ATR 只記上一個值)，每根 K 線對全部標的做一次向量化的 O(1) 更新；
+每次刷新只處理各標的上次之後新到的 K 線，不重跑整段 rolling。
+最後一根 K 線可能尚未收盤，只在狀態的副本上暫算，等下一根出現才正式併入。
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+import bar_store
+from pyramid import HORIZONS, level_key
+
+SMA_WINDOWS = (20, 50)
+EMA_SPANS = (20,)
+BB_WINDOW, BB_K = 20, 2.0
+RSI_PERIOD = 14
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+ATR_PERIOD = 14
+
+COLUMNS = (
+    [f"SMA{w}" for w in SMA_WINDOWS] + [f"EMA{s}" for s in EMA_SPANS]
+    + ["BB_MID", "BB_UPPER", "BB_LOWER", "VWAP", "RSI", "MACD", "MACD_SIGNAL", "MACD_HIST", "ATR"]
+)
+
+_NO_TS = np.iinfo(np.int64).min
+
+
+def _alpha(span):
+    return 2.0 / (span + 1)
+
+
+class IndicatorEngine:
+    """單一 K 線層級 (如 "15m"、"15m>1d") 上所有標的的增量指標。"""
+
+    def __init__(self, session_vwap=True):
+        self.session_vwap = session_vwap  # 日內 K 線每天重算 VWAP；日 / 週 K 則從頭累計
+        self.windows = sorted(set(SMA_WINDOWS) | {BB_WINDOW})
+        self.spans = sorted(set(EMA_SPANS) | {MACD_FAST, MACD_SLOW})
+        self._index = {}  # ticker -> 欄位
+        self._s = {}
+        self._tz = {}
+        self._hist = {}  # ticker -> [(ts, values)]，已收盤 K 線的指標
+        self._live = {}  # ticker -> (ts, values)，最後一根 (未收盤) K 線的暫算值
+        self._lock = threading.Lock()
+
+    # --- 狀態 ---
+    def _init_state(self, n):
+        s = {
+            "n": np.zeros(n, dtype=np.int64),
+            "last": np.full(n, _NO_TS, dtype=np.int64),
+            "first": np.full(n, _NO_TS, dtype=np.int64),
+            "day": np.full(n, -1, dtype=np.int64),
+        }
+        for k in ("prev", "macd_sig", "gain", "loss", "atr", "cum_pv", "cum_v"):
+            s[k] = np.zeros(n)
+        for w in self.windows:
+            s[f"buf{w}"] = np.zeros((w, n))
+            s[f"sum{w}"] = np.zeros(n)
+            s[f"sq{w}"] = np.zeros(n)
+        for span in self.spans:
+            s[f"ema{span}"] = np.zeros(n)
+        return s
+
+    def _add(self, tickers):
+        if not tickers:
+            return
+        fresh = self._init_state(len(tickers))
+        if not self._s:
+            self._s = fresh
+        else:
+            self._s = {k: np.concatenate([v, fresh[k]], axis=-1) for k, v in self._s.items()}
+        for t in tickers:
+            self._index[t] = len(self._index)
+
+    def _take(self, cols):
+        return {k: v[..., cols] for k, v in self._s.items()}
+
+    def _put(self, cols, sub):
+        for k, v in sub.items():
+            self._s[k][..., cols] = v
+
+    def reset(self, tickers):
+        """歷史被改寫 (例如往前補了資料) 時，清掉這些標的的狀態，下次從頭算。"""
+        with self._lock:
+            cols = [self._index[t] for t in tickers if t in self._index]
+            if cols:
+                self._put(cols, self._init_state(len(cols)))
+            for t in tickers:
+                self._hist.pop(t, None)
+                self._live.pop(t, None)
+
+    def first(self, ticker):
+        """已併入狀態的第一根 K 線時間 (UTC)；尚未計算過回傳 None。"""
+        j = self._index.get(ticker)
+        if j is None or self._s["first"][j] == _NO_TS:
+            return None
+        return pd.Timestamp(self._s["first"][j], tz="UTC")
+
+    def resume_from(self, ticker):
+        """下次只需讀取這個時間 (含) 之後的 K 線。"""
+        j = self._index.get(ticker)
+        if j is None or self._s["last"][j] == _NO_TS:
+            return None
+        return pd.Timestamp(self._s["last"][j], tz="UTC")
+
+    # --- 核心：一根 K 線，所有標的同時更新 ---
+    def _step(self, s, c, h, l, v, day, m):
+        cols = np.arange(len(m))
+        n = s["n"] + m
+        s["n"] = n
+        first = m & (n == 1)
+        has_prev = m & (n >= 2)
+        p = s["prev"]
+        nan = np.full(len(m), np.nan)
+        out = {}
+
+        for w in self.windows:
+            buf, tot, sq = s[f"buf{w}"], s[f"sum{w}"], s[f"sq{w}"]
+            slot = (n - 1) % w
+            old = np.where(m & (n > w), buf[slot, cols], 0.0)
+            tot += np.where(m, c - old, 0.0)
+            sq += np.where(m, c * c - old * old, 0.0)
+            buf[slot[m], cols[m]] = c[m]
+            ready = m & (n >= w)
+            mean = np.where(ready, tot / w, nan)
+            if w in SMA_WINDOWS:
+                out[f"SMA{w}"] = mean
+            if w == BB_WINDOW:
+                std = np.sqrt(np.maximum(sq / w - mean * mean, 0.0))
+                out["BB_MID"] = mean
+                out["BB_UPPER"] = mean + BB_K * std
+                out["BB_LOWER"] = mean - BB_K * std
+
+        for span in self.spans:
+            e = s[f"ema{span}"]
+            e = np.where(first, c, np.where(m, e + _alpha(span) * (c - e), e))
+            s[f"ema{span}"] = e
+            if span in EMA_SPANS:
+                out[f"EMA{span}"] = np.where(m, e, nan)
+
+        macd = s[f"ema{MACD_FAST}"] - s[f"ema{MACD_SLOW}"]
+        sig = s["macd_sig"]
+        sig = np.where(first, macd, np.where(m, sig + _alpha(MACD_SIGNAL) * (macd - sig), sig))
+        s["macd_sig"] = sig
+        out["MACD"] = np.where(m, macd, nan)
+        out["MACD_SIGNAL"] = np.where(m, sig, nan)
+        out["MACD_HIST"] = out["MACD"] - out["MACD_SIGNAL"]
+
+        # RSI 與 ATR 用 Wilder 平滑 (alpha = 1/period)
+        d = c - p
+        init = m & (n == 2)
+        for k, x in (("gain", np.maximum(d, 0.0)), ("loss", np.maximum(-d, 0.0))):
+            s[k] = np.where(init, x, np.where(has_prev, s[k] + (x - s[k]) / RSI_PERIOD, s[k]))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rsi = 100.0 - 100.0 / (1.0 + s["gain"] / s["loss"])
+        out["RSI"] = np.where(m & (n > RSI_PERIOD), rsi, nan)
+
+        tr = np.where(has_prev, np.maximum(h - l, np.maximum(np.abs(h - p), np.abs(l - p))), h - l)
+        s["atr"] = np.where(first, tr, np.where(m, s["atr"] + (tr - s["atr"]) / ATR_PERIOD, s["atr"]))
+        out["ATR"] = np.where(m & (n >= ATR_PERIOD), s["atr"], nan)
+
+        tp = (h + l + c) / 3.0
+        restart = m & (day != s["day"]) if self.session_vwap else first
+        cum_pv = np.where(restart, 0.0, s["cum_pv"])
+        cum_v = np.where(restart, 0.0, s["cum_v"])
+        vol = np.nan_to_num(v)
+        s["cum_pv"] = np.where(m, cum_pv + tp * vol, cum_pv)
+        s["cum_v"] = np.where(m, cum_v + vol, cum_v)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            vwap = np.where(s["cum_v"] > 0, s["cum_pv"] / s["cum_v"], tp)
+        out["VWAP"] = np.where(m, vwap, nan)
+        s["day"] = np.where(m, day, s["day"])
+
+        s["prev"] = np.where(m, c, p)
+        return np.stack([out[k] for k in COLUMNS])
+
+    # --- 增量更新 ---
+    def update(self, frames):
+        """frames: {ticker: OHLCV DataFrame}，至少包含各標的上次之後的 K 線 (更早的會被略過)。"""
+        self.update_records({
+            t: (df.index.as_unit("ns").asi8, df.reindex(columns=bar_store.FIELDS).to_numpy(dtype=float), df.index.tz)
+            for t, df in frames.items() if not df.empty
+        })
+
+    def update_records(self, records):
+        """records: {ticker: (UTC 奈秒時間戳, OHLCV ndarray, 時區)}，格式同 BarStore.read_since。"""
+        if not records:
+            return
+        with self._lock:
+            self._add([t for t in records if t not in self._index])
+            last = self._s["last"]
+            fresh = {}
+            for t, (ts, bars, tz) in records.items():
+                self._tz[t] = tz
+                new = (ts > last[self._index[t]]) & ~np.isnan(bars[:, 3])
+                if new.any():
+                    fresh[t] = (ts[new], bars[new])
+                else:
+                    self._live.pop(t, None)
+            days = self._local_days(fresh)
+            pending, tail = {}, {}
+            for t, (ts, bars) in fresh.items():
+                # 引擎內部欄位：Close, High, Low, Volume, 當地日期序號
+                rows = np.column_stack([bars[:, 3], bars[:, 1], bars[:, 2], bars[:, 4], days[t]])
+                if len(ts) > 1:
+                    pending[t] = (ts[:-1], rows[:-1])
+                tail[t] = (ts[-1], rows[-1])
+            if pending:
+                self._commit(pending)
+            if tail:
+                self._provisional(tail)
+
+    def _local_days(self, fresh):
+        """各標的 K 線在交易所當地的日期序號；同時區的標的一次換算。"""
+        by_tz = {}
+        for t in fresh:
+            by_tz.setdefault(self._tz[t], []).append(t)
+        days = {}
+        for tz, group in by_tz.items():
+            ts = np.concatenate([fresh[t][0] for t in group])
+            idx = pd.DatetimeIndex(pd.to_datetime(ts, utc=True))
+            if tz is not None:
+                idx = idx.tz_convert(tz)
+            local = idx.tz_localize(None).as_unit("s").asi8 // 86400
+            for t, part in zip(group, np.split(local, np.cumsum([len(fresh[t][0]) for t in group])[:-1])):
+                days[t] = part
+        return days
+
+    def _matrix(self, parts, depth):
+        """把各標的長短不一的 K 線疊成 (depth, 欄位, 標的) 矩陣，不足處為 NaN。"""
+        mat = np.full((depth, 5, len(parts)), np.nan)
+        for k, bars in enumerate(parts):
+            mat[:len(bars), :, k] = bars
+        return mat
+
+    def _commit(self, pending):
+        tickers = list(pending)
+        cols = [self._index[t] for t in tickers]
+        lengths = np.array([len(pending[t][0]) for t in tickers])
+        mat = self._matrix([pending[t][1] for t in tickers], lengths.max())
+        sub = self._take(cols)
+        out = np.empty((len(mat), len(COLUMNS), len(cols)))
+        for r, row in enumerate(mat):
+            m = r < lengths
+            out[r] = self._step(sub, row[0], row[1], row[2], row[3], np.nan_to_num(row[4], nan=-1).astype(np.int64), m)
+        sub["first"] = np.where(sub["first"] == _NO_TS, [pending[t][0][0] for t in tickers], sub["first"])
+        sub["last"] = np.array([pending[t][0][-1] for t in tickers])
+        self._put(cols, sub)
+        for k, t in enumerate(tickers):
+            self._hist.setdefault(t, []).append((pending[t][0], out[:lengths[k], :, k]))
+
+    def _provisional(self, tail):
+        tickers = list(tail)
+        sub = self._take([self._index[t] for t in tickers])
+        row = np.array([tail[t][1] for t in tickers]).T
+        values = self._step(sub, row[0], row[1], row[2], row[3], row[4].astype(np.int64), np.ones(len(tickers), bool))
+        for k, t in enumerate(tickers):
+            self._live[t] = (tail[t][0], values[:, k])
+
+    # --- 讀取 ---
+    def frame(self, ticker):
+        """該標的的指標時間序列 (含最後一根暫算值)，索引與 K 線相同時區。"""
+        with self._lock:
+            chunks = self._hist.get(ticker, [])
+            if len(chunks) > 1:
+                chunks = self._hist[ticker] = [(np.concatenate([c[0] for c in chunks]),
+                                                np.concatenate([c[1] for c in chunks]))]
+            parts = list(chunks)
+            live = self._live.get(ticker)
+        if live is not None:
+            parts.append((np.array([live[0]]), live[1][None, :]))
+        if not parts:
+            return pd.DataFrame(columns=COLUMNS, dtype=float)
+        ts = np.concatenate([p[0] for p in parts])
+        idx = pd.DatetimeIndex(pd.to_datetime(ts, utc=True), name="Datetime")
+        tz = self._tz.get(ticker)
+        idx = idx.tz_convert(tz) if tz is not None else idx.tz_localize(None)
+        return pd.DataFrame(np.concatenate([p[1] for p in parts]), index=idx, columns=COLUMNS)
+
+    def latest(self, tickers):
+        """各標的最新一根的指標值：以標的為列的 DataFrame。"""
+        with self._lock:
+            rows = {}
+            for t in tickers:
+                if t in self._live:
+                    rows[t] = self._live[t][1]
+                elif self._hist.get(t):
+                    rows[t] = self._hist[t][-1][1][-1]
+        return pd.DataFrame.from_dict(rows, orient="index", columns=COLUMNS)
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(key):
+    """行程內每個 K 線層級共用一個引擎。"""
+    with _engines_lock:
+        eng = _engines.get(key)
+        if eng is None:
+            eng = _engines[key] = IndicatorEngine(session_vwap=not key.endswith(("d", "wk", "mo")))
+        return eng
+
+
+def horizon_indicators(tickers, horizon, store=None):
+    """把各標的在顯示區間對應層級上新到的 K 線併入引擎並回傳引擎 (用 .frame(t) / .latest(tickers) 取值)。
+
+    只從本地庫讀上次之後的 K 線；層級被重建 (往前補了歷史) 的標的會重算。
+    """
+    store = store or bar_store.get_store()
+    key = level_key(HORIZONS[horizon][1])
+    eng = get_engine(key)
+    known = {t: eng.first(t) for t in tickers}
+    stored = store.first_timestamps([t for t, f in known.items() if f is not None], key)
+    rebuilt = [t for t, f in stored.items() if f < known[t]]
+    if rebuilt:
+        eng.reset(rebuilt)
+    eng.update_records(store.read_since(tickers, key, {t: eng.resume_from(t) for t in tickers}))
+    return eng
@@ -0,0 +1,317 @@
+"""
+持股與交易帳本 (SQLite)。
+
+取代 st.session_state.portfolio：每筆交易寫入 transactions，同時在同一個資料庫交易中
+增量更新 lots (FIFO 批次) 與 positions (目前部位)，不必每次重播全部交易。
+positions 另在記憶體保留一份 {portfolio: {ticker: 部位}}，查詢為 O(1)；
+所有腳本與 session 共用同一個帳本，伺服器重啟後資料仍在。
+
+每個儀表板、headless 服務、批次匯入與收盤快照都是各自的行程：
+寫入一律在 BEGIN IMMEDIATE 交易內從資料庫重新讀取部位再套用，不會以舊資料覆寫其他行程的變更；
+讀取前先比對 PRAGMA data_version，有其他連線提交過就丟掉記憶體中的部位重新載入。
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date as _date
+
+from bar_store import DATA_DIR
+
+DEFAULT_PORTFOLIO = "default"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS portfolios (
+    pid        TEXT PRIMARY KEY,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    id         INTEGER PRIMARY KEY,
+    pid        TEXT NOT NULL,
+    ticker     TEXT NOT NULL,
+    date       TEXT NOT NULL,
+    side       TEXT NOT NULL,          -- BUY / SELL / SET
+    shares     REAL NOT NULL,
+    price      REAL NOT NULL,
+    fee        REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tx_ticker_date ON transactions (pid, ticker, date);
+CREATE INDEX IF NOT EXISTS tx_date ON transactions (pid, date);
+CREATE TABLE IF NOT EXISTS lots (
+    id        INTEGER PRIMARY KEY,
+    pid       TEXT NOT NULL,
+    ticker    TEXT NOT NULL,
+    open_date TEXT NOT NULL,
+    shares    REAL NOT NULL,
+    remaining REAL NOT NULL,
+    cost      REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lots_open ON lots (pid, ticker, remaining, open_date);
+CREATE TABLE IF NOT EXISTS positions (
+    pid        TEXT NOT NULL,
+    ticker     TEXT NOT NULL,
+    shares     REAL NOT NULL,
+    cost_total REAL NOT NULL,
+    realized   REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (pid, ticker)
+);
+"""
+
+EPS = 1e-9
+
+
+def _position_dict(ticker, shares, cost_total, realized):
+    return {
+        "ticker": ticker,
+        "shares": shares,
+        "cost": cost_total / shares if shares > EPS else 0.0,
+        "realized": realized,
+    }
+
+
+class Ledger:
+    def __init__(self, path=None):
+        self.path = path or os.path.join(DATA_DIR, "ledger.sqlite")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.RLock()
+        self._positions = {}  # pid -> {ticker: {"shares", "cost_total", "realized"}}
+        with self._connect() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript(_SCHEMA)
+        # 常駐的連線只用來讀 data_version：其他連線 (含其他行程) 每次提交後這個值都會變
+        self._watch = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._version = None
+
+    @contextmanager
+    def _connect(self):
+        """with 區塊結束時提交 (例外則回復) 並關閉連線；sqlite3 連線本身的 with 不會關閉連線。"""
+        con = sqlite3.connect(self.path, timeout=30)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def close(self):
+        self._watch.close()
+
+    # --- 記憶體中的部位 ---
+    @staticmethod
+    def _load_book(con, pid):
+        rows = con.execute(
+            "SELECT ticker, shares, cost_total, realized FROM positions WHERE pid=? ORDER BY rowid", (pid,)
+        ).fetchall()
+        return {t: {"shares": s, "cost_total": c, "realized": r} for t, s, c, r in rows}
+
+    def _book(self, pid):
+        # 需在 self._lock 內呼叫；只供讀取，寫入一律經 _writing 取得交易內的最新部位
+        version = self._watch.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._version:
+            self._positions.clear()
+            self._version = version
+        book = self._positions.get(pid)
+        if book is None:
+            with self._connect() as con:
+                book = self._positions[pid] = self._load_book(con, pid)
+        return book
+
+    @contextmanager
+    def _writing(self, pid):
+        """取得資料庫寫入鎖 (BEGIN IMMEDIATE) 後在交易內重新讀取部位；yield (con, book)。
+
+        離開時提交，例外則整批回復；記憶體中的部位在下次讀取時依 data_version 重新載入。
+        """
+        with self._lock:
+            con = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            try:
+                con.execute("BEGIN IMMEDIATE")
+                try:
+                    yield con, self._load_book(con, pid)
+                except BaseException:
+                    con.execute("ROLLBACK")
+                    raise
+                con.execute("COMMIT")
+            finally:
+                con.close()
+                self._positions.pop(pid, None)
+
+    def _save_position(self, con, pid, ticker, pos):
+        con.execute(
+            "INSERT INTO positions (pid, ticker, shares, cost_total, realized) VALUES (?,?,?,?,?) "
+            "ON CONFLICT(pid, ticker) DO UPDATE SET shares=excluded.shares, "
+            "cost_total=excluded.cost_total, realized=excluded.realized",
+            (pid, ticker, pos["shares"], pos["cost_total"], pos["realized"]),
+        )
+
+    def _record(self, con, pid, ticker, day, side, shares, price, fee):
+        con.execute(
+            "INSERT INTO transactions (pid, ticker, date, side, shares, price, fee, created_at) "
+            "VALUES (?,?,?,?,?,?,?,?)",
+            (pid, ticker, day, side, shares, price, fee, time.time()),
+        )
+
+    # --- 帳本管理 ---
+    def ensure_portfolio(self, pid=DEFAULT_PORTFOLIO, seed=()):
+        """第一次使用某個帳本時建立，並以 seed ([{"ticker", "shares", "cost"}]) 設定初始持股。"""
+        with self._lock, self._connect() as con:
+            created = con.execute(
+                "INSERT OR IGNORE INTO portfolios (pid, created_at) VALUES (?,?)", (pid, time.time())
+            ).rowcount
+        if created:
+            for item in seed:
+                self.set_position(pid, item["ticker"], item["shares"], item["cost"])
+        return bool(created)
+
+    def portfolio_ids(self):
+        with self._connect() as con:
+            return [r[0] for r in con.execute("SELECT pid FROM portfolios ORDER BY created_at")]
+
+    def _apply(self, con, book, pid, ticker, side, shares, price, day, fee=0.0):
+        """套用單筆交易並更新 book (需在 self._lock 內、con 的資料庫交易中呼叫)。"""
+        pos = dict(book.get(ticker) or {"shares": 0.0, "cost_total": 0.0, "realized": 0.0})
+        if side == "BUY":
+            self._record(con, pid, ticker, day, "BUY", shares, price, fee)
+            con.execute(
+                "INSERT INTO lots (pid, ticker, open_date, shares, remaining, cost) VALUES (?,?,?,?,?,?)",
+                (pid, ticker, day, shares, shares, price + fee / shares if shares else price),
+            )
+            pos["shares"] += shares
+            pos["cost_total"] += shares * price + fee
+        elif side == "SELL":
+            # 以 FIFO 沖銷批次，已實現損益累計在部位上
+            if shares > pos["shares"] + EPS:
+                raise ValueError(f"{ticker} 持有 {pos['shares']:g} 股，不足賣出 {shares:g} 股")
+            self._record(con, pid, ticker, day, "SELL", shares, price, fee)
+            left = shares
+            lots = con.execute(
+                "SELECT id, remaining, cost FROM lots WHERE pid=? AND ticker=? AND remaining>0 "
+                "ORDER BY open_date, id", (pid, ticker),
+            ).fetchall()
+            for lot_id, remaining, cost in lots:
+                if left <= EPS:
+                    break
+                take = min(remaining, left)
+                con.execute("UPDATE lots SET remaining=? WHERE id=?", (remaining - take, lot_id))
+                pos["realized"] += take * (price - cost)
+                pos["cost_total"] -= take * cost
+                left -= take
+            pos["realized"] -= fee
+            pos["shares"] -= shares
+            if pos["shares"] <= EPS:
+                pos["shares"], pos["cost_total"] = 0.0, 0.0
+        elif side == "SET":
+            # 直接設定持股與平均成本：結清舊批次，開一個新批次
+            self._record(con, pid, ticker, day, "SET", shares, price, 0.0)
+            con.execute("UPDATE lots SET remaining=0 WHERE pid=? AND ticker=? AND remaining>0", (pid, ticker))
+            if shares > EPS:
+                con.execute(
+                    "INSERT INTO lots (pid, ticker, open_date, shares, remaining, cost) VALUES (?,?,?,?,?,?)",
+                    (pid, ticker, day, shares, shares, price),
+                )
+            pos = {"shares": float(shares), "cost_total": float(shares) * price, "realized": pos["realized"]}
+        else:
+            raise ValueError(f"未知的交易類別 {side!r}")
+        self._save_position(con, pid, ticker, pos)
+        book[ticker] = pos
+
+    # --- 交易 ---
+    def buy(self, pid, ticker, shares, price, day=None, fee=0.0):
+        day = day or _date.today().isoformat()
+        with self._writing(pid) as (con, book):
+            self._apply(con, book, pid, ticker, "BUY", shares, price, day, fee)
+
+    def sell(self, pid, ticker, shares, price, day=None, fee=0.0):
+        """以 FIFO 沖銷批次，已實現損益累計在部位上。"""
+        day = day or _date.today().isoformat()
+        with self._writing(pid) as (con, book):
+            self._apply(con, book, pid, ticker, "SELL", shares, price, day, fee)
+
+    def set_position(self, pid, ticker, shares, cost, day=None):
+        """直接設定持股與平均成本 (側邊欄「新增/更新」)：結清舊批次，開一個新批次。"""
+        day = day or _date.today().isoformat()
+        with self._writing(pid) as (con, book):
+            self._apply(con, book, pid, ticker, "SET", shares, cost, day)
+
+    def apply_batch(self, pid, rows):
+        """批次匯入：rows 為 (ticker, side, shares, price, date, fee) 的序列，依序在同一個資料庫交易中套用。
+
+        任一筆失敗 (例如賣超) 整批回復，帳本維持原狀。
+        """
+        n = 0
+        with self._writing(pid) as (con, book):
+            con.execute("INSERT OR IGNORE INTO portfolios (pid, created_at) VALUES (?,?)", (pid, time.time()))
+            for n, (ticker, side, shares, price, day, fee) in enumerate(rows, start=1):
+                try:
+                    self._apply(con, book, pid, ticker, side, shares, price, day, fee)
+                except ValueError as e:
+                    raise ValueError(f"第 {n} 筆 ({day} {side} {ticker}): {e}") from e
+        return n
+
+    def remove(self, pid, ticker):
+        self.set_position(pid, ticker, 0.0, 0.0)
+
+    def clear(self, pid):
+        for t in [t for t, p in self.positions_map(pid).items()]:
+            self.remove(pid, t)
+
+    # --- 查詢 ---
+    def position(self, pid, ticker):
+        with self._lock:
+            pos = self._book(pid).get(ticker)
+            return _position_dict(ticker, **pos) if pos else None
+
+    def positions_map(self, pid=DEFAULT_PORTFOLIO):
+        with self._lock:
+            return {t: _position_dict(t, **p) for t, p in self._book(pid).items() if p["shares"] > EPS}
+
+    def positions(self, pid=DEFAULT_PORTFOLIO):
+        """目前持股，格式與原本的 st.session_state.portfolio 相同 (另多 realized)。"""
+        return list(self.positions_map(pid).values())
+
+    def realized(self, pid=DEFAULT_PORTFOLIO):
+        """已實現損益合計 (各標的報價幣別直接相加；跨幣別請用 realized_by_ticker 換匯)。"""
+        with self._lock:
+            return sum(p["realized"] for p in self._book(pid).values())
+
+    def realized_by_ticker(self, pid=DEFAULT_PORTFOLIO):
+        """{ticker: 已實現損益}，以該標的報價幣別計，含已出清的標的。"""
+        with self._lock:
+            return {t: p["realized"] for t, p in self._book(pid).items() if p["realized"]}
+
+    def lots(self, pid, ticker, open_only=True):
+        sql = "SELECT open_date, shares, remaining, cost FROM lots WHERE pid=? AND ticker=?"
+        if open_only:
+            sql += " AND remaining>0"
+        with self._connect() as con:
+            rows = con.execute(sql + " ORDER BY open_date, id", (pid, ticker)).fetchall()
+        return [dict(zip(("open_date", "shares", "remaining", "cost"), r)) for r in rows]
+
+    def transactions(self, pid, ticker=None, start=None, end=None):
+        sql = "SELECT date, ticker, side, shares, price, fee FROM transactions WHERE pid=?"
+        params = [pid]
+        if ticker is not None:
+            sql += " AND ticker=?"
+            params.append(ticker)
+        if start is not None:
+            sql += " AND date>=?"
+            params.append(str(start))
+        if end is not None:
+            sql += " AND date<=?"
+            params.append(str(end))
+        with self._connect() as con:
+            rows = con.execute(sql + " ORDER BY date, id", params).fetchall()
+        return [dict(zip(("date", "ticker", "side", "shares", "price", "fee"), r)) for r in rows]
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger():
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = Ledger()
+        return _ledger
@@ -0,0 +1,180 @@
+"""
+跨 session 共用的行情快取。
+
+以 (ticker, period, interval) 為鍵，整個 Streamlit 伺服器行程共用一份：
+- TTL 過期後才重新向本地 K 線庫 / yfinance 同步
+- 依 DataFrame 佔用記憶體做 LRU 淘汰
+- 同一標的同時只會有一個下載在進行 (single-flight)，其他 session 等待同一結果
+- hits / misses / coalesced 等計數可由 stats() 取得，用來調整容量
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import bar_store
+import profiling
+import pyramid
+import resilience
+
+DEFAULT_TTL = float(os.environ.get("GUPIAO_CACHE_TTL", 60))
+DEFAULT_MAX_BYTES = int(float(os.environ.get("GUPIAO_CACHE_MB", 256)) * 1024 * 1024)
+
+
+def store_loader(tickers, period, interval):
+    """預設載入器：增量同步本地 K 線庫後讀出 {ticker: OHLCV}。"""
+    store = bar_store.get_store()
+    # 逐檔重試 + 斷路；抓不到的標的沿用本地庫裡上次成功的資料
+    store.sync(tickers, period=period, interval=interval, fetch=resilience.get_fetcher())
+    if interval == pyramid.BASE:
+        # 新 K 線進來時順便更新 1h / 1d / 1wk 聚合層
+        pyramid.update_many(tickers, store)
+    return store.frames(tickers, period=period, interval=interval)
+
+
+def _nbytes(df):
+    return int(df.memory_usage(index=True, deep=False).sum()) if df is not None else 0
+
+
+class MarketCache:
+    def __init__(self, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES, loader=store_loader):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self._entries = OrderedDict()  # key -> (expires_at, df, nbytes)
+        self._inflight = {}  # key -> Future
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = dict(hits=0, misses=0, coalesced=0, evictions=0, loads=0, load_errors=0)
+
+    # --- 內部：需在 self._lock 內呼叫 ---
+    def _lookup(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < now:
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _drop(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _put(self, key, df, now):
+        if key in self._entries:
+            self._drop(key)
+        size = _nbytes(df)
+        self._entries[key] = (now + self.ttl, df, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            self._drop(next(iter(self._entries)))
+            self._stats["evictions"] += 1
+
+    # --- 對外 ---
+    def get_many(self, tickers, period="5d", interval="15m"):
+        """回傳 {ticker: OHLCV DataFrame}；查無資料的標的對應 None。"""
+        now = time.monotonic()
+        result, owned, waiting = {}, {}, {}
+        with self._lock:
+            for t in dict.fromkeys(tickers):
+                key = (t, period, interval)
+                entry = self._lookup(key, now)
+                if entry is not None:
+                    self._stats["hits"] += 1
+                    result[t] = entry[1]
+                elif key in self._inflight:
+                    self._stats["coalesced"] += 1
+                    waiting[t] = self._inflight[key]
+                else:
+                    self._stats["misses"] += 1
+                    owned[t] = self._inflight[key] = Future()
+
+        profiling.count("cache.hits", len(result))
+        profiling.count("cache.coalesced", len(waiting))
+        profiling.count("cache.misses", len(owned))
+        return self._collect(result, owned, waiting, period, interval)
+
+    def refresh(self, tickers, period="5d", interval="15m"):
+        """不論 TTL 強制重新載入 (背景輪詢用)；已在下載中的標的直接等待該次結果。"""
+        owned, waiting = {}, {}
+        with self._lock:
+            for t in dict.fromkeys(tickers):
+                key = (t, period, interval)
+                if key in self._inflight:
+                    waiting[t] = self._inflight[key]
+                else:
+                    self._stats["misses"] += 1
+                    owned[t] = self._inflight[key] = Future()
+        return self._collect({}, owned, waiting, period, interval)
+
+    def _collect(self, result, owned, waiting, period, interval):
+        if owned:
+            self._load(list(owned), period, interval, owned)
+        for t, fut in {**owned, **waiting}.items():
+            result[t] = fut.result()
+        return result
+
+    def _load(self, tickers, period, interval, futures):
+        try:
+            frames = self.loader(tickers, period, interval)
+        except BaseException as e:
+            with self._lock:
+                self._stats["load_errors"] += 1
+                for t in tickers:
+                    self._inflight.pop((t, period, interval), None)
+            for t in tickers:
+                futures[t].set_exception(e)
+            raise
+        now = time.monotonic()
+        with self._lock:
+            self._stats["loads"] += 1
+            for t in tickers:
+                # 查無資料也快取 (負向快取)，避免壞代碼每次重跑都打上游
+                self._put((t, period, interval), frames.get(t), now)
+                self._inflight.pop((t, period, interval), None)
+        for t in tickers:
+            futures[t].set_result(frames.get(t))
+
+    def invalidate(self, tickers=None):
+        with self._lock:
+            for key in list(self._entries):
+                if tickers is None or key[0] in tickers:
+                    self._drop(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"] + self._stats["coalesced"]
+            return dict(
+                self._stats,
+                entries=len(self._entries),
+                bytes=self._bytes,
+                max_bytes=self.max_bytes,
+                inflight=len(self._inflight),
+                hit_rate=(self._stats["hits"] + self._stats["coalesced"]) / lookups if lookups else 0.0,
+            )
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """行程內唯一的 MarketCache (Streamlit 重新執行腳本時模組不會重新載入)。"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = MarketCache()
+        return _cache
+
+
+def download_bars(tickers, period="5d", interval="15m"):
+    """經共用快取取得 K 線，回傳與 yf.download(group_by='ticker') 相同結構的 DataFrame。"""
+    frames = get_cache().get_many(tickers, period, interval)
+    return bar_store.combine({t: df for t, df in frames.items() if df is not None}, list(tickers))
+
+
+def stats():
+    return get_cache().stats()
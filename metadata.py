@@ -0,0 +1,162 @@
+"""
+公司資料 / Logo 解析服務。
+
+yf.Ticker(t).info 是整個 App 最慢的呼叫，因此：
+- 在有上限的執行緒池中背景解析 website、logo、sector、currency
+- 結果寫入磁碟 (metadata.json)，有效期很長，伺服器重啟後仍可用；有新結果後最多 SAVE_DELAY 秒
+  由計時器把當下內容的複本寫出 (鎖外寫檔)，解析不停進來時也會定期落地，且不擋住查詢
+- 尚未解析完成時立即回傳 ui-avatars 預設頭像，頁面繪製永遠不等待
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import profiling
+from bar_store import DATA_DIR
+
+CACHE_PATH = os.path.join(DATA_DIR, "metadata.json")
+TTL = 7 * 24 * 3600  # 公司資料一週內視為有效
+FAILED_TTL = 3600  # 查詢失敗者一小時後再試
+MAX_WORKERS = int(os.environ.get("GUPIAO_METADATA_WORKERS", 4))
+SAVE_DELAY = 5.0  # 有新結果後多久寫一次快取檔 (秒)
+
+
+def fallback_logo(ticker):
+    return f"https://ui-avatars.com/api/?name={ticker}&background=00ffcc&color=000"
+
+
+def fallback(ticker):
+    return {"ticker": ticker, "website": "", "logo": fallback_logo(ticker), "sector": None,
+            "currency": None, "name": None, "resolved_at": 0, "ok": False}
+
+
+def fetch_info(ticker):
+    """向 yfinance 取得單一標的的公司資料並整理成快取格式。"""
+    import yfinance as yf
+
+    profiling.count("upstream.yf_info")
+    info = yf.Ticker(ticker).info or {}
+    website = info.get('website', '') or ''
+    domain = website.replace('https://', '').replace('http://', '').split('/')[0]
+    return {
+        "ticker": ticker,
+        "website": domain,
+        "logo": f"https://logo.clearbit.com/{domain}" if domain else fallback_logo(ticker),
+        "sector": info.get("sector"),
+        "currency": info.get("currency"),
+        "name": info.get("shortName") or info.get("longName"),
+        "resolved_at": time.time(),
+        # quoteType 存在代表 Yahoo 認得這個代碼
+        "ok": bool(info.get("quoteType") or info.get("currency")),
+    }
+
+
+class MetadataService:
+    def __init__(self, path=CACHE_PATH, max_workers=MAX_WORKERS, fetch=fetch_info, save_delay=SAVE_DELAY):
+        self.path = path
+        self.fetch = fetch
+        self.save_delay = save_delay
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="metadata")
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # 只讓一個執行緒寫檔
+        self._timer = None
+        self._pending = {}
+        self._data = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, data):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def flush(self):
+        """立即把目前內容寫進快取檔 (計時器到期與行程結束時呼叫)。"""
+        with self._save_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                data = dict(self._data)
+            self._save(data)
+
+    def _fresh(self, entry, now):
+        ttl = TTL if entry.get("ok") else FAILED_TTL
+        return now - entry.get("resolved_at", 0) < ttl
+
+    def _resolve(self, ticker):
+        try:
+            entry = self.fetch(ticker)
+        except Exception:
+            # 上游失敗 (與「查無此代碼」不同)：批次匯入時不據此擋下
+            entry = dict(fallback(ticker), resolved_at=time.time(), error=True)
+        with self._lock:
+            self._data[ticker] = entry
+            self._pending.pop(ticker, None)
+            # 不要每檔都重寫整個快取檔：第一筆新結果啟動計時器，到期時一次寫出期間累積的結果
+            if self._timer is None:
+                self._timer = threading.Timer(self.save_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return entry
+
+    def _schedule(self, ticker):
+        # 需在 self._lock 內呼叫
+        if ticker not in self._pending:
+            self._pending[ticker] = self._pool.submit(self._resolve, ticker)
+        return self._pending[ticker]
+
+    def get_many(self, tickers):
+        """立即回傳 {ticker: 資料}；缺少或過期的標的丟到背景解析，先給預設值。"""
+        now = time.time()
+        out = {}
+        with self._lock:
+            for t in tickers:
+                entry = self._data.get(t)
+                if entry is None or not self._fresh(entry, now):
+                    self._schedule(t)
+                out[t] = entry or fallback(t)
+        return out
+
+    def resolve_many(self, tickers, timeout=None):
+        """同步解析 (批次匯入驗證代碼時使用)：已快取者直接回傳，其餘平行查詢並等待。"""
+        now = time.time()
+        with self._lock:
+            futures = {t: self._schedule(t) for t in tickers
+                       if t not in self._data or not self._fresh(self._data[t], now)}
+        for fut in futures.values():
+            fut.result(timeout=timeout)
+        with self._lock:
+            return {t: self._data.get(t, fallback(t)) for t in tickers}
+
+    def pending(self):
+        with self._lock:
+            return list(self._pending)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service():
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = MetadataService()
+            atexit.register(_service.flush)
+        return _service
+
+
+def logo_urls(tickers):
+    """{ticker: logo URL}，不阻塞。"""
+    return {t: m["logo"] for t, m in get_service().get_many(tickers).items()}
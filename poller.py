@@ -0,0 +1,177 @@
+"""
+背景行情輪詢。
+
+每個伺服器行程只啟動一條背景執行緒，定時刷新所有 session 正在看的標的，
+並發布不可變的快照 (Snapshot)。Streamlit 每次重新執行只讀最新快照來繪圖，
+切換幣別、選股、換分頁或 st_autorefresh 都不再等待網路。
+"""
+import logging
+import os
+import threading
+import time
+from types import MappingProxyType
+
+import bar_store
+import market_cache
+import profiling
+
+POLL_SECONDS = float(os.environ.get("GUPIAO_POLL_SECONDS", 60))
+IDLE_EXPIRY = 600  # 超過 10 分鐘沒有 session 讀取的標的不再輪詢
+
+log = logging.getLogger(__name__)
+
+
+class Snapshot:
+    """某一時間點的行情快照；發布後不再修改 (frames 為唯讀 mapping)。"""
+
+    __slots__ = ("frames", "taken_at", "version")
+
+    def __init__(self, frames, taken_at, version):
+        self.frames = MappingProxyType(dict(frames))
+        self.taken_at = taken_at
+        self.version = version
+
+    def frame(self, tickers):
+        return bar_store.combine(self.frames, list(tickers))
+
+    def age(self):
+        return time.time() - self.taken_at if self.taken_at else float("inf")
+
+
+class MarketPoller:
+    def __init__(self, period="5d", interval="15m", every=POLL_SECONDS, cache=None):
+        self.period = period
+        self.interval = interval
+        self.every = every
+        self.cache = cache or market_cache.get_cache()
+        self._watch = {}  # ticker -> 最後被讀取的時間
+        self._sources = {}  # 名稱 -> 回傳標的清單的函式 (如所有投資組合的聯集)
+        self._listeners = {}  # 名稱 -> 每次發布後呼叫的函式 (snapshot, 本次更新的 frames)
+        self._snapshot = Snapshot({}, 0.0, 0)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name=f"poller-{self.period}-{self.interval}", daemon=True
+                )
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def watch(self, tickers):
+        """登記 session 正在看的標的；新出現的標的會叫醒輪詢執行緒。"""
+        now = time.monotonic()
+        with self._lock:
+            new = [t for t in tickers if t not in self._watch]
+            for t in tickers:
+                self._watch[t] = now
+        if new:
+            self._wake.set()
+
+    def add_source(self, name, fn):
+        """登記額外的標的來源；同名來源只會保留一個。"""
+        with self._lock:
+            new = name not in self._sources
+            self._sources[name] = fn
+        if new:
+            self._wake.set()
+
+    def add_listener(self, name, fn):
+        """登記快照發布後要執行的函式 (如警示規則檢查)；同名只保留一個。"""
+        with self._lock:
+            self._listeners[name] = fn
+
+    def universe(self):
+        """本週期要刷新的標的：近期被讀取的標的 ∪ 各來源的標的。"""
+        cutoff = time.monotonic() - IDLE_EXPIRY
+        with self._lock:
+            for t in [t for t, seen in self._watch.items() if seen < cutoff]:
+                del self._watch[t]
+            tickers = dict.fromkeys(self._watch)
+            sources = list(self._sources.values())
+        for fn in sources:
+            try:
+                tickers.update(dict.fromkeys(fn()))
+            except Exception:
+                log.exception("universe source failed")
+        return list(tickers)
+
+    def latest(self):
+        return self._snapshot
+
+    def publish(self, frames):
+        """把新抓到的 frames 合併進目前快照並發布新版本。"""
+        fresh = {t: df for t, df in frames.items() if df is not None}
+        with self._lock:
+            merged = dict(self._snapshot.frames)
+            merged.update(fresh)
+            snap = self._snapshot = Snapshot(merged, time.time(), self._snapshot.version + 1)
+            listeners = list(self._listeners.values())
+        for fn in listeners:
+            try:
+                fn(snap, fresh)
+            except Exception:
+                log.exception("snapshot listener failed")
+        return snap
+
+    def poll_once(self):
+        tickers = self.universe()
+        if not tickers:
+            return self._snapshot
+        return self.publish(self.cache.refresh(tickers, self.period, self.interval))
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+            except Exception:
+                # 保留上一份快照，下個週期再試
+                log.exception("market poll failed")
+            self._wake.wait(self.every)
+            self._wake.clear()
+
+
+_pollers = {}
+_pollers_lock = threading.Lock()
+
+
+def get_poller(period="5d", interval="15m"):
+    """每組 (period, interval) 在行程內只有一個輪詢器，第一次取用時啟動。"""
+    with _pollers_lock:
+        key = (period, interval)
+        if key not in _pollers:
+            _pollers[key] = MarketPoller(period, interval).start()
+        return _pollers[key]
+
+
+def latest_bars(tickers, period="5d", interval="15m"):
+    """從最新快照組出 K 線 (與 yf.download(group_by='ticker') 同結構)。
+
+    快照裡還沒有的標的 (剛新增的持股) 會經共用快取同步補抓一次並發布，
+    之後就交給背景執行緒定時刷新。
+    """
+    poller = get_poller(period, interval)
+    poller.watch(tickers)
+    snap = poller.latest()
+    missing = [t for t in tickers if t not in snap.frames]
+    profiling.count("snapshot.reads")
+    if missing:
+        profiling.count("snapshot.fills", len(missing))
+        try:
+            frames = poller.cache.get_many(missing, period, interval)
+        except Exception:
+            # 補抓失敗也照常回傳快照裡已有的標的，讓頁面顯示部分結果
+            log.exception("initial fetch for %s failed", missing)
+            frames = {}
+        if any(df is not None for df in frames.values()):
+            snap = poller.publish(frames)
+    return snap.frame(tickers)
@@ -0,0 +1,266 @@
+"""
+持股批次匯入 / 匯出。
+
+匯入：CSV (含券商對帳單常見欄名) 以 pandas 分塊串流讀取，每塊向量化整理欄位與型別，
+新出現的代碼分批交給 metadata 服務驗證 (已快取者不再查詢)，最後依日期排序，
+在帳本的同一個資料庫交易裡一次寫入 (Ledger.apply_batch)，不必一筆一筆經側邊欄表單重跑。
+兩種格式：
+  transactions  每列一筆交易 (BUY / SELL / SET)，依 FIFO 沖銷批次
+  positions     每列一檔目前持股 (股數 + 平均成本)，等同逐檔「新增/更新」
+匯出：目前持股與損益 (依最新行情快照估值) 輸出為 CSV 或 Parquet。
+"""
+import io
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+import metadata
+
+CHUNK_ROWS = 50_000
+VALIDATE_TIMEOUT = 30  # 秒；整批代碼驗證的等待上限
+
+# 標準欄位 -> 可接受的欄名 (比對時忽略大小寫與空白)
+ALIASES = {
+    "ticker": ["ticker", "symbol", "code", "代碼", "股票", "股票代碼", "證券代號", "instrument"],
+    "side": ["side", "action", "type", "transaction type", "buy/sell", "買賣", "買賣別", "交易類別"],
+    "shares": ["shares", "quantity", "qty", "units", "股數", "數量", "成交股數"],
+    "price": ["price", "cost", "avg cost", "average cost", "trade price", "平均成本", "成本", "成交價", "成交單價"],
+    "date": ["date", "trade date", "settlement date", "日期", "成交日期", "交易日期"],
+    "fee": ["fee", "fees", "commission", "commissions", "手續費", "費用"],
+}
+SIDES = {
+    "BUY": "BUY", "B": "BUY", "BOT": "BUY", "BOUGHT": "BUY", "買": "BUY", "買進": "BUY", "現買": "BUY",
+    "SELL": "SELL", "S": "SELL", "SLD": "SELL", "SOLD": "SELL", "賣": "SELL", "賣出": "SELL", "現賣": "SELL",
+    "SET": "SET",
+}
+MODES = {"transactions": "交易明細", "positions": "目前持股"}
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0  # 讀到的資料列數
+        self.applied = 0  # 寫入帳本的筆數
+        self.tickers = set()
+        self.unverified = set()  # 驗證時上游失敗的代碼 (仍已匯入)
+        self.rejected = []  # [(列號, 原因)]，列號從 1 起算 (不含標題列)
+
+    def reject(self, rows, reason):
+        self.rejected.extend((int(r), reason) for r in rows)
+
+    def rejected_frame(self):
+        return pd.DataFrame(self.rejected, columns=["row", "reason"]).sort_values("row", kind="stable")
+
+    def __repr__(self):
+        return f"ImportReport(rows={self.rows}, applied={self.applied}, rejected={len(self.rejected)})"
+
+
+def _normalize(name):
+    return " ".join(str(name).strip().lower().replace("_", " ").split())
+
+
+def column_map(columns):
+    """原始欄名 -> 標準欄名；認不得的欄位忽略。"""
+    lookup = {_normalize(a): std for std, names in ALIASES.items() for a in names}
+    out = {}
+    for col in columns:
+        std = lookup.get(_normalize(col))
+        if std and std not in out.values():
+            out[col] = std
+    return out
+
+
+def _number(s):
+    """去掉千分位、貨幣符號與括號負數後轉成浮點數；無法解析者為 NaN。"""
+    if s.dtype.kind in "fiu":
+        return s.astype(float)
+    text = s.astype(str).str.strip().str.replace(r"[,$\s]", "", regex=True)
+    text = text.str.replace(r"^\((.*)\)$", r"-\1", regex=True)
+    return pd.to_numeric(text, errors="coerce")
+
+
+def parse_chunk(chunk, mode, first_row, report, today=None):
+    """整理一塊原始資料，回傳欄位為 ticker/side/shares/price/date/fee/row 的 DataFrame (已剔除無效列)。"""
+    cols = column_map(chunk.columns)
+    # 先挑出認得的欄位再改名，未採用的同名欄 (例如匯出檔的現價 price) 才不會與成本撞名
+    df = chunk[list(cols)].rename(columns=cols)
+    n = len(df)
+    out = pd.DataFrame({"row": np.arange(first_row, first_row + n)}, index=df.index)
+    if "ticker" not in df or "shares" not in df:
+        raise ValueError("找不到代碼或股數欄位 (例如 ticker / symbol、shares / quantity)")
+    # 空白儲存格先補成空字串：新版 pandas 的 astype(str) 會保留 NaN，檢查時才認得出缺少代碼
+    out["ticker"] = df["ticker"].fillna("").astype(str).str.strip().str.upper()
+    shares = _number(df["shares"])
+    out["price"] = _number(df["price"]) if "price" in df else np.nan
+    out["fee"] = _number(df["fee"]).fillna(0.0).abs() if "fee" in df else 0.0
+
+    if mode == "positions":
+        out["side"] = "SET"
+    elif "side" in df:
+        out["side"] = df["side"].astype(str).str.strip().str.upper().map(SIDES)
+    else:
+        # 沒有買賣欄位時以股數正負判斷 (常見於券商對帳單)
+        out["side"] = np.where(shares < 0, "SELL", "BUY")
+    out["shares"] = shares.abs()
+
+    today = today or date.today().isoformat()
+    if "date" in df:
+        days = pd.to_datetime(df["date"], errors="coerce", format="mixed")
+        out["date"] = days.dt.strftime("%Y-%m-%d")
+        bad_date = days.isna() & df["date"].notna()
+        out.loc[df["date"].isna(), "date"] = today
+    else:
+        out["date"] = today
+        bad_date = pd.Series(False, index=df.index)
+
+    checks = [
+        (out["ticker"].isin(["", "NAN", "NONE"]), "缺少代碼"),
+        (out["side"].isna(), "無法辨識的買賣別"),
+        (out["shares"].isna(), "股數不是數字"),
+        ((out["shares"] <= 0) & (out["side"] != "SET"), "股數必須大於 0"),
+        (out["price"].isna() | (out["price"] < 0), "價格 / 成本缺少或為負"),
+        (bad_date, "無法辨識的日期"),
+    ]
+    bad = pd.Series(False, index=df.index)
+    for mask, reason in checks:
+        hit = mask & ~bad
+        if hit.any():
+            report.reject(out.loc[hit, "row"], reason)
+        bad |= mask
+    return out[~bad]
+
+
+def read_chunks(source, chunksize=CHUNK_ROWS, encoding="utf-8-sig"):
+    """source 可為路徑或檔案物件 (st.file_uploader 的結果)；逐塊回傳原始 DataFrame (字串欄位)。"""
+    return pd.read_csv(source, chunksize=chunksize, dtype=str, encoding=encoding, skipinitialspace=True)
+
+
+def validate_tickers(tickers, service=None, timeout=VALIDATE_TIMEOUT):
+    """批次向 metadata 服務確認代碼；回傳 (查無此代碼, 無法確認)。
+
+    上游失敗或逾時的代碼算「無法確認」，照常匯入，只在報告中列出。
+    """
+    service = service or metadata.get_service()
+    tickers = sorted(tickers)
+    try:
+        info = service.resolve_many(tickers, timeout=timeout)
+    except TimeoutError:
+        info = service.get_many(tickers)
+    unknown, unverified = set(), set()
+    for t, entry in info.items():
+        if entry.get("ok"):
+            continue
+        if entry.get("error") or not entry.get("resolved_at"):
+            unverified.add(t)
+        else:
+            unknown.add(t)
+    return unknown, unverified
+
+
+def import_csv(ledger, pid, source, mode="transactions", validate=True, chunksize=CHUNK_ROWS, service=None):
+    """串流解析 source 並一次寫入帳本；回傳 ImportReport。
+
+    有任何一筆無法套用 (例如賣出超過持有) 時整批不寫入並拋出 ValueError。
+    """
+    if mode not in MODES:
+        raise ValueError(f"unknown import mode {mode!r}")
+    report = ImportReport()
+    parts, seen, unknown = [], set(), set()
+    for chunk in read_chunks(source, chunksize):
+        part = parse_chunk(chunk, mode, report.rows + 1, report)
+        report.rows += len(chunk)
+        if validate:
+            # 每塊只查這塊新出現的代碼；已驗證過的不重複查詢
+            new = set(part["ticker"].unique()) - seen
+            seen |= new
+            if new:
+                bad_new, unsure = validate_tickers(new, service)
+                unknown |= bad_new
+                report.unverified |= unsure
+            bad = part["ticker"].isin(unknown)
+            if bad.any():
+                report.reject(part.loc[bad, "row"], "查無此代碼")
+                part = part[~bad]
+        parts.append(part)
+    if not parts:
+        return report
+
+    rows = pd.concat(parts, ignore_index=True)
+    # 對帳單常是新到舊排列：依日期重排 (同日保持檔案順序) 再套用，FIFO 才正確
+    rows = rows.sort_values(["date", "row"], kind="stable")
+    report.tickers = set(rows["ticker"])
+    report.applied = ledger.apply_batch(pid, zip(
+        rows["ticker"], rows["side"], rows["shares"].astype(float), rows["price"].astype(float),
+        rows["date"], rows["fee"].astype(float),
+    ))
+    return report
+
+
+# --- 匯出 ---
+def positions_frame(ledger, pid, val=None):
+    """目前持股與損益；val 為 valuation.Valuation (未給則依最新行情快照估值)。"""
+    positions = ledger.positions(pid)
+    df = pd.DataFrame(positions, columns=["ticker", "shares", "cost", "realized"])
+    if val is None and positions:
+        from fx import value_portfolio_in
+        from poller import latest_bars
+
+        val = value_portfolio_in(latest_bars(list(df["ticker"])), positions, "USD")
+    if val is not None and len(df):
+        h = val.holdings().drop_duplicates("ticker").set_index("ticker")
+        cols = ["price", "market_value", "cost_basis", "profit", "profit_pct", "weight"]
+        df = df.join(h[cols], on="ticker")
+    return df
+
+
+def to_csv_bytes(df):
+    return df.to_csv(index=False).encode("utf-8-sig")
+
+
+def to_parquet_bytes(df):
+    buf = io.BytesIO()
+    df.to_parquet(buf, index=False)
+    return buf.getvalue()
+
+
+# --- 側邊欄面板 ---
+def panel(ledger, pid, key="bulk"):
+    """批次匯入 / 匯出的側邊欄內容；匯入成功後重跑頁面。"""
+    import streamlit as st
+
+    mode = st.radio("檔案格式", list(MODES), format_func=MODES.get, horizontal=True, key=f"{key}_mode")
+    upload = st.file_uploader("CSV 檔 (交易明細或券商對帳單)", type=["csv"], key=f"{key}_file")
+    validate = st.checkbox("匯入前驗證代碼", value=True, key=f"{key}_validate")
+    if upload is not None and st.button("開始匯入", key=f"{key}_run"):
+        try:
+            with st.spinner("解析與驗證中..."):
+                report = import_csv(ledger, pid, upload, mode, validate)
+        except ValueError as e:
+            st.error(f"匯入失敗，帳本未變更：{e}")
+        else:
+            st.session_state[f"{key}_report"] = report
+            st.rerun()
+    report = st.session_state.get(f"{key}_report")
+    if report is not None:
+        st.success(f"已匯入 {report.applied} 筆 ({len(report.tickers)} 檔)，略過 {len(report.rejected)} 筆")
+        if report.unverified:
+            st.caption(f"以下代碼暫時無法驗證，已照常匯入：{', '.join(sorted(report.unverified)[:20])}")
+        if report.rejected:
+            st.dataframe(report.rejected_frame(), hide_index=True, height=200)
+
+    # 匯出檔案按下才產生，避免每次重跑都序列化整個帳本
+    if st.button("準備匯出檔", key=f"{key}_export"):
+        df = positions_frame(ledger, pid)
+        st.session_state[f"{key}_csv"] = to_csv_bytes(df)
+        try:
+            st.session_state[f"{key}_parquet"] = to_parquet_bytes(df)
+        except ImportError:
+            st.session_state[f"{key}_parquet"] = None
+    if st.session_state.get(f"{key}_csv") is not None:
+        st.download_button("下載 CSV", st.session_state[f"{key}_csv"], f"{pid}-positions.csv", "text/csv",
+                           key=f"{key}_dl_csv")
+        if st.session_state.get(f"{key}_parquet") is not None:
+            st.download_button("下載 Parquet", st.session_state[f"{key}_parquet"], f"{pid}-positions.parquet",
+                               "application/octet-stream", key=f"{key}_dl_parquet")
+        else:
+            st.caption("未安裝 pyarrow，無法輸出 Parquet。")
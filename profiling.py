@@ -0,0 +1,216 @@
+"""
+每次重跑的分段計時與剖析。
+
+Streamlit 每次重跑都在自己的執行緒裡從頭執行腳本，因此以 thread-local 記住「目前這次重跑」：
+- stage(name, rows=...)：量測一段程式的耗時，並附上處理的列數 / 點數等資訊
+- count(name, n)：上游呼叫次數、快取命中等計數；背景執行緒 (輪詢、Logo 解析) 沒有
+  目前重跑，只計入行程累計
+- 重跑結束時一筆 JSON 寫入 .gupiao/metrics.jsonl，頁面上可開 debug_panel 查看
+- profile=True 時整次重跑以 cProfile 剖析，結果存成 .prof 並在面板列出最耗時的函式
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+METRICS_ENABLED = os.environ.get("GUPIAO_METRICS", "1") != "0"
+PROFILE_TOP = 25  # 面板列出的函式數
+
+_local = threading.local()
+_totals = Counter()
+_totals_lock = threading.Lock()
+
+
+class Rerun:
+    """一次重跑的量測結果。"""
+
+    def __init__(self, page, profile=False):
+        self.page = page
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.stages = []  # [{"stage", "ms", "depth", ...資訊}]
+        self.counters = Counter()
+        self.total_ms = None
+        self.profile_text = None
+        self.profile_path = None
+        self._depth = 0
+        self._profiler = cProfile.Profile() if profile else None
+        if self._profiler:
+            self._profiler.enable()
+
+    @contextmanager
+    def stage(self, name, **info):
+        """with rec.stage("valuation", rows=n) as info: ... (可在區塊內補上 info["points"] 等)"""
+        entry = {"stage": name, "ms": None, "depth": self._depth}
+        self.stages.append(entry)
+        self._depth += 1
+        t0 = time.perf_counter()
+        try:
+            yield info
+        finally:
+            entry["ms"] = (time.perf_counter() - t0) * 1000
+            entry.update(info)
+            self._depth -= 1
+
+    def finish(self):
+        self.total_ms = (time.perf_counter() - self._t0) * 1000
+        if self._profiler:
+            self._profiler.disable()
+            self.profile_path = _save_profile(self._profiler, self.page, self.started)
+            out = io.StringIO()
+            pstats.Stats(self._profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP)
+            self.profile_text = out.getvalue()
+            self._profiler = None
+        return self
+
+    def record(self):
+        return {
+            "page": self.page,
+            "ts": self.started,
+            "total_ms": self.total_ms,
+            "stages": self.stages,
+            "counters": dict(self.counters),
+            "profile": self.profile_path,
+        }
+
+
+def _data_dir():
+    # 延後載入：bar_store 本身也會呼叫 count()
+    from bar_store import DATA_DIR
+
+    return DATA_DIR
+
+
+def _save_profile(profiler, page, started):
+    folder = os.path.join(_data_dir(), "profiles")
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{page}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(started))}.prof")
+    profiler.dump_stats(path)
+    return path
+
+
+class MetricsLog:
+    """每次重跑一行 JSON，附加到本地檔案 (可用 pandas.read_json(lines=True) 分析)。"""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(_data_dir(), "metrics.jsonl")
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_log():
+    global _log
+    with _log_lock:
+        if _log is None:
+            _log = MetricsLog()
+        return _log
+
+
+# --- 以目前重跑為對象的便捷函式 (沒有進行中的重跑時只做最少的事) ---
+def begin(page, profile=False):
+    """腳本開頭呼叫；上一次重跑若被 st.stop() 中斷而沒有 finish，直接丟棄。"""
+    previous = getattr(_local, "rerun", None)
+    if previous is not None and previous._profiler:
+        previous._profiler.disable()
+    _local.rerun = Rerun(page, profile)
+    return _local.rerun
+
+
+def current():
+    return getattr(_local, "rerun", None)
+
+
+@contextmanager
+def stage(name, **info):
+    rec = current()
+    if rec is None:
+        yield info
+        return
+    with rec.stage(name, **info) as out:
+        yield out
+
+
+def count(name, n=1):
+    with _totals_lock:
+        _totals[name] += n
+    rec = current()
+    if rec is not None:
+        rec.counters[name] += n
+
+
+def totals():
+    """行程啟動以來的累計計數 (含背景執行緒)。"""
+    with _totals_lock:
+        return dict(_totals)
+
+
+def finish():
+    """腳本結尾呼叫：停止計時 / 剖析並寫入指標檔；之後的 fragment 重跑不再計入這一次。"""
+    rec = current()
+    if rec is None:
+        return None
+    _local.rerun = None
+    rec.finish()
+    if METRICS_ENABLED:
+        try:
+            get_log()(rec.record())
+        except OSError:
+            pass
+    return rec
+
+
+# --- 頁面上的除錯面板 ---
+def debug_enabled():
+    import streamlit as st
+
+    return st.query_params.get("debug") == "1" or os.environ.get("GUPIAO_DEBUG") == "1"
+
+
+def profile_requested():
+    """網址帶 ?profile=1 或按過面板上的「剖析下一次重跑」。"""
+    import streamlit as st
+
+    return st.query_params.get("profile") == "1" or st.session_state.pop("profile_next", False)
+
+
+def debug_panel(rec):
+    """在頁面底部列出這次重跑的各段耗時、計數與快取狀態。"""
+    import pandas as pd
+    import streamlit as st
+
+    import market_cache
+
+    with st.expander(f"⏱️ 效能 · 本次重跑 {rec.total_ms:,.0f} ms", expanded=False):
+        if rec.stages:
+            df = pd.DataFrame(rec.stages)
+            df["stage"] = ["　" * d + s for d, s in zip(df.pop("depth"), df["stage"])]
+            st.dataframe(df.set_index("stage").style.format(precision=1, na_rep=""), use_container_width=True)
+        c_run, c_all = st.columns(2)
+        c_run.caption("本次重跑計數")
+        c_run.json(dict(rec.counters))
+        c_all.caption("行程累計 (含背景執行緒)")
+        c_all.json(totals())
+        cache = market_cache.stats()
+        st.caption(
+            f"行情快取：命中率 {cache['hit_rate'] * 100:.0f}% · {cache['entries']} 筆 · "
+            f"{cache['bytes'] / 2**20:.1f} / {cache['max_bytes'] / 2**20:.0f} MB · 下載中 {cache['inflight']}"
+        )
+        if rec.profile_text:
+            st.caption(f"cProfile 已存到 {rec.profile_path}")
+            st.code(rec.profile_text)
+        elif st.button("剖析下一次重跑", key="profile_next_btn"):
+            st.session_state["profile_next"] = True
+            st.rerun()
@@ -0,0 +1,104 @@
+"""
+多解析度 K 線金字塔。
+
+最細的 15 分 K 只存一份 (bar_store)，1 小時 / 日 / 週 K 由它聚合後也存進同一個
+SQLite，interval 欄位記為 "15m>1h" 這類鍵。新 K 線進來時只重算最後一個
+(可能尚未完成的) 桶以後的部分，切換顯示區間直接讀對應層級，不必再下載或 resample。
+"""
+import numpy as np
+import pandas as pd
+
+import bar_store
+import resilience
+
+BASE = "15m"
+LEVELS = ["1h", "1d", "1wk"]
+BASE_HISTORY = "60d"  # Yahoo 15 分 K 最多提供 60 天
+
+# 顯示區間 -> (period, 層級)；層級 None 代表直接用最細的 K 線
+HORIZONS = {
+    "5日 · 15分": ("5d", None),
+    "1月 · 1小時": ("1mo", "1h"),
+    "60日 · 日線": ("60d", "1d"),
+    "60日 · 週線": ("60d", "1wk"),
+}
+
+
+def level_key(level, base=BASE):
+    return base if level is None else f"{base}>{level}"
+
+
+def bucket_starts(index, level):
+    """每根 K 線所屬的桶起點 (在交易所當地時區對齊整點 / 日 / 週一)。"""
+    tz = index.tz
+    local = index.tz_localize(None) if tz is not None else index
+    if level == "1h":
+        keys = local.floor("h")
+    elif level == "1d":
+        keys = local.normalize()
+    elif level == "1wk":
+        keys = local.normalize() - pd.to_timedelta(local.weekday, unit="D")
+    else:
+        raise ValueError(f"unknown level {level!r}")
+    if tz is not None:
+        keys = keys.tz_localize(tz, ambiguous="NaT", nonexistent="shift_forward")
+    return keys
+
+
+def aggregate(df, level):
+    """把依時間排序的 OHLCV 聚合到 level；以 reduceat 一次算完所有桶。"""
+    df = df.dropna(subset=["Open", "High", "Low", "Close"])
+    if df.empty:
+        return df
+    keys = bucket_starts(df.index, level)
+    ok = ~keys.isna()
+    df, keys = df[ok], keys[ok]
+    k = keys.as_unit("s").asi8
+    starts = np.flatnonzero(np.r_[True, k[1:] != k[:-1]])
+    ends = np.r_[starts[1:], len(df)] - 1
+    return pd.DataFrame({
+        "Open": df["Open"].to_numpy()[starts],
+        "High": np.maximum.reduceat(df["High"].to_numpy(), starts),
+        "Low": np.minimum.reduceat(df["Low"].to_numpy(), starts),
+        "Close": df["Close"].to_numpy()[ends],
+        "Volume": np.add.reduceat(np.nan_to_num(df["Volume"].to_numpy(dtype=float)), starts),
+    }, index=keys[starts])
+
+
+def update(ticker, store=None, base=BASE):
+    """把新到的細 K 線併入各層級：只重算最後一個桶起點之後的資料。"""
+    store = store or bar_store.get_store()
+    base_first = store.first_timestamp(ticker, base)
+    if base_first is None:
+        return
+    for level in LEVELS:
+        key = level_key(level, base)
+        last = store.last_timestamp(ticker, key)
+        if last is not None:
+            first = store.first_timestamp(ticker, key)
+            if base_first < first:
+                # 細 K 線往前補了歷史，此層整個重建
+                store.delete(ticker, key)
+                last = None
+        store.write(ticker, key, aggregate(store.read(ticker, base, start=last), level))
+
+
+def update_many(tickers, store=None, base=BASE):
+    for t in tickers:
+        update(t, store, base)
+
+
+def ensure_history(tickers, period=BASE_HISTORY, store=None):
+    """切到較長區間時，補齊最細 K 線的歷史 (每個行程每檔只補一次) 並更新各層級。"""
+    store = store or bar_store.get_store()
+    todo = store.needs_backfill(tickers, BASE, period)
+    if todo:
+        store.sync(todo, period=period, interval=BASE, backfill=True, fetch=resilience.get_fetcher())
+        update_many(todo, store)
+
+
+def horizon_bars(tickers, horizon, store=None):
+    """依顯示區間從對應層級讀出 K 線 (與 yf.download(group_by='ticker') 同結構)。"""
+    store = store or bar_store.get_store()
+    period, level = HORIZONS[horizon]
+    return bar_store.combine(store.frames(tickers, period=period, interval=level_key(level)), list(tickers))
@@ -0,0 +1,158 @@
+"""
+具韌性的上游抓取層。
+
+- 每個標的各自判定成敗：批次裡某檔抓不到，只重試那一檔，其他照常寫入
+- 失敗以指數退避加隨機抖動 (full jitter) 重試，避免大家同時重打上游
+- 同一標的連續失敗達門檻就斷路 (circuit breaker)，冷卻期間直接略過，改用本地庫裡上次成功的資料
+- health() 提供各標的最後成功時間，頁面據此標示「資料可能過時」
+"""
+import logging
+import os
+import random
+import threading
+import time
+
+import bar_store
+
+RETRIES = int(os.environ.get("GUPIAO_FETCH_RETRIES", 3))
+BASE_DELAY = 0.5
+MAX_DELAY = 8.0
+FAILURE_THRESHOLD = 3  # 連續失敗幾次後斷路
+COOLDOWN = 300  # 第一次斷路冷卻 5 分鐘，之後加倍
+MAX_COOLDOWN = 3600
+
+log = logging.getLogger(__name__)
+
+
+def backoff(attempt, base=BASE_DELAY, cap=MAX_DELAY):
+    """第 attempt 次重試前的等待秒數：指數退避加隨機抖動 (full jitter)。"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    def __init__(self, threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN, max_cooldown=MAX_COOLDOWN, clock=time.time):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.clock = clock
+        self._state = {}  # key -> [連續失敗次數, 斷路到何時, 已斷路次數]
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        """斷路中回傳 False；冷卻結束後放行一次試探 (half-open)。"""
+        with self._lock:
+            st = self._state.get(key)
+            return st is None or self.clock() >= st[1]
+
+    def is_open(self, key):
+        return not self.allow(key)
+
+    def success(self, key):
+        with self._lock:
+            self._state.pop(key, None)
+
+    def failure(self, key):
+        with self._lock:
+            st = self._state.setdefault(key, [0, 0.0, 0])
+            st[0] += 1
+            if st[0] >= self.threshold or st[2]:
+                # 達門檻，或 half-open 試探又失敗：重新斷路，冷卻時間加倍
+                st[2] += 1
+                st[1] = self.clock() + min(self.cooldown * 2 ** (st[2] - 1), self.max_cooldown)
+                st[0] = 0
+
+    def open_keys(self):
+        now = self.clock()
+        with self._lock:
+            return [k for k, st in self._state.items() if now < st[1]]
+
+
+class ResilientFetcher:
+    """包裝 bar_store.yf_fetch：簽名相同，回傳 {ticker: OHLCV}，失敗的標的不在結果中。"""
+
+    def __init__(self, fetch=bar_store.yf_fetch, retries=RETRIES, base_delay=BASE_DELAY,
+                 max_delay=MAX_DELAY, breaker=None, sleep=time.sleep):
+        self.fetch = fetch
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.sleep = sleep
+        self._last_success = {}
+        self._last_failure = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _delay(self, attempt):
+        return backoff(attempt, self.base_delay, self.max_delay)
+
+    def __call__(self, tickers, interval, period=None, start=None):
+        allowed = [t for t in tickers if self.breaker.allow(t)]
+        frames, pending = {}, list(allowed)
+        for attempt in range(self.retries):
+            if not pending:
+                break
+            if attempt:
+                self.sleep(self._delay(attempt))
+            self.calls += 1
+            try:
+                got = self.fetch(pending, interval, period=period, start=start)
+            except Exception:
+                log.warning("fetch %s failed (attempt %d)", pending, attempt + 1, exc_info=True)
+                got = {}
+            frames.update(got)
+            pending = [t for t in pending if t not in got]
+
+        now = time.time()
+        with self._lock:
+            for t in allowed:
+                if t in frames:
+                    self.breaker.success(t)
+                    self._last_success[t] = now
+                else:
+                    self.breaker.failure(t)
+                    self._last_failure[t] = now
+        return frames
+
+    def health(self, tickers):
+        """{ticker: {"ok", "open", "last_success", "last_failure"}}；ok 表示最近一次抓取成功。"""
+        with self._lock:
+            out = {}
+            for t in tickers:
+                ok_at, fail_at = self._last_success.get(t), self._last_failure.get(t)
+                out[t] = {
+                    "ok": fail_at is None or (ok_at is not None and ok_at >= fail_at),
+                    "open": self.breaker.is_open(t),
+                    "last_success": ok_at,
+                    "last_failure": fail_at,
+                }
+            return out
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_fetcher():
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = ResilientFetcher()
+        return _fetcher
+
+
+def stale_tickers(tickers):
+    """最近一次抓取失敗 (或斷路中) 的標的：{ticker: 最後成功時間或 None}。"""
+    return {t: h["last_success"] for t, h in get_fetcher().health(tickers).items() if not h["ok"] or h["open"]}
+
+
+def stale_note(tickers):
+    """給頁面顯示的過時提示文字；全部正常時回傳 None。"""
+    stale = stale_tickers(tickers)
+    if not stale:
+        return None
+    parts = [
+        f"{t} (最後更新 {time.strftime('%H:%M:%S', time.localtime(ts))})" if ts else f"{t} (本次啟動尚未更新成功)"
+        for t, ts in stale.items()
+    ]
+    return "⚠️ 以下標的暫時無法更新，顯示的是上次成功取得的資料：" + "、".join(parts)
@@ -0,0 +1,181 @@
+"""
+投資組合風險分析。
+
+從對齊的日收盤價矩陣 (時間 × 標的) 一次算出：各持股與組合的報酬、年化波動、
+最大回撤、滾動夏普、對大盤的 Beta、相關係數矩陣，以及歷史 / 參數法 VaR。
+全部是矩陣運算 (共變異數 = 去均值報酬的轉置乘積)，沒有逐檔迴圈；
+結果依行情快照版本快取，重跑腳本或切換分頁不會重算。
+
+日 K 依各標的「當地交易日」對齊：美股與台股的日 K 時間戳落在不同的 UTC 時刻，
+直接依時間戳合併會讓兩邊的列交錯，向前填補後多出一半 0 報酬的日子，壓低波動、相關與 Beta。
+"""
+import threading
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+import poller as poller_mod
+from fx import closes_in
+from valuation import close_frame, value_from_closes
+
+PERIODS_PER_YEAR = 252
+SHARPE_WINDOW = 63  # 約一季的交易日
+BENCHMARK = "SPY"
+CONFIDENCE = (0.95, 0.99)
+SESSION_INTERVALS = {"1d", "5d", "1wk", "1mo", "3mo"}  # 一根 K 線代表一整個 (以上) 交易日
+
+_memo = {}
+_memo_lock = threading.Lock()
+
+
+def max_drawdown(values):
+    """各欄 (或單一序列) 的最大回撤與回撤序列；NaN 不影響前高。"""
+    v = np.asarray(values, dtype=float)
+    peak = np.fmax.accumulate(v, axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dd = v / peak - 1.0
+    return np.nanmin(dd, axis=0), dd
+
+
+def session_closes(frames, tickers):
+    """{ticker: 日 K} -> 以當地交易日 (無時區的日期) 為索引的收盤價矩陣，向前填補。"""
+    cols = {}
+    for t in tickers:
+        df = frames.get(t)
+        if df is None or df.empty:
+            continue
+        idx = pd.DatetimeIndex(df.index)
+        day = (idx.tz_localize(None) if idx.tz is not None else idx).normalize()
+        cols[t] = pd.Series(df["Close"].to_numpy(dtype=float), index=day).groupby(level=0).last()
+    if not cols:
+        return pd.DataFrame(columns=list(tickers), dtype=float)
+    return pd.DataFrame(cols).reindex(columns=list(tickers)).sort_index().dropna(how="all").ffill()
+
+
+def rolling_sharpe(returns, window=SHARPE_WINDOW, rf=0.0, periods=PERIODS_PER_YEAR):
+    """以累計和一次算出滾動平均與標準差，年化夏普比率。"""
+    r = np.asarray(returns, dtype=float) - rf / periods
+    out = np.full(len(r), np.nan)
+    if len(r) < window:
+        return out
+    cs = np.concatenate([[0.0], np.cumsum(r)])
+    cs2 = np.concatenate([[0.0], np.cumsum(r * r)])
+    mean = (cs[window:] - cs[:-window]) / window
+    var = ((cs2[window:] - cs2[:-window]) - window * mean * mean) / (window - 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out[window - 1:] = mean / np.sqrt(np.maximum(var, 0.0)) * np.sqrt(periods)
+    return out
+
+
+class RiskReport:
+    """一次算好的風險指標；金額以收盤價矩陣的幣別計。"""
+
+    def __init__(self, closes, tickers, shares, benchmark=None, periods=PERIODS_PER_YEAR):
+        # 同一代碼重複出現時合併股數
+        held = pd.Series(np.asarray(shares, dtype=float), index=list(tickers)).groupby(level=0, sort=False).sum()
+        self.tickers = list(held.index)
+        self.shares = held.to_numpy()
+        closes = closes.reindex(columns=self.tickers).ffill()
+        self.index = closes.index
+        prices = closes.to_numpy(dtype=float)
+
+        # 報酬矩陣 (T-1 × N)：尚未上市 / 停牌的期間以 0 報酬計
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rets = prices[1:] / prices[:-1] - 1.0
+        rets = np.nan_to_num(rets, nan=0.0, posinf=0.0, neginf=0.0)
+        self.returns = pd.DataFrame(rets, index=self.index[1:], columns=self.tickers)
+
+        # 組合以實際持股市值計 (買入持有，權重隨價格漂移)
+        value = np.nan_to_num(prices) @ self.shares
+        self.value = pd.Series(value, index=self.index, name="portfolio")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            port = np.nan_to_num(value[1:] / value[:-1] - 1.0, nan=0.0, posinf=0.0, neginf=0.0)
+        self.portfolio_returns = pd.Series(port, index=self.index[1:], name="portfolio")
+        last = np.nan_to_num(prices[-1]) * self.shares if len(prices) else np.zeros(len(self.tickers))
+        self.market_value = float(last.sum())
+        self.weights = last / self.market_value if self.market_value else np.zeros_like(last)
+
+        # 共變異數與相關係數：一次矩陣乘法
+        n = max(len(rets) - 1, 1)
+        centered = rets - rets.mean(axis=0)
+        self.cov = centered.T @ centered / n
+        std = np.sqrt(np.diag(self.cov))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = self.cov / np.outer(std, std)
+        np.fill_diagonal(corr, 1.0)
+        self.corr = pd.DataFrame(corr, index=self.tickers, columns=self.tickers)
+
+        ann = np.sqrt(periods)
+        self.volatility = std * ann
+        self.portfolio_volatility = float(port.std(ddof=1) * ann) if len(port) > 1 else 0.0
+        self.max_drawdown, _ = max_drawdown(prices)
+        mdd, dd = max_drawdown(value)
+        self.portfolio_max_drawdown = float(mdd) if len(value) else 0.0
+        self.drawdown = pd.Series(dd, index=self.index, name="drawdown")
+        self.sharpe = pd.Series(rolling_sharpe(port, periods=periods), index=self.index[1:], name="sharpe")
+
+        # 對大盤的 Beta：所有持股一起投影到基準報酬上
+        self.beta = np.full(len(self.tickers), np.nan)
+        self.portfolio_beta = np.nan
+        if benchmark is not None and len(benchmark.dropna()) > 1:
+            b = benchmark.reindex(self.index).ffill().to_numpy(dtype=float)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                br = np.nan_to_num(b[1:] / b[:-1] - 1.0, nan=0.0, posinf=0.0, neginf=0.0)
+            bc = br - br.mean()
+            denom = bc @ bc
+            if denom > 0:
+                self.beta = centered.T @ bc / denom
+                self.portfolio_beta = float((port - port.mean()) @ bc / denom)
+
+        # VaR (一日、以正數表示損失金額)
+        sigma = float(np.sqrt(max(self.weights @ self.cov @ self.weights, 0.0)))
+        mu = float(self.weights @ rets.mean(axis=0)) if len(rets) else 0.0
+        self.var = {}
+        for conf in CONFIDENCE:
+            hist = -float(np.quantile(port, 1 - conf)) if len(port) else 0.0
+            param = -(mu + NormalDist().inv_cdf(1 - conf) * sigma)
+            self.var[conf] = {"historical": hist * self.market_value, "parametric": param * self.market_value}
+
+    def holdings(self):
+        """每檔持股一列風險指標。"""
+        return pd.DataFrame({
+            "ticker": self.tickers,
+            "weight": self.weights,
+            "volatility": self.volatility,
+            "max_drawdown": self.max_drawdown,
+            "beta": self.beta,
+        })
+
+    def cumulative_returns(self):
+        """各持股累計報酬 (時間 × 標的)。"""
+        return (1.0 + self.returns).cumprod() - 1.0
+
+
+def portfolio_risk(portfolio, benchmark=BENCHMARK, period="1y", interval="1d", currency="USD"):
+    """以共用快照的日 K 線算出 RiskReport；同一版快照、同一組持股只算一次。"""
+    tickers = list(dict.fromkeys(item['ticker'] for item in portfolio))
+    universe = list(dict.fromkeys(tickers + [benchmark]))
+    raw = poller_mod.latest_bars(universe, period=period, interval=interval)
+    snap = poller_mod.get_poller(period, interval).latest()
+    key = (snap.version, period, interval, currency, benchmark,
+           tuple((item['ticker'], float(item['shares'])) for item in portfolio))
+    with _memo_lock:
+        report = _memo.get(key)
+    if report is not None:
+        return report
+    if interval in SESSION_INTERVALS:
+        closes = session_closes(snap.frames, universe)
+    else:
+        closes = close_frame(raw, universe)
+    bench = closes[benchmark].dropna() if closes[benchmark].notna().any() else None
+    closes, _ = closes_in(closes[tickers], currency, period, interval)
+    val = value_from_closes(closes, portfolio)
+    report = RiskReport(val.closes, val.tickers, val.shares, bench)
+    with _memo_lock:
+        # 每個 (period, interval) 輪詢器只保留目前這版快照的結果 (不同投資組合各一份)；
+        # 不同週期的版本號各自遞增，不能互相淘汰
+        for k in [k for k in _memo if k[1:3] == (period, interval) and k[0] != snap.version]:
+            del _memo[k]
+        _memo[key] = report
+    return report
@@ -0,0 +1,310 @@
+"""
+串流即時報價。
+
+- QuoteFeed：可替換的報價來源介面，來源把成交 tick 推給 on_tick(ticker, ts, price, size)
+- YahooFeed：yfinance 的 WebSocket 串流；斷線或出錯時以退避加抖動重新連線，連續失敗則斷路冷卻
+- ReplayFeed：從本地 K 線庫讀出已記錄的 K 線依時間順序重播，結果固定，可離線測試
+- QuoteHub：每個標的一個固定大小的環狀緩衝區，頁面只讀最新價來更新 KPI 與個股卡片
+"""
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+import bar_store
+from resilience import CircuitBreaker, backoff
+
+RING_CAPACITY = 4096
+FEED = os.environ.get("GUPIAO_FEED", "yahoo")  # "yahoo" 或 "replay"
+RECONNECT_BASE = 1.0
+RECONNECT_MAX = 60.0
+STABLE_SECONDS = 60  # 連線維持超過這段時間才算恢復，退避重新計算
+STREAM_KEY = "yahoo-stream"
+
+log = logging.getLogger(__name__)
+
+
+class RingBuffer:
+    """固定容量的 (時間, 價格, 量) 環狀緩衝區；寫滿後覆蓋最舊的 tick。"""
+
+    def __init__(self, capacity=RING_CAPACITY):
+        self.capacity = capacity
+        self._data = np.full((capacity, 3), np.nan)
+        self._n = 0  # 累計寫入筆數
+
+    def append(self, ts, price, size=np.nan):
+        self._data[self._n % self.capacity] = (ts, price, size)
+        self._n += 1
+
+    def __len__(self):
+        return min(self._n, self.capacity)
+
+    def last(self):
+        if not self._n:
+            return None
+        return self._data[(self._n - 1) % self.capacity]
+
+    def values(self):
+        """依時間先後排列的所有 tick，shape = (len, 3)。"""
+        if self._n <= self.capacity:
+            return self._data[:self._n].copy()
+        start = self._n % self.capacity
+        return np.concatenate([self._data[start:], self._data[:start]])
+
+
+class QuoteFeed:
+    """報價來源介面。"""
+
+    def subscribe(self, tickers):
+        raise NotImplementedError
+
+    def start(self, on_tick):
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+    def running(self):
+        """背景執行緒是否還在 (停掉的來源由 QuoteHub 重新啟動)。"""
+        return True
+
+    def health(self):
+        """{"ok": 目前是否在送即時 tick, "error": 最近一次錯誤或 None}。"""
+        return {"ok": True, "error": None}
+
+
+class YahooFeed(QuoteFeed):
+    """Yahoo Finance WebSocket 推播 (yf.WebSocket)。"""
+
+    def __init__(self, breaker=None):
+        self._tickers = set()
+        self._ws = None
+        self._thread = None
+        self._stop = threading.Event()
+        # 連續斷線達門檻就冷卻一段時間再試，不要一直重打上游
+        self.breaker = breaker or CircuitBreaker(cooldown=RECONNECT_MAX, max_cooldown=10 * RECONNECT_MAX)
+        self.connected = False
+        self.error = None
+
+    def subscribe(self, tickers):
+        new = [t for t in tickers if t not in self._tickers]
+        self._tickers.update(new)
+        if new and self._ws is not None and self.connected:
+            try:
+                self._ws.subscribe(new)
+            except Exception:
+                # 重新連線時會訂閱全部標的
+                log.warning("quote stream subscribe %s failed", new, exc_info=True)
+
+    def _listen(self, yf, handle):
+        self._ws = yf.WebSocket(verbose=False)
+        if self._tickers:
+            self._ws.subscribe(list(self._tickers))
+        self.connected, self.error = True, None
+        self._ws.listen(handle)
+
+    def start(self, on_tick):
+        import yfinance as yf
+
+        def handle(msg):
+            price = msg.get("price")
+            if msg.get("id") and price is not None:
+                ts = float(msg.get("time", 0) or 0) / 1000 or time.time()
+                on_tick(msg["id"], ts, float(price), float(msg.get("last_size", np.nan) or np.nan))
+
+        def run():
+            attempt = 0
+            while not self._stop.is_set():
+                if not self.breaker.allow(STREAM_KEY):
+                    self._stop.wait(1.0)
+                    continue
+                opened = time.monotonic()
+                try:
+                    self._listen(yf, handle)
+                    error = "stream closed"  # listen 正常返回也代表連線已斷
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                    log.warning("quote stream failed", exc_info=True)
+                self.connected = False
+                if self._stop.is_set():
+                    break
+                if time.monotonic() - opened >= STABLE_SECONDS:
+                    attempt = 0
+                    self.breaker.success(STREAM_KEY)
+                attempt += 1
+                self.error = error
+                self.breaker.failure(STREAM_KEY)
+                delay = backoff(attempt, RECONNECT_BASE, RECONNECT_MAX)
+                log.warning("quote stream dropped (%s), reconnect attempt %d in %.1fs", error, attempt, delay)
+                self._stop.wait(delay)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="quote-feed-yahoo", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._ws is not None:
+            try:
+                self._ws.close()
+            except Exception:
+                log.debug("quote stream close failed", exc_info=True)
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def health(self):
+        return {"ok": self.connected, "error": self.error}
+
+
+class ReplayFeed(QuoteFeed):
+    """把本地 K 線庫裡的收盤價依時間順序重播成 tick；播完從頭再來。
+
+    speed 為每秒送出的 tick 數；順序只取決於已存的資料，因此結果可重現。
+    """
+
+    def __init__(self, interval="15m", speed=5.0, store=None, loop=True):
+        self.interval = interval
+        self.speed = speed
+        self.store = store
+        self.loop = loop
+        self._tickers = []
+        self._stop = threading.Event()
+        self._thread = None
+        self.error = None
+
+    def subscribe(self, tickers):
+        self._tickers.extend(t for t in tickers if t not in self._tickers)
+
+    def ticks(self):
+        """依 (時間, 代碼) 排序的 tick 序列。"""
+        store = self.store or bar_store.get_store()
+        rows = []
+        for t in list(self._tickers):
+            df = store.read(t, self.interval)
+            if df.empty:
+                continue  # 本地庫裡沒有這個標的
+            ts = df.index.as_unit("s").asi8.astype(float)
+            rows.extend(zip(ts, [t] * len(df), df["Close"].to_numpy(), df["Volume"].to_numpy()))
+        rows.sort(key=lambda r: (r[0], r[1]))
+        return rows
+
+    def _play(self, on_tick):
+        while not self._stop.is_set():
+            seen = len(self._tickers)
+            for ts, t, price, size in self.ticks():
+                if self._stop.wait(1.0 / self.speed):
+                    return
+                on_tick(t, ts, price, size)
+                if len(self._tickers) != seen:
+                    break  # 有新訂閱，重新排序後從頭播
+            else:
+                if not self.loop:
+                    return
+                self._stop.wait(1.0)
+
+    def start(self, on_tick):
+        def run():
+            try:
+                self._play(on_tick)
+            except Exception as e:
+                # 執行緒就此結束；QuoteHub 下次訂閱時看到 running() 為 False 會重新啟動
+                self.error = f"{type(e).__name__}: {e}"
+                log.exception("quote replay failed")
+
+        self._stop.clear()
+        self.error = None
+        self._thread = threading.Thread(target=run, name="quote-feed-replay", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def health(self):
+        return {"ok": self.error is None, "error": self.error}
+
+
+class QuoteHub:
+    """行程內共用的即時報價中心。"""
+
+    def __init__(self, feed, capacity=RING_CAPACITY):
+        self.feed = feed
+        self.capacity = capacity
+        self._buffers = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self.version = 0
+
+    def subscribe(self, tickers):
+        with self._lock:
+            new = [t for t in tickers if t not in self._buffers]
+            for t in new:
+                self._buffers[t] = RingBuffer(self.capacity)
+            # 來源的執行緒意外結束時重新啟動
+            start = not self._started or not self.feed.running()
+            self._started = True
+        if new:
+            self.feed.subscribe(new)
+        if start:
+            self.feed.start(self.on_tick)
+
+    def on_tick(self, ticker, ts, price, size=np.nan):
+        with self._lock:
+            buf = self._buffers.get(ticker)
+            if buf is None:
+                return
+            buf.append(ts, price, size)
+            self.version += 1
+
+    def status(self):
+        """來源狀態 (見 QuoteFeed.health)。"""
+        return self.feed.health()
+
+    def last_prices(self, tickers):
+        """{ticker: 最新成交價}；尚未收到 tick 的標的不列入。來源斷線時回傳空的，不把舊 tick 當即時價。"""
+        if not self.status()["ok"]:
+            return {}
+        with self._lock:
+            out = {}
+            for t in tickers:
+                buf = self._buffers.get(t)
+                last = buf.last() if buf is not None else None
+                if last is not None:
+                    out[t] = float(last[1])
+            return out
+
+    def last_update(self, tickers):
+        """這些標的中最新一筆 tick 的時間 (epoch 秒)；沒有或來源斷線則為 None。"""
+        if not self.status()["ok"]:
+            return None
+        with self._lock:
+            ts = [buf.last()[0] for t, buf in self._buffers.items() if t in tickers and len(buf)]
+        return max(ts) if ts else None
+
+    def ticks(self, ticker):
+        with self._lock:
+            buf = self._buffers.get(ticker)
+            return buf.values() if buf is not None else np.empty((0, 3))
+
+
+def make_feed(name=FEED):
+    if name == "replay":
+        return ReplayFeed()
+    return YahooFeed()
+
+
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def get_hub():
+    global _hub
+    with _hub_lock:
+        if _hub is None:
+            _hub = QuoteHub(make_feed())
+        return _hub
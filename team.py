@@ -0,0 +1,78 @@
+"""
+多投資組合 (團隊) 模式。
+
+伺服器以帳本中所有投資組合的標的聯集作為輪詢範圍，每個週期只做一次批次下載；
+各投資組合的估值只是從同一份收盤價矩陣切出自己的欄位，上游負載只跟「不重複的
+標的數」有關，與 session 數或投資組合數無關。
+台股等非美元報價的標的先整份換成美元，各投資組合的市值與成本才能相加比較。
+"""
+import threading
+
+import pandas as pd
+
+import ledger as ledger_mod
+import poller as poller_mod
+from fx import closes_in, costs_in, total_in
+from valuation import close_frame, value_from_closes
+
+_closes_memo = {}
+_memo_lock = threading.Lock()
+
+
+def ledger_universe(ledger=None):
+    """帳本裡所有投資組合目前持有的標的聯集。"""
+    ledger = ledger or ledger_mod.get_ledger()
+    tickers = {}
+    for pid in ledger.portfolio_ids():
+        tickers.update(dict.fromkeys(ledger.positions_map(pid)))
+    return list(tickers)
+
+
+def enable(period="5d", interval="15m", ledger=None):
+    """讓背景輪詢器固定刷新所有投資組合的標的聯集。"""
+    p = poller_mod.get_poller(period, interval)
+    p.add_source("ledger", lambda: ledger_universe(ledger))
+    return p
+
+
+def shared_closes(universe, period="5d", interval="15m"):
+    """全標的收盤價矩陣；同一版快照只組一次。"""
+    p = poller_mod.get_poller(period, interval)
+    snap = p.latest()
+    if any(t not in snap.frames for t in universe):
+        poller_mod.latest_bars(universe, period, interval)
+        snap = p.latest()
+    else:
+        p.watch(universe)
+    key = (period, interval, snap.version, tuple(universe))
+    with _memo_lock:
+        closes = _closes_memo.get(key)
+        if closes is None:
+            closes = close_frame(snap.frame(universe), universe)
+            _closes_memo.clear()
+            _closes_memo[key] = closes
+    return closes
+
+
+def portfolio_views(period="5d", interval="15m", ledger=None):
+    """{portfolio id: Valuation (USD)}，全部投影自同一份共用快照。"""
+    ledger = ledger or ledger_mod.get_ledger()
+    enable(period, interval, ledger)
+    universe = ledger_universe(ledger)
+    closes = shared_closes(universe, period, interval) if universe else pd.DataFrame()
+    closes, spots = closes_in(closes, "USD", period, interval)
+    return {pid: value_from_closes(closes, costs_in(ledger.positions(pid), spots)) for pid in ledger.portfolio_ids()}
+
+
+def team_summary(views, ledger=None):
+    """每個投資組合一列 KPI (金額皆為 USD)。"""
+    ledger = ledger or ledger_mod.get_ledger()
+    return pd.DataFrame([{
+        "投資組合": pid,
+        "持股數": len(v.tickers),
+        "市值(USD)": v.total_market,
+        "成本(USD)": v.total_cost,
+        "未實現損益": v.total_profit,
+        "報酬率%": v.total_profit_pct,
+        "已實現損益": total_in(ledger.realized_by_ticker(pid), "USD"),
+    } for pid, v in views.items()])
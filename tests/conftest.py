@@ -0,0 +1,70 @@
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# 模組都放在專案根目錄；資料目錄指到暫存區，測試不碰 .gupiao/
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("GUPIAO_DATA_DIR", tempfile.mkdtemp(prefix="gupiao-test-"))
+os.environ.setdefault("GUPIAO_EOD", "0")
+
+
+def ohlcv(closes, index):
+    """以收盤價組出 OHLCV (開高低收同價)。"""
+    closes = np.asarray(closes, dtype=float)
+    return pd.DataFrame({"Open": closes, "High": closes, "Low": closes, "Close": closes,
+                         "Volume": np.full(len(closes), 1000.0)}, index=index)
+
+
+class FakeMarket:
+    """離線行情：輪詢器與共用快取照常運作，只把上游換成記憶體中的 frames。"""
+
+    def __init__(self, metadata_path):
+        import metadata
+
+        self.frames = {}
+        self.currencies = {}
+        self.loads = []
+        self.metadata = metadata.MetadataService(path=metadata_path, fetch=self._info)
+
+    def add(self, ticker, df, currency=None):
+        self.frames[ticker] = df
+        if currency is not None:
+            self.currencies[ticker] = currency
+            self.metadata.resolve_many([ticker])
+
+    def _info(self, ticker):
+        import metadata
+
+        return dict(metadata.fallback(ticker), currency=self.currencies.get(ticker),
+                    resolved_at=time.time(), ok=True)
+
+    def load(self, tickers, period, interval):
+        self.loads.append(list(tickers))
+        return {t: self.frames[t] for t in tickers if t in self.frames}
+
+
+@pytest.fixture
+def market(monkeypatch, tmp_path):
+    import market_cache
+    import metadata
+    import poller
+
+    m = FakeMarket(str(tmp_path / "metadata.json"))
+    pollers = {}
+
+    def get_poller(period="5d", interval="15m"):
+        # 不啟動背景執行緒；行情只在 latest_bars 補抓時經快取載入
+        key = (period, interval)
+        if key not in pollers:
+            pollers[key] = poller.MarketPoller(period, interval, cache=market_cache.MarketCache(loader=m.load))
+        return pollers[key]
+
+    monkeypatch.setattr(poller, "get_poller", get_poller)
+    monkeypatch.setattr(metadata, "_service", m.metadata)
+    return m
@@ -0,0 +1,150 @@
+import threading
+
+import numpy as np
+import pytest
+
+import alerts
+from alerts import AlertEngine
+
+
+@pytest.fixture
+def sent():
+    return []
+
+
+@pytest.fixture
+def engine(tmp_path, sent):
+    return AlertEngine(str(tmp_path / "alerts.sqlite"), notifiers=[sent.append])
+
+
+def _fired(events):
+    return sorted(ev["rule_id"] for ev in events)
+
+
+def test_price_cross_fires_once_and_rearms_past_gap(engine, sent):
+    rid = engine.add_rule("p", "price", 100, ticker="AAA", direction="above")
+    assert engine.check_prices({"AAA": 99.9}) == []
+    assert _fired(engine.check_prices({"AAA": 100.0})) == [rid]  # 剛好碰到門檻也算
+    assert engine.check_prices({"AAA": 105}) == []
+    assert engine.check_prices({"AAA": 99.5}) == []  # 還在緩衝區內，不重新武裝
+    assert engine.check_prices({"AAA": 101}) == []
+    assert engine.check_prices({"AAA": 98.9}) == []  # 退到 99 以下才重新武裝
+    assert _fired(engine.check_prices({"AAA": 100.5})) == [rid]
+    assert [ev["rule_id"] for ev in sent] == [rid, rid]
+
+
+def test_below_rule_and_already_crossed_rule(engine):
+    below = engine.add_rule("p", "price", 50, ticker="AAA", direction="below")
+    late = engine.add_rule("p", "price", 60, ticker="AAA", direction="above", current=70)
+    assert engine.check_prices({"AAA": 65}) == []  # 建立時已在門檻上方：等下一次穿越
+    assert _fired(engine.check_prices({"AAA": 50})) == [below]
+    assert engine.check_prices({"AAA": 59}) == []
+    assert _fired(engine.check_prices({"AAA": 61})) == [late]
+
+
+def test_removed_rules_never_fire(engine, tmp_path):
+    keep = engine.add_rule("p", "price", 10, ticker="AAA", direction="above")
+    gone = engine.add_rule("p", "price", 10, ticker="AAA", direction="above")
+    fired = engine.add_rule("p", "price", 5, ticker="AAA", direction="below")
+    engine.remove_rule(gone)
+    assert _fired(engine.check_prices({"AAA": 4})) == [fired]
+    engine.remove_rule(fired)  # 移除已觸發 (等待重新武裝) 的規則
+    engine.remove_rule(12345)  # 不存在的 id 不會出錯
+    assert _fired(engine.check_prices({"AAA": 11})) == [keep]
+    reloaded = AlertEngine(engine.path, notifiers=[])
+    assert sorted(r["id"] for r in reloaded.rules()) == [keep]
+    assert reloaded.check_prices({"AAA": 3}) == []
+
+
+def test_state_survives_restart(engine):
+    rid = engine.add_rule("p", "price", 100, ticker="AAA", direction="above")
+    engine.check_prices({"AAA": 101})
+    reloaded = AlertEngine(engine.path, notifiers=[])
+    assert reloaded.check_prices({"AAA": 102}) == []  # 仍是已觸發狀態
+    reloaded.check_prices({"AAA": 90})
+    assert _fired(reloaded.check_prices({"AAA": 100})) == [rid]
+
+
+def test_drawdown_tracks_peak_and_persists(engine):
+    rid = engine.add_rule("p", "drawdown", 10, ticker="AAA")
+    engine.check_prices({"AAA": 100})
+    assert engine.check_prices({"AAA": 120}) == []
+    assert engine.check_prices({"AAA": 108.5}) == []
+    events = engine.check_prices({"AAA": 107.9})
+    assert _fired(events) == [rid]
+    assert events[0]["value"] == pytest.approx(1 - 107.9 / 120)
+    reloaded = AlertEngine(engine.path, notifiers=[])
+    reloaded.check_prices({"AAA": 115})  # 回撤縮小到 5% 以內才重新武裝
+    assert reloaded.check_prices({"AAA": 109}) == []
+    reloaded.check_prices({"AAA": 114.5})
+    assert _fired(reloaded.check_prices({"AAA": 107})) == [rid]
+
+
+def test_cost_move_and_pnl_rules(engine):
+    up = engine.add_rule("p", "cost_move", 20, ticker="AAA", cost=50)
+    down = engine.add_rule("p", "cost_move", -10, ticker="AAA", cost=50)
+    loss = engine.add_rule("p", "pnl", -1000, direction="below")
+    assert engine.rules()[0]["level"] == pytest.approx(60)
+    assert _fired(engine.check_prices({"AAA": 60})) == [up]
+    assert _fired(engine.check_prices({"AAA": 45})) == [down]
+    assert engine.check_pnl({"p": -999}) == []
+    assert _fired(engine.check_pnl({"p": -1500, "other": -5000})) == [loss]
+    with pytest.raises(ValueError):
+        engine.add_rule("p", "cost_move", 5, ticker="AAA")
+
+
+def test_books_match_per_rule_scan(engine):
+    """隨機規則與價格路徑：二分搜尋的規則簿與逐條檢查的結果相同。"""
+    rng = np.random.default_rng(3)
+    state = {}
+    for _ in range(300):
+        level = float(rng.uniform(80, 120))
+        direction = "above" if rng.random() < 0.5 else "below"
+        rid = engine.add_rule("p", "price", level, ticker="AAA", direction=direction)
+        state[rid] = {"level": level, "direction": direction, "armed": True, "kind": "price"}
+    price = 100.0
+    for step in range(400):
+        price *= float(np.exp(rng.normal(0, 0.03)))
+        if step % 50 == 0:
+            victim = int(rng.choice(list(state)))
+            engine.remove_rule(victim)
+            del state[victim]
+        expected = []
+        for rid, r in state.items():
+            rearm = alerts.rearm_level(r)
+            if not r["armed"] and (price < rearm if r["direction"] == "above" else price > rearm):
+                r["armed"] = True
+            if r["armed"] and (price >= r["level"] if r["direction"] == "above" else price <= r["level"]):
+                r["armed"] = False
+                expected.append(rid)
+        assert _fired(engine.check_prices({"AAA": price})) == sorted(expected)
+
+
+def test_two_processes_notify_each_crossing_once(engine, sent):
+    other_sent = []
+    rid = engine.add_rule("p", "price", 100, ticker="AAA", direction="above")
+    other = AlertEngine(engine.path, notifiers=[other_sent.append])  # 例如 headless 服務那個行程的引擎
+    barrier = threading.Barrier(2)
+
+    def run(eng):
+        for price in [95, 101, 102] * 20:
+            barrier.wait()
+            eng.check_prices({"AAA": price})
+
+    threads = [threading.Thread(target=run, args=(e,)) for e in (engine, other)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(sent) + len(other_sent) == 20
+    assert len(engine.events("p", limit=100)) == 20
+    assert {ev["rule_id"] for ev in sent + other_sent} == {rid}
+
+
+def test_rule_removed_by_another_process_stops_firing(engine, sent):
+    rid = engine.add_rule("p", "price", 100, ticker="AAA", direction="above")
+    other = AlertEngine(engine.path, notifiers=[])
+    other.remove_rule(rid)
+    assert engine.check_prices({"AAA": 101}) == []
+    assert engine.rules() == []
+    assert sent == []
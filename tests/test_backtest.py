@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtest
+from backtest import Strategy
+
+
+@pytest.fixture
+def closes():
+    rng = np.random.default_rng(7)
+    idx = pd.bdate_range("2021-01-01", periods=600)
+    prices = 40 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, (len(idx), 4)), axis=0))
+    return pd.DataFrame(prices, index=idx, columns=["AAA", "BBB", "CCC", "DDD"])
+
+
+HOLDINGS = {"AAA": 10, "BBB": 30, "CCC": 5, "DDD": 20}
+
+
+def naive(closes, strategy, holdings):
+    """逐根 K 線持有股數、逐日檢查是否再平衡的參考實作。"""
+    prices = closes.to_numpy(dtype=float)
+    w0 = backtest.initial_weights(closes, holdings)
+    if strategy.target is None:
+        target = w0
+    else:
+        target = np.array([strategy.target.get(t, 0.0) for t in closes.columns], dtype=float)
+        target = w0 = target / target.sum()
+    if strategy.freq:
+        starts = set(backtest._period_starts(closes.index, strategy.freq))
+    cost = strategy.cost_bps / 10000.0
+
+    units = w0 / prices[0]
+    equity, when, turnover, charges = [], [], [], []
+    for t in range(len(prices)):
+        value = units @ prices[t]
+        if t > 0 and strategy.rebalance != "none":
+            drifted = units * prices[t] / value
+            if strategy.rebalance == "periodic":
+                go = t in starts
+            else:
+                go = np.abs(drifted - target).max() > strategy.band and (not strategy.freq or t in starts)
+            if go:
+                turn = np.abs(target - drifted).sum() / 2
+                charge = cost * 2 * turn
+                value *= 1 - charge
+                units = target * value / prices[t]
+                when.append(closes.index[t])
+                turnover.append(turn)
+                charges.append(charge)
+        equity.append(value)
+    return np.array(equity), pd.DatetimeIndex(when), np.array(turnover), np.array(charges)
+
+
+STRATEGIES = [
+    Strategy("none", cost_bps=10),
+    Strategy("periodic", freq="M", cost_bps=0),
+    Strategy("periodic", freq="Q", cost_bps=25),
+    Strategy("threshold", band=0.02, cost_bps=15),
+    Strategy("threshold", band=0.05, freq="W", cost_bps=5),
+    Strategy("threshold", band=0.03, cost_bps=20, target={"AAA": 0.4, "BBB": 0.4, "CCC": 0.2}),
+]
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES, ids=lambda s: s.name)
+def test_matches_bar_by_bar_loop(closes, strategy):
+    res = backtest.run(closes, strategy, HOLDINGS)
+    equity, when, turnover, charges = naive(closes, strategy, HOLDINGS)
+    assert res.rebalances.equals(when)
+    np.testing.assert_allclose(res.equity.to_numpy(), equity, rtol=1e-12, atol=0)
+    np.testing.assert_allclose(res.turnover.to_numpy(), turnover, rtol=1e-12, atol=1e-15)
+    np.testing.assert_allclose(res.costs.to_numpy(), charges, rtol=1e-12, atol=1e-15)
+
+
+def test_threshold_finds_triggers_across_scan_blocks(closes, monkeypatch):
+    # 觸發點落在不同的掃描區塊邊界上，結果都要與逐根檢查相同
+    strategy = Strategy("threshold", band=0.01, cost_bps=10)
+    expected = naive(closes, strategy, HOLDINGS)[1]
+    for block in (1, 3, 64, 1000):
+        monkeypatch.setattr(backtest, "SCAN_BLOCK", block)
+        assert backtest.run(closes, strategy, HOLDINGS).rebalances.equals(expected)
+
+
+def test_costs_only_reduce_returns(closes):
+    free = backtest.run(closes, Strategy("periodic", freq="M"), HOLDINGS).summary()
+    paid = backtest.run(closes, Strategy("periodic", freq="M", cost_bps=20), HOLDINGS).summary()
+    assert paid["total_return"] < free["total_return"]
+    assert paid["cost"] > 0 and free["cost"] == 0
+    assert paid["rebalances"] == free["rebalances"]
+
+
+def test_parallel_sweep_matches_serial(closes):
+    strategies = backtest.grid()
+    assert len(strategies) >= backtest.MIN_PARALLEL
+    serial, _ = backtest.run_many(closes, strategies, HOLDINGS, workers=1)
+    parallel, curves = backtest.run_many(closes, strategies, HOLDINGS, workers=2, keep_equity=True)
+    pd.testing.assert_frame_equal(serial, parallel)
+    assert set(curves) == set(serial["strategy"])
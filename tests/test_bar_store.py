@@ -0,0 +1,102 @@
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bar_store import BarStore, combine
+from conftest import ohlcv
+
+TZ = "America/New_York"
+
+
+def _sessions(start, days):
+    return pd.DatetimeIndex(np.concatenate([
+        pd.date_range(d + pd.Timedelta(hours=9, minutes=30), periods=26, freq="15min")
+        for d in pd.bdate_range(start, periods=days)
+    ])).tz_localize(TZ)
+
+
+class Upstream:
+    """yf_fetch 的替身：只給到 self.now 為止的 K 線，並記錄每次呼叫。"""
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.now = None
+        self.calls = []
+
+    def __call__(self, tickers, interval, period=None, start=None):
+        self.calls.append((sorted(tickers), period, start))
+        out = {}
+        for t in tickers:
+            df = self.frames[t]
+            df = df[df.index <= self.now]
+            if start is not None:
+                df = df[df.index.date >= start]
+            out[t] = df
+        return out
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BarStore(str(tmp_path / "bars.sqlite"))
+
+
+def test_sync_fetches_only_the_missing_tail(store):
+    idx = _sessions("2024-03-04", 5)
+    up = Upstream({"AAA": ohlcv(np.arange(len(idx)) + 100.0, idx), "BBB": ohlcv(np.arange(len(idx)) + 50.0, idx)})
+    up.now = idx[60]  # 第三天盤中
+    store.sync(["AAA", "BBB"], fetch=up, now=up.now.to_pydatetime())
+    assert up.calls == [(["AAA", "BBB"], "5d", None)]
+    assert store.read("AAA", "15m").index[-1] == idx[60]
+
+    up.now = idx[-1]
+    up.calls.clear()
+    store.sync(["AAA", "BBB"], fetch=up, now=up.now.to_pydatetime())
+    # 同一個最後日期的標的合成一次呼叫，從那天開始補
+    assert up.calls == [(["AAA", "BBB"], None, idx[60].tz_convert("UTC").date())]
+    df = store.read("AAA", "15m")
+    assert len(df) == len(idx) and df.index.is_unique
+    assert str(df.index.tz) == TZ
+    assert df["Close"].tolist() == (np.arange(len(idx)) + 100.0).tolist()
+
+
+def test_forming_bar_is_overwritten(store):
+    idx = _sessions("2024-03-04", 1)
+    store.write("AAA", "15m", ohlcv([10.0, 11.0], idx[:2]))
+    store.write("AAA", "15m", ohlcv([11.5, 12.0], idx[1:3]))  # 第二根定稿後的值
+    assert store.read("AAA", "15m")["Close"].tolist() == [10.0, 11.5, 12.0]
+
+
+def test_stale_history_is_refetched_in_full(store):
+    idx = _sessions("2024-03-04", 5)
+    up = Upstream({"AAA": ohlcv(np.full(len(idx), 1.0), idx)})
+    up.now = idx[-1]
+    store.write("AAA", "15m", ohlcv([1.0], idx[:1]))
+    store.sync(["AAA"], fetch=up, now=(idx[-1] + pd.Timedelta(days=30)).to_pydatetime())
+    assert up.calls == [(["AAA"], "5d", None)]
+
+
+def test_backfill_runs_once_per_process(store):
+    idx = _sessions("2024-01-02", 60)
+    up = Upstream({"AAA": ohlcv(np.full(len(idx), 1.0), idx)})
+    up.now = idx[-1]
+    store.write("AAA", "15m", ohlcv(np.ones(26 * 5), idx[-26 * 5:]))
+    now = up.now.to_pydatetime() + timedelta(minutes=1)
+    store.sync(["AAA"], period="3mo", fetch=up, now=now, backfill=True)
+    store.sync(["AAA"], period="3mo", fetch=up, now=now, backfill=True)
+    assert [c[1] for c in up.calls] == ["3mo", None]
+    assert store.first_timestamp("AAA", "15m") == idx[0].to_pydatetime()
+
+
+def test_frames_keep_the_last_n_sessions_and_combine(store):
+    idx = _sessions("2024-03-04", 8)
+    store.write("AAA", "15m", ohlcv(np.arange(len(idx)), idx))
+    tw = pd.date_range("2024-03-05 09:00", periods=4, freq="1h", tz="Asia/Taipei")
+    store.write("2330.TW", "15m", ohlcv([600, 601, 602, 603], tw))
+    frames = store.frames(["AAA", "2330.TW", "NOPE"], now=idx[-1].to_pydatetime())
+    assert sorted(set(frames["AAA"].index.date)) == sorted(set(idx.date))[-5:]
+    assert "NOPE" not in frames
+    raw = combine(frames, ["AAA", "2330.TW"])
+    assert str(raw.index.tz) == "UTC"  # 時區不同時統一成 UTC
+    assert raw["2330.TW"]["Close"].dropna().tolist() == [600, 601, 602, 603]
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+from conftest import ohlcv
+from downsample import downsample_ohlc, downsample_series, lttb_indices
+
+IDX = pd.date_range("2024-01-01", periods=10_000, freq="15min", tz="UTC")
+
+
+def test_small_series_pass_through():
+    s = pd.Series([1.0, np.nan, 3.0], index=IDX[:3])
+    out = downsample_series(s, max_points=10)
+    assert out.tolist() == [1.0, 3.0]
+
+
+def test_lttb_keeps_endpoints_and_spikes():
+    y = np.sin(np.linspace(0, 20, len(IDX)))
+    y[4321], y[7777] = 50.0, -50.0
+    s = pd.Series(y, index=IDX)
+    out = downsample_series(s, max_points=500)
+    assert len(out) == 500
+    assert out.index[0] == IDX[0] and out.index[-1] == IDX[-1]
+    assert out.index.is_monotonic_increasing
+    assert out.max() == 50.0 and out.min() == -50.0
+
+
+def test_lttb_indices_are_unique():
+    x = np.arange(1000, dtype=float)
+    idx = lttb_indices(x, np.random.default_rng(0).normal(size=1000), 100)
+    assert len(np.unique(idx)) == 100
+
+
+def test_ohlc_buckets_preserve_extremes_and_volume():
+    rng = np.random.default_rng(1)
+    df = ohlcv(100 + rng.normal(size=len(IDX)).cumsum(), IDX)
+    df["High"] += rng.uniform(0, 2, len(IDX))
+    df["Low"] -= rng.uniform(0, 2, len(IDX))
+    out = downsample_ohlc(df, max_points=300)
+    assert len(out) <= 300
+    assert out["High"].max() == df["High"].max()
+    assert out["Low"].min() == df["Low"].min()
+    assert out["Open"].iloc[0] == df["Open"].iloc[0]
+    assert out["Close"].iloc[-1] == df["Close"].iloc[-1]
+    assert out["Volume"].sum() == df["Volume"].sum()
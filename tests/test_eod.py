@@ -0,0 +1,151 @@
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import eod
+from conftest import ROOT, ohlcv
+from ledger import Ledger
+
+
+def _holdings(tickers, prices, shares=10.0, cost=5.0):
+    prices = np.asarray(prices, dtype=float)
+    return pd.DataFrame({
+        "ticker": tickers, "shares": shares, "cost": cost, "price": prices, "fx": 1.0,
+        "market_value": prices * shares, "cost_basis": cost * shares, "profit": (prices - cost) * shares,
+    })
+
+
+@pytest.fixture
+def store(tmp_path):
+    return eod.EodStore(str(tmp_path / "eod"))
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return Ledger(str(tmp_path / "ledger.sqlite"))
+
+
+def test_round_trip_and_last_write_wins(store):
+    days = pd.bdate_range("2024-01-01", periods=30)
+    for i, d in enumerate(days):
+        store.write(d, "p", _holdings(["AAA", "BBB"], [10 + i, 20]), realized=1.0, usd_twd=32.0)
+    # 同一天重寫：賣掉 BBB 之後的那一筆取代前一筆，BBB 不會殘留
+    store.write(days[-1], "p", _holdings(["AAA"], [99.0]))
+    hist = store.history("p")
+    assert list(hist.index) == list(days)
+    assert hist["market_value"].iloc[0] == pytest.approx(100 + 200)
+    assert hist["market_value"].iloc[-1] == pytest.approx(990)
+    last = store.holdings_history("p").loc[days[-1]]
+    assert last["ticker"] == "AAA"
+    assert len(store.holdings_history("p", "BBB")) == 29
+    assert store.history("missing").empty
+
+
+def test_torn_append_is_repaired(store):
+    store.write("2024-01-02", "p", _holdings(["AAA"], [10.0]))
+    with open(store.totals._path("cost"), "ab") as f:
+        f.write(b"\0\0\0")  # 上次寫到一半中斷
+    assert len(store.history("p")) == 1
+    store.write("2024-01-03", "p", _holdings(["AAA"], [11.0]))
+    hist = eod.EodStore(store.folder).history("p")
+    assert hist["market_value"].tolist() == pytest.approx([100.0, 110.0])
+
+
+def test_close_calendar():
+    fri_close = pd.Timestamp("2026-10-16 16:15", tz=eod.CLOSE_TZ)
+    assert eod.last_close(pd.Timestamp("2026-10-17 12:00", tz="UTC")) == fri_close
+    assert eod.last_close(pd.Timestamp("2026-10-16 20:14", tz="UTC")) == fri_close - pd.Timedelta(days=1)
+    assert eod.next_close(fri_close) == pd.Timestamp("2026-10-19 16:15", tz=eod.CLOSE_TZ)
+
+
+WRITER = """
+import sys
+sys.path.insert(0, {root!r})
+import numpy as np, pandas as pd
+import eod
+store = eod.EodStore({folder!r})
+k = {k}
+for i in range({n}):
+    tickers = [f"T{{k}}_{{i}}_{{j}}" for j in range(3)]
+    prices = [k * 1e6 + i * 10 + j for j in range(3)]
+    h = pd.DataFrame({{"ticker": tickers, "shares": 1.0, "cost": 0.0, "price": prices, "fx": 1.0,
+                       "market_value": prices, "cost_basis": 0.0, "profit": prices}})
+    store.write(eod.EPOCH + pd.Timedelta(days=i), f"p{{k}}", h)
+"""
+
+
+def test_concurrent_writers_keep_rows_aligned(store):
+    procs, n = 3, 60
+    running = [
+        subprocess.Popen([sys.executable, "-c", WRITER.format(root=ROOT, folder=store.folder, k=k, n=n)])
+        for k in range(procs)
+    ]
+    assert all(p.wait(120) == 0 for p in running)
+
+    cols = store.holdings.read()
+    assert len(cols["day"]) == procs * n * 3
+    symbols = store.symbols()
+    assert len(symbols) == procs + procs * n * 3  # 沒有任何字串被其他行程蓋掉
+    for pid, day, ticker, price in zip(cols["pid"], cols["day"], cols["ticker"], cols["price"]):
+        k = int(symbols[pid][1:])
+        j = int(price - k * 1e6 - day * 10)
+        assert symbols[ticker] == f"T{k}_{day}_{j}"
+    for k in range(procs):
+        assert len(store.history(f"p{k}")) == n
+
+
+def test_only_one_scheduler_writes(store):
+    first, second = eod.Scheduler(store), eod.Scheduler(store)
+    assert first.leader()
+    assert not second.leader()
+    first._lease.close()
+    first._lease = None
+    assert second.leader()
+    second._lease.close()
+
+
+def _session(day, bars):
+    return pd.date_range(f"{day} 09:30", periods=bars, freq="15min", tz=eod.CLOSE_TZ)
+
+
+def test_catch_up_during_market_hours_records_last_close(market, store, ledger):
+    idx = _session("2024-03-04", 26).append(_session("2024-03-05", 7))
+    market.add("AAPL", ohlcv(np.r_[np.linspace(100, 150, 26), np.full(7, 200.0)], idx), "USD")
+    ledger.ensure_portfolio("p")
+    ledger.set_position("p", "AAPL", 10, 100)
+    sched = eod.Scheduler(store, ledger)
+    now = pd.Timestamp("2024-03-05 11:05", tz=eod.CLOSE_TZ)  # 週二盤中重啟
+    assert sched.due(now)
+    assert sched.run_once(now=now) == []
+    hist = store.history("p")
+    assert list(hist.index) == [pd.Timestamp("2024-03-04")]
+    assert hist["market_value"].iloc[0] == pytest.approx(1500)  # 週一收盤，不是盤中的 200
+    assert not sched.due(now)
+
+
+def test_failed_snapshot_is_retried_soon(monkeypatch, store, ledger):
+    calls = []
+
+    def snapshot(pid, ledger, store, close=None):
+        calls.append(pid)
+        if pid == "b" and calls.count("b") == 1:
+            raise LookupError("no bars yet")
+        return 1
+
+    monkeypatch.setattr(eod, "snapshot", snapshot)
+    monkeypatch.setattr(eod, "RETRY_BASE", 0.01)
+    for pid in ("a", "b"):
+        ledger.ensure_portfolio(pid)
+    sched = eod.Scheduler(store, ledger).start()
+    try:
+        end = time.time() + 5
+        while sched.last_run is None and time.time() < end:
+            time.sleep(0.01)
+        time.sleep(0.1)
+        assert calls == ["a", "b", "b"]  # 只重試失敗的組合，成功後睡到下一次收盤
+    finally:
+        sched.stop()
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import fx
+from conftest import ohlcv
+from poller import latest_bars
+
+IDX = pd.date_range("2024-03-04 14:30", periods=4, freq="15min", tz="UTC")
+
+
+def test_asof_uses_latest_rate_at_or_before_each_point():
+    rates = pd.Series([30.0, 31.0, 32.0], index=IDX[[0, 2, 3]])
+    before = pd.DatetimeIndex([IDX[0] - pd.Timedelta("1h")])
+    index = before.append(IDX)
+    assert fx.asof(rates, index).tolist() == [30, 30, 30, 31, 32]
+    # 其他時區的時間點依 UTC 對齊
+    assert fx.asof(rates, IDX.tz_convert("Asia/Taipei")).tolist() == [30, 30, 31, 32]
+
+
+def test_convert_and_spot(market):
+    market.add("TWD=X", ohlcv([32, 32, 33, 34], IDX))
+    market.add("JPY=X", ohlcv([150, 150, 150, 160], IDX))
+    s = pd.Series([1.0, 2.0, 3.0, 4.0], index=IDX)
+    assert fx.convert(s, "USD", "TWD").tolist() == [32, 64, 99, 136]
+    assert fx.convert(s, "TWD", "USD").tolist() == pytest.approx([1 / 32, 2 / 32, 3 / 33, 4 / 34])
+    assert fx.spot("TWD", "JPY") == pytest.approx(160 / 34)
+    assert fx.spot("USD", "USD") == 1.0
+
+
+def test_mixed_portfolio_trend_uses_historical_rates(market):
+    market.add("AAPL", ohlcv([100, 100, 100, 100], IDX), "USD")
+    market.add("2330.TW", ohlcv([640, 640, 660, 680], IDX), "TWD")
+    market.add("TWD=X", ohlcv([32, 32, 33, 34], IDX))
+    portfolio = [{"ticker": "AAPL", "shares": 1, "cost": 90},
+                 {"ticker": "2330.TW", "shares": 10, "cost": 612}]
+    val = fx.value_portfolio_in(latest_bars(["AAPL", "2330.TW"]), portfolio, "USD")
+    assert val.missing == []
+    assert val.trend.tolist() == pytest.approx([300, 300, 300, 300])
+    assert val.total_cost == pytest.approx(90 + 10 * 612 / 34)
+    twd = fx.value_portfolio_in(latest_bars(["AAPL", "2330.TW"]), portfolio, "TWD")
+    assert twd.trend.tolist() == pytest.approx([100 * 32 + 6400, 100 * 32 + 6400, 100 * 33 + 6600, 100 * 34 + 6800])
+
+
+def test_missing_rate_only_drops_that_currency(market):
+    market.add("AAPL", ohlcv([100, 101, 102, 103], IDX), "USD")
+    market.add("7203.T", ohlcv([3000, 3000, 3000, 3000], IDX), "JPY")  # 沒有 JPY=X
+    portfolio = [{"ticker": "AAPL", "shares": 2, "cost": 100},
+                 {"ticker": "7203.T", "shares": 100, "cost": 2500}]
+    val = fx.value_portfolio_in(latest_bars(["AAPL", "7203.T"]), portfolio, "USD")
+    assert val.tickers == ["AAPL"]
+    assert val.missing == ["7203.T"]
+    assert val.total_market == pytest.approx(206)
+    with pytest.raises(LookupError):
+        fx.spot("JPY", "USD")
+    with pytest.raises(LookupError):
+        fx.value_portfolio_in(latest_bars(["AAPL", "7203.T"]), portfolio, "JPY")
+
+
+def test_twd_falls_back_to_reference_rate(market):
+    market.add("2330.TW", ohlcv([650, 650, 650, 650], IDX), "TWD")
+    val = fx.value_portfolio_in(latest_bars(["2330.TW"]), [{"ticker": "2330.TW", "shares": 1, "cost": 650}], "USD")
+    assert val.total_market == pytest.approx(650 / fx.FALLBACK_PER_USD["TWD"])
+
+
+def test_pence_quotes_use_the_pound_rate(market):
+    market.add("VOD.L", ohlcv([80, 80, 80, 80], IDX), "GBp")
+    market.add("GBP=X", ohlcv([0.8, 0.8, 0.8, 0.8], IDX))
+    val = fx.value_portfolio_in(latest_bars(["VOD.L"]), [{"ticker": "VOD.L", "shares": 100, "cost": 64}], "USD")
+    assert val.total_market == pytest.approx(100)  # 100 股 × 0.80 GBP ÷ 0.8
+    assert val.total_cost == pytest.approx(80)
+    assert np.isclose(fx.spot("GBp", "GBP"), 0.01)
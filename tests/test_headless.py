@@ -0,0 +1,86 @@
+import json
+import threading
+from http.server import ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pandas as pd
+import pytest
+
+import headless
+from conftest import ohlcv
+from ledger import Ledger
+
+IDX = pd.date_range("2024-03-04 14:30", periods=4, freq="15min", tz="UTC")
+
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    led = Ledger(str(tmp_path / "ledger.sqlite"))
+    monkeypatch.setattr(headless, "get_ledger", lambda: led)
+    monkeypatch.setattr(headless, "_memo", {})
+    return led
+
+
+@pytest.fixture
+def mixed(market, ledger):
+    market.add("AAPL", ohlcv([100, 105, 108, 110], IDX), "USD")
+    market.add("2330.TW", ohlcv([640, 640, 650, 640], IDX), "TWD")
+    market.add("TWD=X", ohlcv([32, 32, 32, 32], IDX))
+    ledger.ensure_portfolio("p")
+    ledger.buy("p", "AAPL", 10, 100)
+    ledger.sell("p", "AAPL", 5, 110)  # 已實現 +50 USD
+    ledger.buy("p", "2330.TW", 100, 600)
+    ledger.sell("p", "2330.TW", 50, 664)  # 已實現 +3200 TWD
+    return ledger
+
+
+def test_every_kpi_is_in_the_requested_currency(mixed):
+    usd = headless.valuation_report("p", "USD")
+    assert usd["kpis"]["market_value"] == pytest.approx(5 * 110 + 50 * 640 / 32)
+    assert usd["kpis"]["realized"] == pytest.approx(50 + 3200 / 32)
+    twd = headless.valuation_report("p", "TWD")
+    assert twd["kpis"]["market_value"] == pytest.approx(5 * 110 * 32 + 50 * 640)
+    assert twd["kpis"]["realized"] == pytest.approx(50 * 32 + 3200)
+
+
+def test_report_is_memoized_per_snapshot_and_holdings(mixed):
+    first = headless.valuation_report("p", "USD")
+    assert headless.valuation_report("p", "USD") is first
+    mixed.buy("p", "AAPL", 1, 110)
+    again = headless.valuation_report("p", "USD")
+    assert again is not first
+    assert again["kpis"]["market_value"] == pytest.approx(first["kpis"]["market_value"] + 110)
+    json.dumps(again, allow_nan=False)
+
+
+@pytest.fixture
+def http(mixed):
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), headless.Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+
+    def get(path):
+        try:
+            with urlopen(f"http://127.0.0.1:{srv.server_port}{path}", timeout=10) as r:
+                return r.status, json.load(r)
+        except HTTPError as e:
+            return e.code, json.load(e)
+
+    yield get
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_http_endpoints(http):
+    status, body = http("/valuation?portfolio=p&currency=twd&points=2")
+    assert status == 200
+    assert body["currency"] == "TWD"
+    assert {h["ticker"] for h in body["holdings"]} == {"AAPL", "2330.TW"}
+    assert 0 < len(body["trend"]) <= 3  # 點數下限為 3
+    assert http("/portfolios") == (200, {"portfolios": ["p"]})
+    status, body = http("/health")
+    assert status == 200 and body["ok"] and body["snapshot_version"] >= 1
+    assert http("/nope")[0] == 404
+    assert http("/valuation?portfolio=p&points=abc")[0] == 400
+    status, body = http("/valuation?portfolio=p&currency=XYZ")
+    assert status == 400 and "XYZ" in body["error"]
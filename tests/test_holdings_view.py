@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from holdings_view import DOWN, UP, cards_html, page_slice, query, sign_styles
+
+
+def _holdings(n=120):
+    return pd.DataFrame({
+        "Ticker": [f"T{i:03d}" for i in range(n)],
+        "Profit": np.arange(n) - n / 2,
+        "P%": np.linspace(-10, 10, n),
+    })
+
+
+def test_query_filters_case_insensitively_then_sorts():
+    df = _holdings()
+    out = query(df, " t01 ", "Ticker", "Profit", descending=True)
+    assert out["Ticker"].tolist() == [f"T01{i}" for i in range(9, -1, -1)]
+    assert query(df, "", "Ticker").equals(df)
+
+
+def test_sort_puts_missing_values_last():
+    df = pd.DataFrame({"Ticker": ["A", "B", "C"], "Profit": [1.0, np.nan, 3.0]})
+    for descending in (False, True):
+        assert query(df, sort_by="Profit", descending=descending)["Ticker"].iloc[-1] == "B"
+
+
+def test_page_slice_bounds_every_page():
+    df = _holdings(120)
+    page, pages = page_slice(df, 3, page_size=50)
+    assert pages == 3 and len(page) == 20 and page["Ticker"].iloc[0] == "T100"
+    assert page_slice(df, 99, page_size=50)[0].equals(page)  # 超出範圍夾到最後一頁
+    assert page_slice(df, 0, page_size=50)[0]["Ticker"].iloc[0] == "T000"
+    empty, pages = page_slice(df.iloc[:0], 1)
+    assert pages == 1 and empty.empty
+
+
+def test_sign_styles_colours_whole_block():
+    frame = pd.DataFrame({"Profit": [-1.0, 0.0, 2.0], "P%": [1.0, -3.0, np.nan]})
+    css = sign_styles(frame)
+    assert css["Profit"].tolist() == [f"color: {DOWN}", f"color: {UP}", f"color: {UP}"]
+    assert css["P%"].tolist()[:2] == [f"color: {UP}", f"color: {DOWN}"]
+
+
+def test_cards_escape_ticker_text():
+    page = pd.DataFrame({"Logo": ["x.png"], "Ticker": ["<b>"], "Price": [1.0], "Value(USD)": [10.0],
+                         "Profit": [-1.0], "P%": [-5.0]})
+    out = cards_html(page)
+    assert "&lt;b&gt;" in out and "<b>" not in out
+    assert DOWN in out
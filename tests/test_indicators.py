@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import indicators
+from indicators import COLUMNS, IndicatorEngine
+
+
+def _bars(seed, days=6, start="2026-03-02", tz="America/New_York"):
+    rng = np.random.default_rng(seed)
+    sessions = pd.bdate_range(start, periods=days)
+    idx = pd.DatetimeIndex(np.concatenate([
+        pd.date_range(d + pd.Timedelta(hours=9, minutes=30), periods=26, freq="15min") for d in sessions
+    ])).tz_localize(tz).as_unit("ns").rename("Datetime")
+    close = 50 * np.exp(np.cumsum(rng.normal(0, 0.01, len(idx))))
+    open_ = np.r_[close[0], close[:-1]]
+    spread = np.abs(rng.normal(0, 0.3, len(idx)))
+    return pd.DataFrame({
+        "Open": open_, "High": np.maximum(open_, close) + spread, "Low": np.minimum(open_, close) - spread,
+        "Close": close, "Volume": rng.integers(100, 10_000, len(idx)).astype(float),
+    }, index=idx)
+
+
+def reference(df, session_vwap=True):
+    """以 pandas rolling / ewm 逐欄整段重算。"""
+    c, h, l, v = df["Close"], df["High"], df["Low"], df["Volume"]
+    out = pd.DataFrame(index=df.index)
+    for w in indicators.SMA_WINDOWS:
+        out[f"SMA{w}"] = c.rolling(w).mean()
+    for s in indicators.EMA_SPANS:
+        out[f"EMA{s}"] = c.ewm(span=s, adjust=False).mean()
+    mid = c.rolling(indicators.BB_WINDOW).mean()
+    std = c.rolling(indicators.BB_WINDOW).std(ddof=0)
+    out["BB_MID"], out["BB_UPPER"], out["BB_LOWER"] = mid, mid + indicators.BB_K * std, mid - indicators.BB_K * std
+    tp = (h + l + c) / 3
+    key = df.index.tz_localize(None).normalize() if session_vwap else pd.Series(0, index=df.index)
+    out["VWAP"] = (tp * v).groupby(key).cumsum() / v.groupby(key).cumsum()
+
+    d = c.diff().iloc[1:]
+    alpha = 1 / indicators.RSI_PERIOD
+    gain = d.clip(lower=0).ewm(alpha=alpha, adjust=False).mean()
+    loss = (-d).clip(lower=0).ewm(alpha=alpha, adjust=False).mean()
+    rsi = 100 - 100 / (1 + gain / loss)
+    out["RSI"] = rsi.where(np.arange(len(rsi)) + 2 > indicators.RSI_PERIOD)
+
+    macd = (c.ewm(span=indicators.MACD_FAST, adjust=False).mean()
+            - c.ewm(span=indicators.MACD_SLOW, adjust=False).mean())
+    sig = macd.ewm(span=indicators.MACD_SIGNAL, adjust=False).mean()
+    out["MACD"], out["MACD_SIGNAL"], out["MACD_HIST"] = macd, sig, macd - sig
+
+    prev = c.shift()
+    tr = pd.concat([h - l, (h - prev).abs(), (l - prev).abs()], axis=1).max(axis=1)
+    tr.iloc[0] = h.iloc[0] - l.iloc[0]
+    atr = tr.ewm(alpha=1 / indicators.ATR_PERIOD, adjust=False).mean()
+    out["ATR"] = atr.where(np.arange(len(atr)) + 1 >= indicators.ATR_PERIOD)
+    return out[COLUMNS]
+
+
+@pytest.fixture
+def frames():
+    return {"AAA": _bars(1), "BBB": _bars(2, days=4, start="2026-03-04"), "TWN": _bars(3, tz="Asia/Taipei")}
+
+
+def test_matches_pandas_reference(frames):
+    eng = IndicatorEngine()
+    eng.update(frames)
+    for t, df in frames.items():
+        got = eng.frame(t)
+        assert got.index.equals(df.index)
+        pd.testing.assert_frame_equal(got, reference(df), check_freq=False, rtol=1e-10, atol=1e-10)
+
+
+def test_incremental_equals_full_recompute(frames):
+    full = IndicatorEngine()
+    full.update(frames)
+    inc = IndicatorEngine()
+    rng = np.random.default_rng(0)
+    cuts = {t: np.sort(rng.choice(np.arange(1, len(df)), 8, replace=False)) for t, df in frames.items()}
+    for k in range(9):
+        # 每次刷新都帶著上一根 (當時未收盤) 重送，與輪詢時的情況相同
+        chunk = {}
+        for t, df in frames.items():
+            lo = 0 if k == 0 else cuts[t][k - 1] - 1
+            hi = cuts[t][k] if k < 8 else len(df)
+            chunk[t] = df.iloc[lo:hi]
+        inc.update(chunk)
+    for t in frames:
+        pd.testing.assert_frame_equal(inc.frame(t), full.frame(t), rtol=1e-12, atol=1e-12)
+    pd.testing.assert_frame_equal(inc.latest(list(frames)), full.latest(list(frames)), rtol=1e-12, atol=1e-12)
+
+
+def test_forming_bar_is_revised_not_committed(frames):
+    df = frames["AAA"]
+    eng = IndicatorEngine()
+    eng.update({"AAA": df.iloc[:50]})
+    forming = df.iloc[:50].copy()
+    forming.iloc[-1, forming.columns.get_loc("Close")] *= 1.5  # 同一根 K 線後來收在別的價位
+    eng.update({"AAA": forming})
+    eng.update({"AAA": df.iloc[49:60]})
+    pd.testing.assert_frame_equal(eng.frame("AAA"), reference(df.iloc[:60]), check_freq=False, rtol=1e-10, atol=1e-10)
+
+
+def test_reset_recomputes_from_scratch(frames):
+    df = frames["AAA"]
+    eng = IndicatorEngine()
+    eng.update({"AAA": df.iloc[40:]})
+    eng.reset(["AAA"])
+    eng.update({"AAA": df})
+    pd.testing.assert_frame_equal(eng.frame("AAA"), reference(df), check_freq=False, rtol=1e-10, atol=1e-10)
+
+
+def test_daily_levels_accumulate_vwap(frames):
+    df = frames["AAA"]
+    eng = IndicatorEngine(session_vwap=False)
+    eng.update({"AAA": df})
+    expected = reference(df, session_vwap=False)["VWAP"]
+    np.testing.assert_allclose(eng.frame("AAA")["VWAP"], expected, rtol=1e-10)
@@ -0,0 +1,88 @@
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+import ledger as ledger_mod
+from conftest import ROOT
+from ledger import Ledger
+
+
+def _other_process(path, code):
+    """在另一個行程對同一個帳本檔執行 code (變數 L 為該行程的 Ledger)。"""
+    script = f"import sys; sys.path.insert(0, {ROOT!r}); from ledger import Ledger; L = Ledger({path!r}); {code}"
+    subprocess.run([sys.executable, "-c", script], check=True)
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return Ledger(str(tmp_path / "ledger.sqlite"))
+
+
+def test_fifo_sell_realizes_against_oldest_lot(ledger):
+    ledger.buy("p", "AAA", 10, 5.0, day="2024-01-01")
+    ledger.buy("p", "AAA", 10, 7.0, day="2024-01-02")
+    ledger.sell("p", "AAA", 15, 8.0, day="2024-01-03", fee=1.0)
+    pos = ledger.position("p", "AAA")
+    assert pos["shares"] == pytest.approx(5)
+    assert pos["cost"] == pytest.approx(7.0)
+    assert pos["realized"] == pytest.approx(10 * 3 + 5 * 1 - 1)
+    assert [lot["remaining"] for lot in ledger.lots("p", "AAA")] == [pytest.approx(5)]
+
+
+def test_batch_is_all_or_nothing(ledger):
+    ledger.buy("p", "AAA", 1, 1.0)
+    with pytest.raises(ValueError, match="第 2 筆"):
+        ledger.apply_batch("p", [("BBB", "BUY", 1, 1.0, "2024-01-01", 0.0), ("BBB", "SELL", 5, 1.0, "2024-01-02", 0.0)])
+    assert [p["ticker"] for p in ledger.positions("p")] == ["AAA"]
+
+
+def test_reads_see_other_process_writes(ledger):
+    ledger.buy("p", "AAA", 10, 5.0)
+    assert ledger.positions("p")  # 先讓部位進到記憶體
+    _other_process(ledger.path, "L.buy('p', 'BBB', 3, 2.0)")
+    assert sorted(p["ticker"] for p in ledger.positions("p")) == ["AAA", "BBB"]
+
+
+def test_stale_book_cannot_oversell(ledger):
+    ledger.buy("p", "AAA", 10, 5.0)
+    assert ledger.position("p", "AAA")["shares"] == 10
+    _other_process(ledger.path, "L.remove('p', 'AAA')")
+    with pytest.raises(ValueError):
+        ledger.sell("p", "AAA", 5, 6.0)
+    assert ledger.positions("p") == []
+    assert ledger.lots("p", "AAA") == []
+
+
+def test_every_connection_is_closed(tmp_path, monkeypatch):
+    opened = []
+
+    class Tracked(sqlite3.Connection):
+        closed = False
+
+        def close(self):
+            self.closed = True
+            super().close()
+
+    real = sqlite3.connect
+
+    def connect(*args, **kwargs):
+        con = real(*args, factory=Tracked, **kwargs)
+        opened.append(con)
+        return con
+
+    monkeypatch.setattr(ledger_mod.sqlite3, "connect", connect)
+    led = Ledger(str(tmp_path / "ledger.sqlite"))
+    led.ensure_portfolio("p")
+    led.buy("p", "AAA", 10, 5.0)
+    led.sell("p", "AAA", 4, 6.0)
+    led.positions("p")
+    led.lots("p", "AAA")
+    led.transactions("p")
+    led.portfolio_ids()
+    with pytest.raises(ValueError):
+        led.sell("p", "AAA", 100, 6.0)
+    led.close()
+    assert len(opened) > 5
+    assert all(con.closed for con in opened)
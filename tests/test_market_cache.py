@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pandas as pd
+
+from conftest import ohlcv
+from market_cache import MarketCache
+
+IDX = pd.date_range("2024-03-04 14:30", periods=50, freq="15min", tz="UTC")
+
+
+class Loader:
+    def __init__(self, gate=None, fail=False):
+        self.calls = []
+        self.gate = gate
+        self.fail = fail
+
+    def __call__(self, tickers, period, interval):
+        self.calls.append(list(tickers))
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.fail:
+            raise ConnectionError("upstream down")
+        return {t: ohlcv(range(len(IDX)), IDX) for t in tickers if t != "BAD"}
+
+
+def test_concurrent_misses_share_one_load():
+    gate = threading.Event()
+    loader = Loader(gate)
+    cache = MarketCache(loader=loader)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_many(["AAA"])["AAA"])) for _ in range(8)]
+    for t in threads:
+        t.start()
+    while cache.stats()["coalesced"] < 7:
+        time.sleep(0.005)
+    gate.set()
+    for t in threads:
+        t.join()
+    assert loader.calls == [["AAA"]]
+    assert len(results) == 8 and all(df is results[0] for df in results)
+    assert cache.stats()["misses"] == 1
+
+
+def test_ttl_and_negative_caching():
+    loader = Loader()
+    cache = MarketCache(ttl=0.05, loader=loader)
+    first = cache.get_many(["AAA", "BAD"])
+    assert first["BAD"] is None
+    again = cache.get_many(["AAA", "BAD"])
+    assert again["AAA"] is first["AAA"]
+    assert loader.calls == [["AAA", "BAD"]]  # 查無資料的代碼也不會每次都打上游
+    time.sleep(0.06)
+    cache.get_many(["AAA"])
+    assert loader.calls[-1] == ["AAA"]
+
+
+def test_byte_budget_evicts_least_recently_used():
+    loader = Loader()
+    size = int(ohlcv(range(len(IDX)), IDX).memory_usage(index=True).sum())
+    cache = MarketCache(max_bytes=2 * size, loader=loader)
+    cache.get_many(["A"])
+    cache.get_many(["B"])
+    cache.get_many(["A"])  # A 變成最近使用
+    cache.get_many(["C"])
+    loader.calls.clear()
+    cache.get_many(["A", "C"])
+    assert loader.calls == []
+    cache.get_many(["B"])
+    assert loader.calls == [["B"]]
+    assert cache.stats()["evictions"] >= 1
+
+
+def test_failed_load_reaches_every_waiter_and_is_not_cached():
+    gate = threading.Event()
+    loader = Loader(gate, fail=True)
+    cache = MarketCache(loader=loader)
+    errors = []
+
+    def get():
+        try:
+            cache.get_many(["AAA"])
+        except ConnectionError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=get) for _ in range(3)]
+    for t in threads:
+        t.start()
+    while cache.stats()["coalesced"] < 2:
+        time.sleep(0.005)
+    gate.set()
+    for t in threads:
+        t.join()
+    assert len(errors) == 3 and len(loader.calls) == 1
+    loader.fail = False
+    assert cache.get_many(["AAA"])["AAA"] is not None
+    assert cache.stats()["inflight"] == 0
+
+
+def test_refresh_bypasses_ttl():
+    loader = Loader()
+    cache = MarketCache(ttl=3600, loader=loader)
+    cache.get_many(["AAA"])
+    cache.refresh(["AAA"])
+    assert loader.calls == [["AAA"], ["AAA"]]
+    loader.calls.clear()
+    cache.get_many(["AAA"])  # refresh 的結果也寫回快取
+    assert loader.calls == []
@@ -0,0 +1,56 @@
+import json
+import threading
+import time
+
+import metadata
+
+
+def _fetch(ticker):
+    time.sleep(0.005)
+    return dict(metadata.fallback(ticker), currency="USD", resolved_at=time.time(), ok=True)
+
+
+def _on_disk(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def test_cache_is_saved_while_resolution_never_drains(tmp_path):
+    path = str(tmp_path / "metadata.json")
+    svc = metadata.MetadataService(path=path, max_workers=1, fetch=_fetch, save_delay=0.05)
+    end = time.time() + 5
+    i = 0
+    # 每次重跑都丟新的標的進來，待解析佇列一直不會清空
+    while not _on_disk(path) and time.time() < end:
+        svc.get_many([f"T{i}", f"T{i + 1}"])
+        i += 2
+        time.sleep(0.002)
+    assert svc.pending()
+    assert _on_disk(path)
+    assert all(entry["currency"] == "USD" for entry in _on_disk(path).values())
+
+
+def test_saving_does_not_block_readers(tmp_path, monkeypatch):
+    svc = metadata.MetadataService(path=str(tmp_path / "metadata.json"), fetch=_fetch, save_delay=60)
+    svc.resolve_many(["AAA"])
+    started, release = threading.Event(), threading.Event()
+    save = svc._save
+
+    def slow_save(data):
+        started.set()
+        release.wait(5)
+        save(data)
+
+    monkeypatch.setattr(svc, "_save", slow_save)
+    t = threading.Thread(target=svc.flush)
+    t.start()
+    assert started.wait(5)
+    t0 = time.perf_counter()
+    assert svc.get_many(["AAA"])["AAA"]["currency"] == "USD"
+    assert time.perf_counter() - t0 < 0.5
+    release.set()
+    t.join()
+    assert metadata.MetadataService(path=svc.path, fetch=_fetch).get_many(["AAA"])["AAA"]["ok"]
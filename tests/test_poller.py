@@ -0,0 +1,73 @@
+import pandas as pd
+import pytest
+
+import poller
+from conftest import ohlcv
+from market_cache import MarketCache
+
+IDX = pd.date_range("2024-03-04 14:30", periods=4, freq="15min", tz="UTC")
+
+
+class Loader:
+    def __init__(self):
+        self.calls = []
+        self.price = 10.0
+
+    def __call__(self, tickers, period, interval):
+        self.calls.append(list(tickers))
+        return {t: ohlcv([self.price] * len(IDX), IDX) for t in tickers if t != "BAD"}
+
+
+@pytest.fixture
+def loader():
+    return Loader()
+
+
+@pytest.fixture
+def p(loader, monkeypatch):
+    mp = poller.MarketPoller(cache=MarketCache(loader=loader))
+    monkeypatch.setattr(poller, "get_poller", lambda period="5d", interval="15m": mp)
+    return mp
+
+
+def test_snapshots_are_immutable_versions(p):
+    first = p.publish({"AAA": ohlcv([1, 2, 3, 4], IDX)})
+    second = p.publish({"BBB": ohlcv([5, 6, 7, 8], IDX), "CCC": None})
+    assert (first.version, second.version) == (1, 2)
+    assert list(first.frames) == ["AAA"]
+    assert sorted(second.frames) == ["AAA", "BBB"]
+    with pytest.raises(TypeError):
+        second.frames["AAA"] = None
+    assert second.frame(["AAA", "BBB"])["BBB"]["Close"].tolist() == [5, 6, 7, 8]
+
+
+def test_latest_bars_fills_new_tickers_once(p, loader):
+    raw = poller.latest_bars(["AAA", "BAD"])
+    assert loader.calls == [["AAA", "BAD"]]
+    assert list(raw.columns.get_level_values(0).unique()) == ["AAA"]
+    poller.latest_bars(["AAA"])
+    assert loader.calls == [["AAA", "BAD"]]  # 已在快照裡：只讀快照
+    assert "AAA" in p.universe()
+
+
+def test_poll_once_refreshes_watched_and_sources(p, loader):
+    p.watch(["AAA"])
+    p.add_source("ledger", lambda: ["BBB"])
+    p.add_source("broken", lambda: 1 / 0)  # 來源出錯不影響其他標的
+    seen = []
+    p.add_listener("test", lambda snap, fresh: seen.append((snap.version, sorted(fresh))))
+    p.add_listener("boom", lambda snap, fresh: 1 / 0)
+    loader.price = 12.0
+    snap = p.poll_once()
+    assert sorted(loader.calls[-1]) == ["AAA", "BBB"]
+    assert seen == [(snap.version, ["AAA", "BBB"])]
+    assert snap.frames["AAA"]["Close"].iloc[-1] == 12.0
+
+
+def test_idle_tickers_expire(p, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(poller.time, "monotonic", lambda: now[0])
+    p.watch(["AAA"])
+    now[0] += poller.IDLE_EXPIRY + 1
+    p.watch(["BBB"])
+    assert p.universe() == ["BBB"]
@@ -0,0 +1,127 @@
+import io
+
+import pandas as pd
+import pytest
+
+import portfolio_io
+from conftest import ohlcv
+from ledger import Ledger
+
+IDX = pd.date_range("2024-03-04 14:30", periods=4, freq="15min", tz="UTC")
+
+
+class Service:
+    """metadata 服務的替身：KNOWN 以外的代碼查無此代碼，FLAKY 查詢失敗。"""
+
+    KNOWN = {"AAPL", "MSFT", "2330.TW"}
+    FLAKY = {"NEWCO"}
+
+    def __init__(self):
+        self.calls = []
+
+    def resolve_many(self, tickers, timeout=None):
+        self.calls.append(sorted(tickers))
+        out = {}
+        for t in tickers:
+            if t in self.FLAKY:
+                out[t] = {"ok": False, "error": "timeout", "resolved_at": None}
+            else:
+                out[t] = {"ok": t in self.KNOWN, "error": None, "resolved_at": 1.0}
+        return out
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return Ledger(str(tmp_path / "ledger.sqlite"))
+
+
+@pytest.fixture
+def service():
+    return Service()
+
+
+def _csv(text):
+    return io.StringIO(text.strip() + "\n")
+
+
+def test_broker_statement_is_sorted_and_applied_fifo(ledger, service):
+    # 新到舊排列、中文欄名、千分位與括號負數 (賣出)
+    src = _csv("""
+成交日期,證券代號,成交股數,成交單價,手續費
+2024-03-05,AAPL,(5),"1,200.00",1
+2024-03-01,AAPL,10,"1,000.00",2
+2024-03-02,AAPL,10,"1,100.00",2
+""")
+    report = portfolio_io.import_csv(ledger, "p", src, service=service)
+    assert (report.rows, report.applied, report.rejected) == (3, 3, [])
+    pos = ledger.position("p", "AAPL")
+    assert pos["shares"] == pytest.approx(15)
+    assert pos["realized"] == pytest.approx(5 * (1200 - 1000.2) - 1)  # 買進手續費攤入成本
+    assert [t["date"] for t in ledger.transactions("p")] == ["2024-03-01", "2024-03-02", "2024-03-05"]
+
+
+def test_bad_rows_are_reported_not_applied(ledger, service):
+    src = _csv("""
+symbol,side,qty,price,date
+AAPL,BUY,10,100,2024-01-02
+,BUY,1,1,2024-01-02
+MSFT,HOLD,1,1,2024-01-02
+MSFT,BUY,abc,1,2024-01-02
+MSFT,BUY,0,1,2024-01-02
+MSFT,BUY,1,,2024-01-02
+MSFT,BUY,1,1,not a date
+ZZZZ,BUY,1,1,2024-01-02
+NEWCO,BUY,3,5,2024-01-02
+""")
+    report = portfolio_io.import_csv(ledger, "p", src, service=service)
+    assert report.rows == 9
+    assert report.applied == 2
+    assert report.rejected_frame()["row"].tolist() == [2, 3, 4, 5, 6, 7, 8]
+    assert dict(report.rejected)[8] == "查無此代碼"
+    assert report.unverified == {"NEWCO"}
+    assert sorted(p["ticker"] for p in ledger.positions("p")) == ["AAPL", "NEWCO"]
+
+
+def test_tickers_are_validated_once_across_chunks(ledger, service):
+    lines = ["ticker,shares,price"] + [f"{t},1,10" for t in ["AAPL", "MSFT"] * 3 + ["2330.TW"]]
+    report = portfolio_io.import_csv(ledger, "p", _csv("\n".join(lines)), chunksize=2, service=service)
+    assert report.applied == 7
+    assert sorted(t for call in service.calls for t in call) == ["2330.TW", "AAPL", "MSFT"]
+
+
+def test_positions_mode_sets_holdings(ledger, service):
+    ledger.buy("p", "AAPL", 100, 50.0)
+    src = _csv("""
+Symbol,Quantity,Average Cost
+AAPL,20,120
+MSFT,5,300
+""")
+    portfolio_io.import_csv(ledger, "p", src, mode="positions", service=service)
+    got = {p["ticker"]: (p["shares"], p["cost"]) for p in ledger.positions("p")}
+    assert got == {"AAPL": (20, 120), "MSFT": (5, 300)}
+
+
+def test_oversell_rolls_back_whole_import(ledger, service):
+    ledger.buy("p", "MSFT", 1, 10.0)
+    src = _csv("""
+ticker,side,shares,price,date
+AAPL,BUY,5,10,2024-01-01
+AAPL,SELL,6,10,2024-01-02
+""")
+    with pytest.raises(ValueError, match="第 2 筆"):
+        portfolio_io.import_csv(ledger, "p", src, service=service)
+    assert [p["ticker"] for p in ledger.positions("p")] == ["MSFT"]
+
+
+def test_export_round_trips_through_positions_import(market, ledger, service, tmp_path):
+    market.add("AAPL", ohlcv([100, 110, 120, 130], IDX), "USD")
+    market.add("MSFT", ohlcv([250, 250, 260, 300], IDX), "USD")
+    ledger.buy("p", "AAPL", 10, 100.0)
+    ledger.buy("p", "MSFT", 4, 250.0)
+    df = portfolio_io.positions_frame(ledger, "p")
+    assert df.set_index("ticker")["profit"].to_dict() == pytest.approx({"AAPL": 300, "MSFT": 200})
+    path = tmp_path / "positions.csv"
+    path.write_bytes(portfolio_io.to_csv_bytes(df))
+    other = Ledger(str(tmp_path / "other.sqlite"))
+    portfolio_io.import_csv(other, "q", str(path), mode="positions", service=service)
+    assert other.positions("q") == [dict(p, realized=0.0) for p in ledger.positions("p")]
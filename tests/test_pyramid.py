@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import pyramid
+from bar_store import BarStore
+
+TZ = "America/New_York"
+
+
+def _bars(start, days, seed=0):
+    """每個交易日 09:30-16:00 的 15 分 K，開高低收互不相同。"""
+    idx = pd.DatetimeIndex(np.concatenate([
+        pd.date_range(d + pd.Timedelta(hours=9, minutes=30), periods=26, freq="15min")
+        for d in pd.bdate_range(start, periods=days)
+    ])).tz_localize(TZ)
+    rng = np.random.default_rng(seed)
+    close = 100 + rng.normal(0, 1, len(idx)).cumsum()
+    open_ = close + rng.normal(0, 0.3, len(idx))
+    return pd.DataFrame({
+        "Open": open_,
+        "High": np.maximum(open_, close) + rng.uniform(0, 1, len(idx)),
+        "Low": np.minimum(open_, close) - rng.uniform(0, 1, len(idx)),
+        "Close": close,
+        "Volume": rng.integers(100, 1000, len(idx)).astype(float),
+    }, index=idx)
+
+
+def _resample(df, rule, **kw):
+    out = df.resample(rule, **kw).agg(
+        {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"}
+    )
+    return out.dropna(subset=["Close"])
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BarStore(str(tmp_path / "bars.sqlite"))
+
+
+@pytest.mark.parametrize("level,rule,kw", [
+    ("1h", "h", {}),
+    ("1d", "D", {}),
+    ("1wk", "W-MON", {"label": "left", "closed": "left"}),
+])
+def test_aggregate_matches_resample(level, rule, kw):
+    df = _bars("2024-02-26", 12)
+    got = pyramid.aggregate(df, level)
+    want = _resample(df, rule, **kw)
+    pd.testing.assert_frame_equal(got, want, check_freq=False, check_names=False)
+
+
+def test_aggregate_skips_missing_bars():
+    df = _bars("2024-03-04", 2)
+    df.iloc[3, df.columns.get_loc("Close")] = np.nan
+    got = pyramid.aggregate(df, "1d")
+    assert len(got) == 2
+    assert got["Volume"].iloc[0] == df["Volume"].iloc[:26].drop(df.index[3]).sum()
+
+
+def test_update_is_incremental_and_matches_full_rebuild(store):
+    df = _bars("2024-03-04", 10)
+    cut = 26 * 6 + 9  # 第七天盤中：最後一小時 / 一日 / 一週都還沒收完
+    store.write("AAA", pyramid.BASE, df.iloc[:cut])
+    pyramid.update("AAA", store)
+    store.write("AAA", pyramid.BASE, df.iloc[cut:])
+    pyramid.update("AAA", store)
+    for level in pyramid.LEVELS:
+        got = store.read("AAA", pyramid.level_key(level))
+        want = pyramid.aggregate(df, level)
+        np.testing.assert_allclose(got.to_numpy(), want.to_numpy())
+        assert (got.index == want.index).all()
+
+
+def test_backfilled_history_rebuilds_levels(store):
+    df = _bars("2024-03-04", 10)
+    store.write("AAA", pyramid.BASE, df.iloc[26 * 5:])
+    pyramid.update("AAA", store)
+    store.write("AAA", pyramid.BASE, df.iloc[:26 * 5])  # 往前補了一週
+    pyramid.update("AAA", store)
+    got = store.read("AAA", pyramid.level_key("1wk"))
+    want = pyramid.aggregate(df, "1wk")
+    np.testing.assert_allclose(got.to_numpy(), want.to_numpy())
+    assert len(got) == 2
+
+
+def test_horizon_bars_reads_the_matching_level(store):
+    df = _bars(pd.Timestamp.now().normalize() - pd.offsets.BDay(8), 5)  # 顯示區間以現在為準
+    store.write("AAA", pyramid.BASE, df)
+    pyramid.update("AAA", store)
+    raw = pyramid.horizon_bars(["AAA"], "60日 · 日線", store=store)
+    assert raw["AAA"].dropna()["Close"].tolist() == pytest.approx(pyramid.aggregate(df, "1d")["Close"].tolist())
@@ -0,0 +1,86 @@
+import pytest
+
+import resilience
+from resilience import CircuitBreaker, ResilientFetcher
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Upstream:
+    """每檔依序回傳 script 裡的結果：True 成功、False 缺資料、Exception 整批失敗。"""
+
+    def __init__(self, **script):
+        self.script = {t: list(s) for t, s in script.items()}
+        self.calls = []
+
+    def __call__(self, tickers, interval, period=None, start=None):
+        self.calls.append(list(tickers))
+        out = {}
+        for t in tickers:
+            step = self.script[t].pop(0) if self.script[t] else True
+            if isinstance(step, Exception):
+                raise step
+            if step:
+                out[t] = f"{t}-bars"
+        return out
+
+
+def test_backoff_is_capped_full_jitter(monkeypatch):
+    monkeypatch.setattr(resilience.random, "uniform", lambda lo, hi: (lo, hi))
+    assert resilience.backoff(1, base=0.5, cap=8) == (0, 1.0)
+    assert resilience.backoff(10, base=0.5, cap=8) == (0, 8)
+
+
+def test_only_failed_tickers_are_retried():
+    up = Upstream(AAA=[True], BBB=[False, RuntimeError("boom"), True])
+    sleeps = []
+    f = ResilientFetcher(up, retries=3, sleep=sleeps.append)
+    assert f(["AAA", "BBB"], "15m") == {"AAA": "AAA-bars", "BBB": "BBB-bars"}
+    assert up.calls == [["AAA", "BBB"], ["BBB"], ["BBB"]]
+    assert len(sleeps) == 2 and all(0 <= s <= f.max_delay for s in sleeps)
+    assert all(h["ok"] for h in f.health(["AAA", "BBB"]).values())
+
+
+def test_breaker_opens_after_threshold_and_half_opens_after_cooldown():
+    clock = Clock()
+    b = CircuitBreaker(threshold=2, cooldown=10, max_cooldown=25, clock=clock)
+    b.failure("X")
+    assert b.allow("X")
+    b.failure("X")
+    assert b.is_open("X") and b.open_keys() == ["X"]
+    clock.now += 10
+    assert b.allow("X")  # half-open：放行一次試探
+    b.failure("X")  # 試探失敗：立刻再斷路，冷卻加倍
+    clock.now += 19
+    assert b.is_open("X")
+    clock.now += 1
+    b.failure("X")
+    clock.now += 24
+    assert b.is_open("X")  # 冷卻以 max_cooldown 為上限
+    clock.now += 1
+    assert b.allow("X")
+    b.success("X")
+    b.failure("X")
+    assert b.allow("X")  # 成功後重新計數
+
+
+def test_open_circuit_skips_upstream_and_reports_stale(monkeypatch):
+    up = Upstream(AAA=[False] * 10, BBB=[])
+    f = ResilientFetcher(up, retries=1, breaker=CircuitBreaker(threshold=2), sleep=lambda s: None)
+    f(["AAA", "BBB"], "15m")
+    f(["AAA", "BBB"], "15m")
+    up.calls.clear()
+    assert f(["AAA", "BBB"], "15m") == {"BBB": "BBB-bars"}
+    assert up.calls == [["BBB"]]
+    health = f.health(["AAA", "BBB"])
+    assert health["AAA"]["open"] and not health["AAA"]["ok"] and health["AAA"]["last_success"] is None
+    monkeypatch.setattr(resilience, "_fetcher", f)
+    assert resilience.stale_tickers(["AAA", "BBB"]) == {"AAA": None}
+    assert "AAA" in resilience.stale_note(["AAA", "BBB"])
+    assert resilience.stale_note(["BBB"]) is None
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import poller
+import risk
+from conftest import ohlcv
+
+DAYS = pd.bdate_range("2024-01-02", periods=40)
+
+
+def _daily(closes, tz):
+    return ohlcv(closes, DAYS.tz_localize(tz))
+
+
+def _walk(seed):
+    rng = np.random.default_rng(seed)
+    return 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(DAYS))))
+
+
+@pytest.fixture(autouse=True)
+def fresh_memo(monkeypatch):
+    monkeypatch.setattr(risk, "_memo", {})
+
+
+def test_us_and_taipei_closes_align_on_session_date(market):
+    spy, us, tw = _walk(1), _walk(2), _walk(3)
+    market.add("SPY", _daily(spy, "America/New_York"), "USD")
+    market.add("AAPL", _daily(us, "America/New_York"), "USD")
+    market.add("2330.TW", _daily(tw, "Asia/Taipei"), "TWD")
+    market.add("TWD=X", _daily(np.full(len(DAYS), 32.0), "Europe/London"))
+    rep = risk.portfolio_risk([{"ticker": "AAPL", "shares": 10, "cost": 1},
+                               {"ticker": "2330.TW", "shares": 100, "cost": 1}], period="1y", interval="1d")
+
+    assert len(rep.index) == len(DAYS)
+    assert (rep.returns != 0).all().all()  # 沒有交錯出來的 0 報酬日
+    expected = pd.DataFrame({"AAPL": us, "2330.TW": tw}).pct_change().dropna()
+    assert rep.volatility == pytest.approx(expected.std().to_numpy() * np.sqrt(252), rel=1e-9)
+    assert rep.corr.loc["AAPL", "2330.TW"] == pytest.approx(expected.corr().iloc[0, 1], rel=1e-9)
+    spy_r = pd.Series(spy).pct_change().dropna().to_numpy()
+    beta = np.cov(expected["AAPL"], spy_r)[0, 1] / np.var(spy_r, ddof=1)
+    assert rep.beta[0] == pytest.approx(beta, rel=1e-9)
+
+
+def test_memo_keeps_reports_of_other_pollers(market):
+    market.add("SPY", _daily(_walk(1), "America/New_York"), "USD")
+    market.add("AAPL", _daily(_walk(2), "America/New_York"), "USD")
+    portfolio = [{"ticker": "AAPL", "shares": 1, "cost": 1}]
+    year = risk.portfolio_risk(portfolio, period="1y")
+    poller.get_poller("6mo", "1d").publish({})  # 另一個輪詢器的版本號先往前走
+    half = risk.portfolio_risk(portfolio, period="6mo")
+    assert risk.portfolio_risk(portfolio, period="1y") is year
+    assert risk.portfolio_risk(portfolio, period="6mo") is half
+    poller.get_poller("1y", "1d").publish({})
+    assert risk.portfolio_risk(portfolio, period="1y") is not year
+    assert risk.portfolio_risk(portfolio, period="6mo") is half
@@ -0,0 +1,125 @@
+import sys
+import threading
+import time
+import types
+
+import pandas as pd
+import pytest
+
+import streaming
+from bar_store import BarStore
+from conftest import ohlcv
+from resilience import CircuitBreaker
+
+
+class FlakySocket:
+    """前兩次連線失敗 (一次丟例外、一次 listen 直接返回)，第三次送出一筆 tick 後一直掛著，之後都連不上。"""
+
+    connects = 0
+
+    def __init__(self, verbose=False):
+        FlakySocket.connects += 1
+        self.n = FlakySocket.connects
+        self.closed = threading.Event()
+
+    def subscribe(self, tickers):
+        if self.n == 1 or self.n > 3:
+            raise ConnectionError("boom")
+
+    def listen(self, handle):
+        if self.n == 2:
+            return
+        handle({"id": "AAA", "price": 12.5, "time": "1700000000000"})
+        self.closed.wait(5)
+
+    def close(self):
+        self.closed.set()
+
+
+@pytest.fixture
+def fake_yf(monkeypatch):
+    FlakySocket.connects = 0
+    monkeypatch.setitem(sys.modules, "yfinance", types.SimpleNamespace(WebSocket=FlakySocket))
+    monkeypatch.setattr(streaming, "RECONNECT_BASE", 0.01)
+    monkeypatch.setattr(streaming, "RECONNECT_MAX", 0.02)
+
+
+def _wait(cond, timeout=5):
+    end = time.time() + timeout
+    while not cond() and time.time() < end:
+        time.sleep(0.01)
+    return cond()
+
+
+def test_feed_reconnects_after_failures(fake_yf):
+    feed = streaming.YahooFeed(breaker=CircuitBreaker(threshold=10))
+    hub = streaming.QuoteHub(feed)
+    assert hub.last_prices(["AAA"]) == {}
+    hub.subscribe(["AAA"])
+    try:
+        assert _wait(lambda: hub.last_prices(["AAA"]) == {"AAA": 12.5})
+        assert FlakySocket.connects == 3
+        assert hub.status() == {"ok": True, "error": None}
+    finally:
+        feed.stop()
+
+
+def test_dead_feed_is_reported_not_served_as_live(fake_yf):
+    feed = streaming.YahooFeed(breaker=CircuitBreaker(threshold=10))
+    hub = streaming.QuoteHub(feed)
+    hub.subscribe(["AAA"])
+    try:
+        assert _wait(lambda: hub.last_prices(["AAA"]))
+        feed._ws.close()  # 連線中斷：下一次連線要等退避之後
+        assert _wait(lambda: not hub.status()["ok"])
+        assert hub.status()["error"] in ("stream closed", "ConnectionError: boom")
+        assert hub.last_prices(["AAA"]) == {}
+        assert hub.last_update(["AAA"]) is None
+    finally:
+        feed.stop()
+
+
+def test_hub_restarts_a_stopped_feed(fake_yf):
+    feed = streaming.YahooFeed(breaker=CircuitBreaker(threshold=10))
+    hub = streaming.QuoteHub(feed)
+    hub.subscribe(["AAA"])
+    feed.stop()
+    assert _wait(lambda: not feed.running())
+    hub.subscribe(["BBB"])
+    try:
+        assert feed.running()
+    finally:
+        feed.stop()
+
+
+def test_replay_skips_tickers_without_stored_bars(tmp_path):
+    store = BarStore(str(tmp_path / "bars.sqlite"))
+    store.write("AAA", "15m", ohlcv([10, 11, 12], pd.date_range("2024-03-04 14:30", periods=3, freq="15min", tz="UTC")))
+    feed = streaming.ReplayFeed(speed=500, store=store)
+    hub = streaming.QuoteHub(feed)
+    hub.subscribe(["NOPE", "AAA"])
+    try:
+        assert _wait(lambda: len(hub.ticks("AAA")) >= 3)
+        assert feed.running()
+        assert hub.status() == {"ok": True, "error": None}
+        assert hub.last_prices(["AAA", "NOPE"])["AAA"] in (10, 11, 12)
+    finally:
+        feed.stop()
+
+
+def test_replay_failure_is_reported_and_restarted(tmp_path):
+    class BrokenStore:
+        calls = 0
+
+        def read(self, ticker, interval):
+            BrokenStore.calls += 1
+            raise OSError("disk gone")
+
+    feed = streaming.ReplayFeed(speed=500, store=BrokenStore())
+    hub = streaming.QuoteHub(feed)
+    hub.subscribe(["AAA"])
+    assert _wait(lambda: not feed.running())
+    assert hub.status() == {"ok": False, "error": "OSError: disk gone"}
+    hub.subscribe(["BBB"])
+    assert _wait(lambda: BrokenStore.calls >= 2)
+    feed.stop()
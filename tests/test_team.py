@@ -0,0 +1,73 @@
+import pandas as pd
+import pytest
+
+import team
+from conftest import ohlcv
+from ledger import Ledger
+
+IDX = pd.date_range("2024-03-04 14:30", periods=4, freq="15min", tz="UTC")
+
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    monkeypatch.setattr(team, "_closes_memo", {})
+    return Ledger(str(tmp_path / "ledger.sqlite"))
+
+
+def test_mixed_currency_portfolios_are_valued_in_usd(market, ledger):
+    market.add("AAPL", ohlcv([100, 101, 102, 110], IDX), "USD")
+    market.add("2330.TW", ohlcv([640, 640, 650, 660], IDX), "TWD")
+    market.add("TWD=X", ohlcv([32, 32, 33, 33], IDX))
+    for pid in ("us", "tw", "both"):
+        ledger.ensure_portfolio(pid)
+    ledger.set_position("us", "AAPL", 10, 90)
+    ledger.set_position("tw", "2330.TW", 100, 600)  # 成本以新台幣記
+    ledger.set_position("both", "AAPL", 1, 100)
+    ledger.set_position("both", "2330.TW", 33, 660)
+
+    views = team.portfolio_views(ledger=ledger)
+
+    assert views["us"].total_market == pytest.approx(1100)
+    assert views["tw"].total_market == pytest.approx(100 * 660 / 33)
+    assert views["tw"].total_cost == pytest.approx(100 * 600 / 33)
+    # 走勢逐點用當時的匯率
+    assert views["tw"].trend.tolist() == pytest.approx([100 * 640 / 32, 100 * 640 / 32, 100 * 650 / 33, 2000])
+    assert views["both"].total_market == pytest.approx(110 + 660)
+    assert views["both"].total_cost == pytest.approx(100 + 660)
+
+    summary = team.team_summary(views, ledger).set_index("投資組合")
+    assert summary["市值(USD)"].sum() == pytest.approx(1100 + 2000 + 770)
+
+
+def test_universe_is_deduplicated_across_portfolios(ledger):
+    ledger.ensure_portfolio("a")
+    ledger.ensure_portfolio("b")
+    ledger.buy("a", "AAPL", 1, 1.0)
+    ledger.buy("a", "MSFT", 1, 1.0)
+    ledger.buy("b", "MSFT", 2, 1.0)
+    ledger.buy("b", "NVDA", 2, 1.0)
+    ledger.sell("b", "NVDA", 2, 1.0)  # 已出清的不再輪詢
+    assert sorted(team.ledger_universe(ledger)) == ["AAPL", "MSFT"]
+
+
+def test_all_portfolios_share_one_download_and_one_close_matrix(market, ledger):
+    for t in ("AAPL", "MSFT", "NVDA"):
+        market.add(t, ohlcv([10, 11, 12, 13], IDX), "USD")
+    for i in range(20):
+        ledger.ensure_portfolio(f"p{i}")
+        ledger.buy(f"p{i}", ["AAPL", "MSFT", "NVDA"][i % 3], 1, 10.0)
+        ledger.buy(f"p{i}", "MSFT", 1, 10.0)
+
+    views = team.portfolio_views(ledger=ledger)
+    assert len(views) == 20
+    assert len(market.loads) == 1 and sorted(market.loads[0]) == ["AAPL", "MSFT", "NVDA"]
+
+    universe = team.ledger_universe(ledger)
+    first = team.shared_closes(universe)
+    assert team.shared_closes(universe) is first  # 同一版快照不重組
+    p = team.enable(ledger=ledger)
+    p.publish({"AAPL": ohlcv([10, 11, 12, 20], IDX)})
+    again = team.shared_closes(universe)
+    assert again is not first and again["AAPL"].iloc[-1] == 20
+    assert len(market.loads) == 1
+    assert "AAPL" in p.universe()
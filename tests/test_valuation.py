@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bar_store import combine
+from conftest import ohlcv
+from valuation import close_frame, value_portfolio
+
+IDX = pd.date_range("2024-03-04 14:30", periods=30, freq="15min", tz="UTC")
+
+
+def _raw(closes):
+    return combine({t: ohlcv(c, IDX) for t, c in closes.items()}, list(closes))
+
+
+def _loop(raw, portfolio):
+    """原本各腳本的寫法：逐筆持股取最後收盤價、累加走勢。"""
+    total_market = total_cost = 0.0
+    trend = pd.Series(0.0, index=raw.index)
+    for item in portfolio:
+        close = raw[item['ticker']]["Close"].ffill()
+        price = close.dropna().iloc[-1]
+        total_market += price * item['shares']
+        total_cost += item['cost'] * item['shares']
+        trend = trend.add(close.fillna(0) * item['shares'])
+    return total_market, total_cost, trend
+
+
+def test_matches_per_holding_loop():
+    rng = np.random.default_rng(0)
+    closes = {f"T{i}": 50 * np.exp(np.cumsum(rng.normal(0, 0.01, len(IDX)))) for i in range(6)}
+    closes["T0"][:5] = np.nan  # 較晚開盤
+    closes["T1"][[10, 11]] = np.nan  # 中間缺值
+    raw = _raw(closes)
+    portfolio = [{"ticker": t, "shares": float(rng.integers(1, 100)), "cost": float(rng.uniform(30, 70))}
+                 for t in closes]
+    portfolio.append({"ticker": "T2", "shares": 5.0, "cost": 10.0})  # 同一代碼兩筆
+
+    val = value_portfolio(raw, portfolio)
+    market, cost, trend = _loop(raw, portfolio)
+    assert val.total_market == pytest.approx(market, rel=1e-12)
+    assert val.total_cost == pytest.approx(cost, rel=1e-12)
+    assert val.total_profit == pytest.approx(market - cost, rel=1e-12)
+    np.testing.assert_allclose(val.trend.to_numpy(), trend.to_numpy(), rtol=1e-12)
+    assert val.weights.sum() == pytest.approx(1.0)
+    h = val.holdings(rate=32.0)
+    assert h["market_value"].sum() == pytest.approx(market * 32)
+    assert h["profit_pct"].iloc[-1] == pytest.approx((h["price"].iloc[-1] / 32 - 10.0) / 10.0 * 100)
+
+
+def test_missing_tickers_and_reprice():
+    raw = _raw({"AAA": np.full(len(IDX), 10.0)})
+    portfolio = [{"ticker": "AAA", "shares": 2, "cost": 8}, {"ticker": "ZZZ", "shares": 1, "cost": 1}]
+    val = value_portfolio(raw, portfolio)
+    assert val.tickers == ["AAA"] and val.missing == ["ZZZ"]
+    live = val.reprice({"AAA": 12.0, "ZZZ": 99.0})
+    assert live.total_market == pytest.approx(24) and live.total_profit == pytest.approx(8)
+    assert val.total_market == pytest.approx(20)  # 原本的結果不受影響
+    assert live.trend is val.trend
+
+
+def test_empty_inputs():
+    assert close_frame(None, ["AAA"]).empty
+    val = value_portfolio(pd.DataFrame(), [{"ticker": "AAA", "shares": 1, "cost": 1}])
+    assert val.missing == ["AAA"] and val.total_market == 0 and val.total_profit_pct == 0
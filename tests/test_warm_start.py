@@ -0,0 +1,54 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import warm_start
+
+
+@pytest.fixture(autouse=True)
+def warm_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(warm_start, "WARM_DIR", str(tmp_path))
+    monkeypatch.setattr(warm_start, "ENABLED", True)
+    monkeypatch.setattr(warm_start, "_saved", {})
+    return tmp_path
+
+
+def test_round_trip_keeps_metrics_rows_and_trend_timezone():
+    idx = pd.date_range("2024-03-04 09:30", periods=5000, freq="15min", tz="America/New_York")
+    trend = pd.Series(np.linspace(100, 200, len(idx)), index=idx)
+    holdings = pd.DataFrame({"Ticker": [f"T{i}" for i in range(50)], "Value": range(50)})
+    assert warm_start.save("app:p/1", [("總市值", "$1,000", "+5%")], holdings, trend)
+    data = warm_start.load("app:p/1")
+    assert data["metrics"] == [["總市值", "$1,000", "+5%"]]
+    assert len(data["holdings"]) == warm_start.MAX_ROWS
+    assert data["holdings"]["Ticker"].iloc[0] == "T0"
+    assert len(data["trend"]) == warm_start.MAX_TREND_POINTS
+    assert str(data["trend"].index.tz) == "America/New_York"
+    assert data["trend"].index[0] == idx[0] and data["trend"].iloc[-1] == 200
+
+
+def test_saves_are_throttled_per_key(warm_dir):
+    assert warm_start.save("a", [("x", "1", None)])
+    assert not warm_start.save("a", [("x", "2", None)])
+    assert warm_start.save("b", [("x", "3", None)])
+    assert warm_start.save("a", [("x", "4", None)], force=True)
+    assert warm_start.load("a")["metrics"] == [["x", "4", None]]
+    assert not list(warm_dir.glob("*.tmp"))
+
+
+def test_missing_or_corrupt_snapshot_loads_as_none(warm_dir):
+    assert warm_start.load("nothing") is None
+    (warm_dir / "bad.json").write_text("{", encoding="utf-8")
+    assert warm_start.load("bad") is None
+    (warm_dir / "bare.json").write_text(json.dumps({"saved_at": 0, "metrics": []}), encoding="utf-8")
+    data = warm_start.load("bare")
+    assert data["holdings"] is None and data["trend"] is None
+
+
+def test_disabled_does_nothing(warm_dir, monkeypatch):
+    monkeypatch.setattr(warm_start, "ENABLED", False)
+    assert not warm_start.save("a", [("x", "1", None)])
+    assert warm_start.load("a") is None
+    assert not list(warm_dir.iterdir())
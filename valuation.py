@@ -0,0 +1,106 @@
+"""
+向量化的投資組合估值。
+
+把各持股的收盤價排成一個對齊的 (時間 × 標的) 矩陣，市值、成本、損益、
+權重與組合總值走勢都用一次矩陣運算算完，取代各腳本裡逐筆 for 迴圈加
+portfolio_trend.add(...) 的寫法。app.py / app11.py / apk.py / improve.py 共用。
+"""
+import copy
+
+import numpy as np
+import pandas as pd
+
+MONEY_COLUMNS = ["cost", "price", "market_value", "cost_basis", "profit"]
+
+
+def close_frame(raw_data, tickers):
+    """從 download_bars 的結果取出收盤價 (時間 × 標的)，向前填補並去掉全空的列。"""
+    tickers = list(dict.fromkeys(tickers))
+    if raw_data is None or raw_data.empty:
+        return pd.DataFrame(columns=tickers, dtype=float)
+    closes = raw_data.xs("Close", axis=1, level=1).reindex(columns=tickers).astype(float)
+    return closes.dropna(how="all").ffill()
+
+
+class Valuation:
+    """一次性算好的估值結果；所有金額以報價幣別 (預設 USD) 計。"""
+
+    def __init__(self, closes, tickers, shares, cost, missing=()):
+        self.closes = closes
+        self.index = closes.index
+        self.tickers = list(tickers)
+        self.missing = list(missing)
+        self.shares = np.asarray(shares, dtype=float)
+        self.cost = np.asarray(cost, dtype=float)
+
+        # (T × N) 矩陣，欄位順序與持股順序一致 (同一代碼重複出現也可以)
+        matrix = closes[self.tickers].to_numpy(dtype=float) if self.tickers else np.empty((len(closes), 0))
+        self._derive(matrix[-1] if len(matrix) else np.full(len(self.tickers), np.nan))
+
+        # 組合總值走勢：矩陣 × 股數向量 (尚未開盤的標的以 0 計)
+        self.trend = pd.Series(np.nan_to_num(matrix) @ self.shares, index=self.index, name="portfolio")
+
+    def _derive(self, price):
+        self.price = price
+        self.market_value = self.price * self.shares
+        self.cost_basis = self.cost * self.shares
+        self.profit = self.market_value - self.cost_basis
+        self.profit_pct = np.divide(self.profit * 100, self.cost_basis,
+                                    out=np.zeros_like(self.profit), where=self.cost_basis != 0)
+
+        self.total_market = float(np.nansum(self.market_value))
+        self.total_cost = float(self.cost_basis.sum())
+        self.total_profit = self.total_market - self.total_cost
+        self.total_profit_pct = self.total_profit / self.total_cost * 100 if self.total_cost else 0.0
+        self.weights = self.market_value / self.total_market if self.total_market else np.zeros_like(self.market_value)
+
+    def reprice(self, prices):
+        """以即時報價 {ticker: price} 覆蓋最新價，重算市值與損益 (走勢不變)。"""
+        live = np.array([prices.get(t, np.nan) for t in self.tickers], dtype=float)
+        out = copy.copy(self)
+        out._derive(np.where(np.isnan(live), self.price, live))
+        return out
+
+    def holdings(self, rate=1.0):
+        """每檔持股一列；金額欄位乘上匯率 rate (如 USD→TWD)。"""
+        df = pd.DataFrame({
+            "ticker": self.tickers,
+            "shares": self.shares,
+            "cost": self.cost,
+            "price": self.price,
+            "market_value": self.market_value,
+            "cost_basis": self.cost_basis,
+            "profit": self.profit,
+            "profit_pct": self.profit_pct,
+            "weight": self.weights,
+        })
+        df[MONEY_COLUMNS] = df[MONEY_COLUMNS] * rate
+        return df
+
+    def series(self, ticker):
+        """單一標的的收盤價走勢。"""
+        return self.closes[ticker].dropna()
+
+    def trend_in(self, rate=1.0):
+        return self.trend * rate
+
+
+def value_portfolio(raw_data, portfolio):
+    """portfolio 為 [{"ticker", "shares", "cost"}, ...]；查無行情的標的放在 .missing。"""
+    return value_from_closes(close_frame(raw_data, [item['ticker'] for item in portfolio]), portfolio)
+
+
+def value_from_closes(closes, portfolio):
+    """以現成的收盤價矩陣估值 (多個投資組合共用同一份全標的矩陣時使用)。"""
+    closes = closes.reindex(columns=list(dict.fromkeys(item['ticker'] for item in portfolio)))
+    closes = closes.dropna(how="all")
+    available = closes.columns[closes.notna().any()]
+    held = [item for item in portfolio if item['ticker'] in available]
+    missing = [item['ticker'] for item in portfolio if item['ticker'] not in available]
+    return Valuation(
+        closes.loc[:, available],
+        [item['ticker'] for item in held],
+        [item['shares'] for item in held],
+        [item['cost'] for item in held],
+        missing=missing,
+    )
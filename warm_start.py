@@ -0,0 +1,111 @@
+"""
+冷啟動用的「上次狀態」快照。
+
+每次算出新的估值就把 KPI、持股表與 (降採樣後的) 總值走勢寫到 .gupiao/warm/；
+新 session 或伺服器重啟後，頁面在載入 plotly / yfinance 與同步行情之前先讀這份檔案
+畫出上次的結果 (st.metric / st.line_chart，不需要 plotly)，最新資料算好後再換掉。
+檔案是純 JSON，讀取不需要任何重量級模組。
+"""
+import json
+import os
+import threading
+import time
+
+from bar_store import DATA_DIR
+
+WARM_DIR = os.path.join(DATA_DIR, "warm")
+ENABLED = os.environ.get("GUPIAO_WARM_START", "1") != "0"
+SAVE_EVERY = 30  # 秒；同一頁面 / 投資組合在這段時間內只寫一次
+MAX_TREND_POINTS = 500
+MAX_ROWS = 20  # 快照畫面只列市值最大的幾檔，避免冷啟動就送出大表
+
+_saved = {}
+_saved_lock = threading.Lock()
+
+
+def _path(key):
+    safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in key)
+    return os.path.join(WARM_DIR, f"{safe}.json")
+
+
+def save(key, metrics, holdings=None, trend=None, force=False):
+    """metrics: [(標籤, 顯示值, 變化或 None)] 與頁面上的 st.metric 相同；
+    holdings: 顯示用的持股表 (呼叫端先排好序，只存前 MAX_ROWS 列)；trend: 以時間為索引的 Series。
+    """
+    if not ENABLED:
+        return False
+    now = time.time()
+    with _saved_lock:
+        if not force and now - _saved.get(key, 0) < SAVE_EVERY:
+            return False
+        _saved[key] = now
+    data = {"saved_at": now, "metrics": [list(m) for m in metrics]}
+    if holdings is not None:
+        data["holdings"] = json.loads(holdings.head(MAX_ROWS).to_json(orient="split", index=False))
+    if trend is not None and len(trend):
+        from downsample import downsample_series
+
+        trend = downsample_series(trend.dropna(), MAX_TREND_POINTS)
+        idx = trend.index
+        data["trend"] = {
+            "ms": (idx.tz_convert("UTC") if idx.tz is not None else idx).as_unit("ms").asi8.tolist(),
+            "tz": str(idx.tz) if idx.tz is not None else None,
+            "values": [float(v) for v in trend.to_numpy()],
+        }
+    os.makedirs(WARM_DIR, exist_ok=True)
+    path = _path(key)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+    return True
+
+
+def load(key):
+    """回傳 {"saved_at", "metrics", "holdings" (DataFrame 或 None), "trend" (Series 或 None)}；沒有快照則為 None。"""
+    if not ENABLED:
+        return None
+    try:
+        with open(_path(key), encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    import pandas as pd
+
+    h = data.get("holdings")
+    data["holdings"] = pd.DataFrame(h["data"], columns=h["columns"]) if h else None
+    tr = data.get("trend")
+    if tr:
+        idx = pd.to_datetime(tr["ms"], unit="ms", utc=tr["tz"] is not None)
+        if tr["tz"]:
+            idx = idx.tz_convert(tr["tz"])
+        data["trend"] = pd.Series(tr["values"], index=idx, name="trend")
+    else:
+        data["trend"] = None
+    return data
+
+
+def paint(slot, data, note="最新行情同步中..."):
+    """在 slot (st.empty()) 裡畫出快照；呼叫端拿到最新結果後以 slot.empty() 移除。"""
+    import streamlit as st
+
+    with slot.container():
+        st.caption(f"⏳ 先顯示上次的結果 ({age_text(data['saved_at'])})，{note}")
+        cols = st.columns(len(data["metrics"]) or 1)
+        for col, (label, value, delta) in zip(cols, data["metrics"]):
+            col.metric(label, value, delta)
+        if data["trend"] is not None:
+            st.line_chart(data["trend"], height=250)
+        if data["holdings"] is not None:
+            st.dataframe(data["holdings"], hide_index=True)
+
+
+def age_text(saved_at):
+    minutes = int((time.time() - saved_at) // 60)
+    if minutes < 1:
+        return "剛剛"
+    if minutes < 60:
+        return f"{minutes} 分鐘前"
+    if minutes < 60 * 24:
+        return f"{minutes // 60} 小時前"
+    return f"{minutes // (60 * 24)} 天前"